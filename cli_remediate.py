@@ -0,0 +1,250 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Command-line planning and applying bulk fixes on the database.
+
+    Author: Isogeo
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import configparser
+from datetime import datetime, timedelta
+import logging
+from pathlib import Path
+
+# 3rd party library
+import click
+
+# modules
+from reporting.logs import logging_options, setup_logging
+from reporting.reconcile import RecordIndex, reconcile
+from reporting.remediation import (PURGEABLE, Remediation, plan_backfill, plan_dedupe,
+                                   plan_purge, write_plan)
+
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils")
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+def load_settings(settings: str, platform: str) -> configparser.ConfigParser:
+    """Check and load settings file.
+
+    :param str settings: path to a settings file containing credentials
+    :param str platform: deployed database to read (production or quality assurance)
+    """
+    # check settings file
+    settings_file = Path(settings)
+    if not settings_file.exists():
+        raise IOError("settings file doesn't exist: {}".format(settings))
+    settings_file = Path(settings).resolve()
+    logger.info("Settings file used: {}".format(settings))
+
+    # check platform value
+    if platform not in ["prod", "qa"]:
+        raise ValueError("Platform option must be one of: prod | qa")
+
+    config = configparser.ConfigParser()
+    config.read(settings_file)
+    setup_logging(**logging_options(config))
+    return config
+
+
+def utils(config: configparser.ConfigParser, platform: str,
+          throttle: float = None) -> "IsogeoScanUtils":
+    """Build and connect utils instance from settings.
+
+    :param float throttle: target latency of queries, None to run at full speed
+    """
+    from reporting.report_global import IsogeoScanUtils
+    from reporting.throttle import AdaptiveThrottle
+
+    access = {"username": config.get(platform, "username"),
+              "password": config.get(platform, "password"),
+              "server": config.get(platform, "server"),
+              "port": config.get(platform, "port"),
+              "db_name": config.get(platform, "db_name"),
+              "replicaSet": config.get(platform, "replicaSet"),
+              }
+    logger.info("Settings loaded. Database: {}".format(access.get("db_name")))
+    app = IsogeoScanUtils(access=access,
+                          def_wg=config.get(platform, "wg"),
+                          platform=platform,
+                          wk_v=config.get(platform, "srv_version"),
+                          throttle=AdaptiveThrottle(throttle) if throttle else None)
+    app.connect()
+    return app
+
+
+def scope(ctx, app) -> dict:
+    """Filter on the workgroup, unless the whole database is fixed."""
+    return {} if ctx.obj.get("db") else {"groupId": app.def_wg}
+
+
+def run(ctx, app, changes: list, name: str):
+    """Write the plan of changes, then apply them if asked."""
+    opts = ctx.obj
+    Path(opts.get("folder")).mkdir(exist_ok=True)
+    stamp = datetime.now().strftime("%Y-%m-%dT%H%M%S")
+    plan_out = Path(opts.get("folder")) / "ScanFME_Plan_{}_{}_{}.jsonl".format(
+        name, app.platform, stamp)
+    for (coll, action), count in sorted(write_plan(changes, plan_out).items()):
+        click.echo("{}: {} {}".format(coll, count, action))
+    click.echo(plan_out)
+    if not opts.get("apply"):
+        click.echo("Dry run: use --apply to write the changes.")
+        return
+
+    journal = Path(opts.get("folder")) / "ScanFME_Journal_{}_{}_{}.jsonl".format(
+        name, app.platform, stamp)
+    remediation = Remediation(app.backend, str(journal),
+                              batch_size=opts.get("batch_size"),
+                              ordered=opts.get("ordered"),
+                              throttle=app.throttle)
+    counts = remediation.apply(changes)
+    click.echo("Applied: {}. Undo with: undo {}".format(dict(counts), journal))
+
+
+# #############################################################################
+# ####### Command-line ############
+# #################################
+
+@click.group()
+@click.option("--settings", default="settings.ini",
+              help="Settings file.")
+@click.option("--platform", default="prod",
+              help="Database platform to fix. Available values: 'prod' | 'qa'.")
+@click.option("--db", is_flag=True,
+              help="Fix the whole database instead of the workgroup.")
+@click.option("--folder", default="reports",
+              help="Folder where to write plans and journals.")
+@click.option("--apply", is_flag=True,
+              help="Write the changes. Without it, only the plan is written.")
+@click.option("--batch-size", default=500,
+              help="Operations by bulk write.")
+@click.option("--ordered", is_flag=True,
+              help="Stop a batch at its first error.")
+@click.option("--throttle", default=None, type=float,
+              help="Target latency of queries in seconds: batch rates adapt to "
+                   "the cluster load.")
+@click.pass_context
+def cli_scanfme_remediate(ctx, settings, platform, db, folder, apply, batch_size,
+                          ordered, throttle):
+    """Plan bulk fixes, then apply them in batches, journaled to be undone.
+
+    :param str settings: path to a settings file containing credentials to read database
+    :param str platform: deployed database to fix (production or quality assurance)
+    :param float throttle: target latency of queries
+    """
+    ctx.obj = {"config": load_settings(settings, platform), "platform": platform,
+               "db": db, "folder": folder, "apply": apply,
+               "batch_size": batch_size, "ordered": ordered, "throttle": throttle}
+
+
+@cli_scanfme_remediate.command()
+@click.pass_context
+def dedupe(ctx):
+    """Delete datasets duplicated in a workgroup (same featureType)."""
+    app = utils(ctx.obj.get("config"), ctx.obj.get("platform"),
+                ctx.obj.get("throttle"))
+    run(ctx, app, plan_dedupe(app.backend, scope(ctx, app)), "dedupe")
+
+
+@cli_scanfme_remediate.command()
+@click.argument("coll", type=click.Choice(PURGEABLE))
+@click.option("--days", default=365,
+              help="Delete documents created more than this number of days ago.")
+@click.pass_context
+def purge(ctx, coll, days):
+    """Delete old processed datasets or sessions."""
+    app = utils(ctx.obj.get("config"), ctx.obj.get("platform"),
+                ctx.obj.get("throttle"))
+    before = datetime.utcnow() - timedelta(days=days)
+    run(ctx, app, plan_purge(app.backend, coll, before, scope(ctx, app)),
+        "purge-{}".format(coll))
+
+
+@cli_scanfme_remediate.command()
+@click.argument("coll")
+@click.argument("field")
+@click.argument("value")
+@click.pass_context
+def backfill(ctx, coll, field, value):
+    """Set a default value (string) where a field is missing."""
+    app = utils(ctx.obj.get("config"), ctx.obj.get("platform"),
+                ctx.obj.get("throttle"))
+    run(ctx, app, plan_backfill(app.backend, coll, field, value, scope(ctx, app)),
+        "backfill-{}".format(field))
+
+
+@cli_scanfme_remediate.command("reconcile")
+@click.argument("records", type=click.Path(exists=True))
+@click.option("--id-field", default="_id",
+              help="Field of the Isogeo record UUID.")
+@click.option("--wg-field", default="_creator._id",
+              help="Field of the workgroup UUID, dotted path in JSON.")
+@click.option("--name-field", default="name",
+              help="Field of the technical name, matched with featureType.")
+@click.pass_context
+def reconcile_ids(ctx, records, id_field, wg_field, name_field):
+    """Match datasets without isogeo_id with exported Isogeo records."""
+    opts = ctx.obj
+    index = RecordIndex.from_file(records, id_field=id_field, wg_field=wg_field,
+                                  name_field=name_field)
+    app = utils(opts.get("config"), opts.get("platform"), opts.get("throttle"))
+    Path(opts.get("folder")).mkdir(exist_ok=True)
+    stamp = datetime.now().strftime("%Y-%m-%dT%H%M%S")
+    csv_out = Path(opts.get("folder")) / "ScanFME_Reconcile_{}_{}.csv".format(
+        app.platform, stamp)
+    if opts.get("apply"):
+        journal = Path(opts.get("folder")) / "ScanFME_Journal_reconcile_{}_{}.jsonl"\
+            .format(app.platform, stamp)
+        remediation = Remediation(app.backend, str(journal),
+                                  batch_size=opts.get("batch_size"),
+                                  ordered=opts.get("ordered"),
+                                  throttle=app.throttle)
+    else:
+        remediation = None
+    counts = reconcile(app.backend, index, str(csv_out), scope(ctx, app),
+                       remediation=remediation)
+    for status, count in sorted(counts.items()):
+        click.echo("{}: {}".format(status, count))
+    click.echo(csv_out)
+    if remediation is None:
+        click.echo("Dry run: use --apply to set matched isogeo_id.")
+    else:
+        click.echo("Undo with: undo {}".format(remediation.journal))
+
+
+@cli_scanfme_remediate.command()
+@click.argument("journal", type=click.Path(exists=True))
+@click.pass_context
+def undo(ctx, journal):
+    """Revert the changes recorded in a journal."""
+    app = utils(ctx.obj.get("config"), ctx.obj.get("platform"),
+                ctx.obj.get("throttle"))
+    counts = Remediation(app.backend, journal,
+                         batch_size=ctx.obj.get("batch_size"),
+                         ordered=ctx.obj.get("ordered"),
+                         throttle=app.throttle).undo()
+    click.echo("Reverted: {}".format(dict(counts)))
+
+
+# #############################################################################
+# ##### Stand alone program ########
+# ##################################
+
+if __name__ == '__main__':
+    """Standalone execution."""
+    cli_scanfme_remediate()
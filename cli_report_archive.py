@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Command-line reading the reports archive.
+
+    Author: Isogeo
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from pathlib import Path
+
+# 3rd party library
+import click
+
+# modules
+from reporting.archive import ReportArchive
+from reporting.window import parse_bound, to_datetime
+
+
+# #############################################################################
+# ####### Command-line ############
+# #################################
+
+@click.group()
+@click.option("--archive", default="reports/archive",
+              help="Archive folder.")
+@click.pass_context
+def cli_scanfme_archive(ctx, archive):
+    """List and extract archived reports.
+
+    :param str archive: path to a reports archive
+    """
+    if not Path(archive, "index.db").exists():
+        raise IOError("archive doesn't exist: {}".format(archive))
+    ctx.obj = ReportArchive(archive)
+    ctx.call_on_close(ctx.obj.close)
+
+
+@cli_scanfme_archive.command()
+@click.option("--platform", default=None,
+              help="Database platform: 'prod' | 'qa'.")
+@click.option("--workgroup", default=None,
+              help="Workgroup UUID, or 'DB' for whole database reports.")
+@click.option("--report", default=None,
+              help="Report name, e.g. 'csv' or 'workers'.")
+@click.option("--since", default=None,
+              help="Versions created from this date (2019-06-01) or duration back "
+                   "from now (30d).")
+@click.option("--until", default=None,
+              help="Versions created before this date or duration back from now.")
+@click.pass_obj
+def history(archive, platform, workgroup, report, since, until):
+    """List archived versions, oldest first."""
+    for entry in archive.history(platform, workgroup, report,
+                                 since=to_datetime(parse_bound(since)),
+                                 until=to_datetime(parse_bound(until))):
+        click.echo("{created} | {platform} | {workgroup} | {report} | "
+                   "{digest:.12} | checked {checked}".format(**entry))
+
+
+@cli_scanfme_archive.command()
+@click.argument("platform")
+@click.argument("workgroup")
+@click.argument("report")
+@click.option("--at", default=None,
+              help="Version at this date or duration back from now, latest by "
+                   "default.")
+@click.option("--out", default=None,
+              help="Output file, default to the archived filename.")
+@click.pass_obj
+def get(archive, platform, workgroup, report, at, out):
+    """Extract a report version."""
+    entry = archive.latest(platform, workgroup, report, to_datetime(parse_bound(at)))
+    if entry is None:
+        raise click.ClickException("No archived version.")
+    out = Path(out or entry.get("filename"))
+    out.write_bytes(archive.read(entry.get("digest")))
+    click.echo(out)
+
+
+@cli_scanfme_archive.command()
+@click.option("--rebuild", is_flag=True,
+              help="Build a new shared dictionary from the latest reports.")
+@click.pass_obj
+def stats(archive, rebuild):
+    """Show archive sizes."""
+    if rebuild:
+        click.echo("Dictionary: {}".format(archive.build_dictionary()))
+    counts = archive.stats()
+    click.echo("{reports} versions, {objects} objects: {size} bytes stored in "
+               "{stored}.".format(**counts))
+
+
+# #############################################################################
+# ##### Stand alone program ########
+# ##################################
+
+if __name__ == '__main__':
+    """Standalone execution."""
+    cli_scanfme_archive()
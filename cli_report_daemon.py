@@ -0,0 +1,162 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Command-line running reports as a long-lived daemon.
+
+    Author: Isogeo
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import configparser
+import logging
+from pathlib import Path
+import signal
+
+# 3rd party library
+import click
+
+# modules
+from reporting.logs import logging_options, setup_logging
+
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils")
+
+
+# #############################################################################
+# ####### Command-line ############
+# #################################
+
+@click.command()
+@click.option("--settings", default="settings.ini",
+              help="Settings file.")
+@click.option("--platform", default="prod",
+              help="Database platform to read. Available values: 'prod' | 'qa'.")
+@click.option("--every", default="csv=3600,workers=86400",
+              help="Refresh interval in seconds by report, e.g. 'csv=3600,wk=600'. "
+                   "'summary' rebuilds the summary collection, 'backlog' "
+                   "polls the requests backlog, 'distinct' updates distinct "
+                   "counts.")
+@click.option("--workgroups", default="all",
+              help="Comma separated workgroups UUID, or 'all' registered ones.")
+@click.option("--folder", default="reports",
+              help="Folder where to write the reports.")
+@click.option("--store", default=None,
+              help="Local store (shelve file) keeping latest results.")
+@click.option("--archive", default=None,
+              help="Archive folder keeping every changed report version.")
+@click.option("--jitter", default=0.1,
+              help="Random part of refresh intervals, as a ratio.")
+@click.option("--summary", is_flag=True,
+              help="Read counts from the summary collection.")
+@click.option("--throttle", default=None, type=float,
+              help="Target latency of queries in seconds: concurrency and batch "
+                   "rates adapt to the cluster load.")
+@click.option("--backlog-max-age", default=None, type=float,
+              help="Alert when a request of the backlog waits longer (seconds).")
+@click.option("--backlog-growth", default=3,
+              help="Alert when the backlog p90 age grows this number of times "
+                   "in a row.")
+def cli_scanfme_daemon(settings, platform, every, workgroups, folder, store, archive,
+                       jitter, summary, throttle, backlog_max_age, backlog_growth):
+    """Command-line refreshing reports until interrupted.
+
+    :param str settings: path to a settings file containing credentials to read database
+    :param str platform: deployed database to read (production or quality assurance)
+    :param str every: refresh intervals by report
+    :param str workgroups: workgroups to report on
+    :param str folder: output folder
+    :param str store: path to a local store
+    :param str archive: path to a reports archive
+    :param float jitter: random part of refresh intervals
+    :param bool summary: read counts from the summary collection
+    :param float throttle: target latency of queries
+    :param float backlog_max_age: backlog age raising an alert
+    :param int backlog_growth: backlog age increases raising an alert
+    """
+    # greenlets and cooperative sockets: patch first, before logging starts its
+    # listener thread and before the driver is loaded
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    # check settings file
+    settings_file = Path(settings)
+    if not settings_file.exists():
+        raise IOError("settings file doesn't exist: {}".format(settings))
+    settings_file = Path(settings).resolve()
+    logger.info("Settings file used: {}".format(settings))
+
+    # check platform value
+    if platform not in ["prod", "qa"]:
+        raise ValueError("Platform option must be one of: prod | qa")
+
+    # parse intervals
+    intervals = {}
+    for item in every.split(","):
+        report, interval = item.split("=")
+        intervals[report.strip()] = float(interval)
+
+    # load settings
+    config = configparser.ConfigParser()
+    config.read(settings_file)
+    setup_logging(**logging_options(config))
+    access = {"username": config.get(platform, "username"),
+              "password": config.get(platform, "password"),
+              "server": config.get(platform, "server"),
+              "port": config.get(platform, "port"),
+              "db_name": config.get(platform, "db_name"),
+              "replicaSet": config.get(platform, "replicaSet"),
+              }
+    logger.info("Settings loaded. Database: {}".format(access.get("db_name")))
+
+    from reporting.archive import ReportArchive
+    from reporting.backlog import BacklogMonitor
+    from reporting.daemon import ReportDaemon
+    from reporting.report_global import IsogeoScanUtils
+    from reporting.throttle import AdaptiveThrottle
+
+    # Start
+    app = IsogeoScanUtils(access=access,
+                          def_wg=config.get(platform, "wg"),
+                          platform=platform,
+                          wk_v=config.get(platform, "srv_version"),
+                          summary=summary,
+                          throttle=AdaptiveThrottle(throttle) if throttle else None)
+    app.connect()
+
+    if workgroups == "all":
+        wgs = app.workgroups()
+    else:
+        wgs = [wg.strip() for wg in workgroups.split(",") if wg.strip()]
+
+    Path(folder).mkdir(exist_ok=True)
+    reports_archive = ReportArchive(archive) if archive else None
+    daemon = ReportDaemon(app, wgs, intervals, folder=folder, store=store,
+                          jitter=jitter,
+                          monitor=BacklogMonitor(backlog_max_age, backlog_growth),
+                          archive=reports_archive)
+    signal.signal(signal.SIGTERM, lambda *args: daemon.stop())
+    signal.signal(signal.SIGINT, lambda *args: daemon.stop())
+    try:
+        daemon.run()
+    finally:
+        if reports_archive is not None:
+            reports_archive.close()
+
+
+# #############################################################################
+# ##### Stand alone program ########
+# ##################################
+
+if __name__ == '__main__':
+    """Standalone execution."""
+    cli_scanfme_daemon()
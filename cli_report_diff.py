@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Command-line comparing two runs of a report.
+
+    Author: Isogeo
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# 3rd party library
+import click
+
+# modules
+from reporting.diff import REPORT_KEYS, write_diff
+
+
+# #############################################################################
+# ####### Command-line ############
+# #################################
+
+@click.command()
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+@click.option("--report", default="workers",
+              help="Kind of report compared. Available values: {}."
+                   .format(" | ".join(REPORT_KEYS)))
+@click.option("--key", default=None,
+              help="Comma separated columns identifying a row (overrides --report).")
+@click.option("--out", default="diff.csv",
+              help="Diff file to write.")
+@click.option("--chunk-rows", default=100000,
+              help="Maximum number of rows held in memory.")
+def cli_scanfme_diff(old, new, report, key, out, chunk_rows):
+    """Write differences between two runs of a report.
+
+    :param str old: previous run
+    :param str new: current run
+    :param str report: kind of report compared
+    :param str key: columns identifying a row
+    :param str out: diff file to write
+    :param int chunk_rows: maximum number of rows held in memory
+    """
+    if key:
+        key = tuple(col.strip() for col in key.split(","))
+    elif report in REPORT_KEYS:
+        key = REPORT_KEYS.get(report)
+    else:
+        raise ValueError("Report option must be one of: {}".format(
+            " | ".join(REPORT_KEYS)))
+
+    summary = write_diff(old, new, out, key, chunk_rows=chunk_rows)
+    for change in ("added", "removed", "changed"):
+        click.echo("{}: {}".format(change, summary.get(change, 0)))
+
+
+# #############################################################################
+# ##### Stand alone program ########
+# ##################################
+
+if __name__ == '__main__':
+    """Standalone execution."""
+    cli_scanfme_diff()
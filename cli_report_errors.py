@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Command-line counting error signatures of failed requests.
+
+    Author: Isogeo
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import configparser
+from datetime import date
+from pathlib import Path
+
+# 3rd party library
+import click
+
+# modules
+from reporting.logs import logging_options, setup_logging
+from reporting.report_global import IsogeoScanUtils, logger
+from reporting.window import parse_bound
+
+
+# #############################################################################
+# ####### Command-line ############
+# #################################
+
+@click.command()
+@click.option("--settings", default="settings.ini",
+              help="Settings file.")
+@click.option("--platform", default="prod",
+              help="Database platform to read. Available values: 'prod' | 'qa'.")
+@click.option("--db/--workgroup", default=True,
+              help="Whole database (default) or the workgroup set in settings.")
+@click.option("--folder", default="reports",
+              help="Folder where to write the report.")
+@click.option("--name", default=None,
+              help="Filename suffix. Defaults to the current date.")
+@click.option("--processes", default=None, type=int,
+              help="Processes normalizing errors. Defaults to the number of cores.")
+@click.option("--since", default=None,
+              help="Only requests created from this date (2019-06-01, "
+                   "2019-06-01T12:00:00) or duration back from now (24h, 30d).")
+@click.option("--until", default=None,
+              help="Only requests created before this date or duration back "
+                   "from now.")
+def cli_scanfme_errors(settings, platform, db, folder, name, processes, since,
+                       until):
+    """Count error signatures of broken and killed requests.
+
+    :param str settings: path to a settings file containing credentials to read database
+    :param str platform: deployed database to read (production or quality assurance)
+    :param bool db: whole database or default workgroup
+    :param str folder: folder where to write the report
+    :param str name: filename suffix
+    :param int processes: pool size
+    :param str since: created from, date or duration back from now
+    :param str until: created before, date or duration back from now
+    """
+    # check settings file
+    settings_file = Path(settings)
+    if not settings_file.exists():
+        raise IOError("settings file doesn't exist: {}".format(settings))
+    settings_file = Path(settings).resolve()
+    logger.info("Settings file used: {}".format(settings))
+
+    # check platform value
+    if platform not in ["prod", "qa"]:
+        raise ValueError("Platform option must be one of: prod | qa")
+
+    # load settings
+    config = configparser.ConfigParser()
+    config.read(settings_file)
+    setup_logging(**logging_options(config))
+    access = {"username": config.get(platform, "username"),
+              "password": config.get(platform, "password"),
+              "server": config.get(platform, "server"),
+              "port": config.get(platform, "port"),
+              "db_name": config.get(platform, "db_name"),
+              "replicaSet": config.get(platform, "replicaSet"),
+              }
+    logger.info("Settings loaded. Database: {}".format(access.get("db_name")))
+
+    # Start
+    app = IsogeoScanUtils(access=access,
+                          def_wg=config.get(platform, "wg"),
+                          platform=platform,
+                          wk_v=config.get(platform, "srv_version"))
+    app.connect()
+
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    rows = app.errors_report("{}.csv".format(name or date.today().isoformat()),
+                             wg=0 if db else 1,
+                             folder=folder,
+                             processes=processes,
+                             since=parse_bound(since),
+                             until=parse_bound(until))
+    click.echo("{} signatures written into {}".format(rows, folder))
+
+
+# #############################################################################
+# ##### Stand alone program ########
+# ##################################
+
+if __name__ == '__main__':
+    """Standalone execution."""
+    cli_scanfme_errors()
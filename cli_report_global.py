@@ -13,30 +13,25 @@
 
 # Standard library
 import configparser
+from datetime import date
 import logging
+from os import path
 from pathlib import Path
 
 # 3rd party library
 import click
 
 # modules
-from reporting import *
+from reporting.logs import logging_options, setup_logging
+from reporting.planner import REPORTS, ReportPlan
+from reporting.window import parse_bound
 
 
 # #############################################################################
 # ########## Globals ###############
 # ##################################
 
-# required subfolders
-dir_logs = Path("_logs/").mkdir(exist_ok=True)
-dir_reports = Path("_reports/").mkdir(exist_ok=True)
-
-# CSV settings (see: https://pymotw.com/3/csv/)
-csv.register_dialect("pipe",
-                     delimiter="|",
-                     escapechar="\\",
-                     skipinitialspace=1
-                     )
+logger = logging.getLogger("isogeo_scanfme_utils")
 
 
 # #############################################################################
@@ -48,14 +43,65 @@ csv.register_dialect("pipe",
               help="Settings file.")
 @click.option("--platform", default="prod",
               help="Database platform to read. Available values: 'prod' | 'qa'.")
-@click.option("--platform", default="prod",
-              help="Database platform to read. Available values: 'prod' | 'qa'.")
-def cli_scanfme_reporting(settings, platform):
+@click.option("--reports", default="csv,workers",
+              help="Comma separated reports to run. Available values: {}."
+                   .format(" | ".join(REPORTS)))
+@click.option("--db", is_flag=True,
+              help="Report on the whole database instead of the workgroup.")
+@click.option("--folder", default="reports",
+              help="Folder where to write the reports.")
+@click.option("--name", default=date.today().isoformat(),
+              help="Suffix of the output filenames.")
+@click.option("--concurrency", default=4,
+              help="Maximum number of diagnosis run at once.")
+@click.option("--timeout", default=None, type=float,
+              help="Overall time budget in seconds.")
+@click.option("--offline", default=None,
+              help="Snapshot folder to read instead of the live database.")
+@click.option("--summary", is_flag=True,
+              help="Read counts from the summary collection, see the daemon.")
+@click.option("--throttle", default=None, type=float,
+              help="Target latency of queries in seconds: concurrency and batch "
+                   "rates adapt to the cluster load.")
+@click.option("--since", default=None,
+              help="Only documents created from this date (2019-06-01, "
+                   "2019-06-01T12:00:00) or duration back from now (24h, 30d).")
+@click.option("--until", default=None,
+              help="Only documents created before this date or duration back "
+                   "from now.")
+@click.option("--archive", default=None,
+              help="Archive folder: reports are moved there, only if they changed.")
+@click.option("--profile", is_flag=True,
+              help="Profile memory of each method and export stage, written as "
+                   "JSON next to the reports.")
+def cli_scanfme_reporting(settings, platform, reports, db, folder, name,
+                          concurrency, timeout, offline, summary, throttle,
+                          since, until, archive, profile):
     """Command-line checking settings and executing required operations.
 
     :param str settings: path to a settings file containing credentials to read database
     :param str platform: deployed database to read (production or quality assurance)
+    :param str reports: comma separated list of reports to run
+    :param bool db: report on the whole database
+    :param str folder: output folder
+    :param str name: suffix of the output filenames
+    :param int concurrency: maximum number of diagnosis run at once
+    :param float timeout: overall time budget in seconds
+    :param str offline: snapshot folder to read
+    :param bool summary: read counts from the summary collection
+    :param float throttle: target latency of queries
+    :param str since: created from, date or duration back from now
+    :param str until: created before, date or duration back from now
+    :param str archive: path to a reports archive
+    :param bool profile: profile memory usage
     """
+    # cooperative sockets for concurrent queries: patch first, before logging
+    # starts its listener thread and before the driver is loaded
+    if not offline:
+        from gevent import monkey
+
+        monkey.patch_all()
+
     # check settings file
     settings_file = Path(settings)
     if not settings_file.exists():
@@ -67,9 +113,16 @@ def cli_scanfme_reporting(settings, platform):
     if platform not in ["prod", "qa"]:
         raise ValueError("Platform option must be one of: prod | qa")
 
+    # plan reports: shared diagnosis are run once
+    plan = ReportPlan([r.strip() for r in reports.split(",") if r.strip()],
+                      wg=0 if db else 1,
+                      since=parse_bound(since),
+                      until=parse_bound(until))
+
     # load settings
     config = configparser.ConfigParser()
     config.read(settings_file)
+    setup_logging(**logging_options(config))
     access = {"username": config.get(platform, "username"),
               "password": config.get(platform, "password"),
               "server": config.get(platform, "server"),
@@ -80,34 +133,63 @@ def cli_scanfme_reporting(settings, platform):
     logger.info("Settings loaded. Database: {}".format(access.get("db_name")))
 
     # Start
-    app = IsogeoScanUtils(access=access,
-                          def_wg=config.get(platform, "wg"),
-                          platform=platform,
-                          wk_v=config.get(platform, "srv_version"))
-    cli = app.connect()
-    print(cli)
-
-    # # collections overview
-    # print(app.colls_stats())  # per workgroup
-    # print(app.colls_stats(0))  # whole DB
-
-    # # datasets overview
-    # print(app.ds_diagnosis())  # per workgroup
-    # print(app.ds_diagnosis(0))  # whole DB
-
-    # # requests overview
-    # print(app.rq_diagnosis())  # per workgroup
-    # print(app.rq_diagnosis(0))  # whole DB
-
-    # # srv info
-    # print(app.wk_diagnosis())  # per workgroup
-    # wks = app.wk_diagnosis(0)  # whole DB
-    # print(wks.get("srvs_outdated")[1].keys())
-
-    # app.csv_report("test.csv")
-    # app.csv_report("test.csv", wg=0)
-
-    # app.workers_report("test.csv")
+    if offline:
+        # NumPy is only loaded to work offline
+        from reporting.snapshot import OfflineScanUtils
+
+        app = OfflineScanUtils(offline,
+                               def_wg=config.get(platform, "wg"),
+                               platform=platform,
+                               wk_v=config.get(platform, "srv_version"))
+    else:
+        from reporting.report_global import IsogeoScanUtils
+        from reporting.throttle import AdaptiveThrottle
+
+        app = IsogeoScanUtils(access=access,
+                              def_wg=config.get(platform, "wg"),
+                              platform=platform,
+                              wk_v=config.get(platform, "srv_version"),
+                              summary=summary,
+                              throttle=AdaptiveThrottle(throttle, max_limit=concurrency)
+                              if throttle else None)
+    app.connect()
+
+    # run the union of the queries, then write every output
+    Path(folder).mkdir(exist_ok=True)
+    if profile:
+        from reporting.profiling import MemoryProfiler
+
+        app.profiler = MemoryProfiler()
+        app.profiler.start()
+    if timeout:
+        with app.time_budget(timeout, queries=plan.queries_count(app)) as budget:
+            results = plan.execute(app, concurrency=concurrency)
+            outputs = plan.write(app, results, csv_name=name, folder=folder)
+        if budget.partial:
+            click.echo("Timed out metrics: {}".format(", ".join(budget.timed_out)))
+    else:
+        results = plan.execute(app, concurrency=concurrency)
+        outputs = plan.write(app, results, csv_name=name, folder=folder)
+
+    if profile:
+        app.profiler.stop()
+        profile_out = path.join(folder, "ScanFME_Profile_{}_{}.json".format(platform,
+                                                                          name))
+        app.profiler.write(profile_out)
+        click.echo(profile_out)
+
+    if archive:
+        from reporting.archive import ReportArchive
+
+        with ReportArchive(archive) as store:
+            changed = plan.archive(app, outputs, store)
+        for output in outputs:
+            click.echo("{}: {}".format("archived" if output in changed else "unchanged",
+                                       path.basename(output)))
+            Path(output).unlink()
+    else:
+        for output in outputs:
+            click.echo(output)
 
 
 # #############################################################################
@@ -116,4 +198,4 @@ def cli_scanfme_reporting(settings, platform):
 
 if __name__ == '__main__':
     """Standalone execution."""
-    pass
+    cli_scanfme_reporting()
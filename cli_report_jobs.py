@@ -0,0 +1,170 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Command-line distributing per-workgroup reports over AMQP workers.
+
+    Author: Isogeo
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import configparser
+import logging
+from pathlib import Path
+
+# 3rd party library
+import click
+
+# modules
+from reporting.jobs import JobWorker, connect_broker, publish_jobs
+from reporting.logs import logging_options, register_secret, setup_logging
+
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils")
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+def load_settings(settings: str, platform: str) -> configparser.ConfigParser:
+    """Check and load settings file.
+
+    :param str settings: path to a settings file containing credentials
+    :param str platform: deployed database to read (production or quality assurance)
+    """
+    # check settings file
+    settings_file = Path(settings)
+    if not settings_file.exists():
+        raise IOError("settings file doesn't exist: {}".format(settings))
+    settings_file = Path(settings).resolve()
+    logger.info("Settings file used: {}".format(settings))
+
+    # check platform value
+    if platform not in ["prod", "qa"]:
+        raise ValueError("Platform option must be one of: prod | qa")
+
+    config = configparser.ConfigParser()
+    config.read(settings_file)
+    setup_logging(**logging_options(config))
+    return config
+
+
+def utils(config: configparser.ConfigParser, platform: str) -> "IsogeoScanUtils":
+    """Build utils instance from settings."""
+    from reporting.report_global import IsogeoScanUtils
+
+    access = {"username": config.get(platform, "username"),
+              "password": config.get(platform, "password"),
+              "server": config.get(platform, "server"),
+              "port": config.get(platform, "port"),
+              "db_name": config.get(platform, "db_name"),
+              "replicaSet": config.get(platform, "replicaSet"),
+              }
+    logger.info("Settings loaded. Database: {}".format(access.get("db_name")))
+    return IsogeoScanUtils(access=access,
+                           def_wg=config.get(platform, "wg"),
+                           platform=platform,
+                           wk_v=config.get(platform, "srv_version"))
+
+
+def broker(config: configparser.ConfigParser):
+    """Connect to the broker declared in settings."""
+    register_secret(config.get("amqp", "password"))
+    return connect_broker(host=config.get("amqp", "host"),
+                          userid=config.get("amqp", "userid"),
+                          password=config.get("amqp", "password"),
+                          virtual_host=config.get("amqp", "virtual_host"))
+
+
+# #############################################################################
+# ####### Command-line ############
+# #################################
+
+@click.group()
+@click.option("--settings", default="settings.ini",
+              help="Settings file.")
+@click.option("--platform", default="prod",
+              help="Database platform to read. Available values: 'prod' | 'qa'.")
+@click.pass_context
+def cli_scanfme_jobs(ctx, settings, platform):
+    """Publish or consume per-workgroup report jobs.
+
+    :param str settings: path to a settings file containing credentials to read database
+    :param str platform: deployed database to read (production or quality assurance)
+    """
+    # cooperative sockets for concurrent queries: patch first, before logging
+    # starts its listener thread and before the driver is loaded
+    from gevent import monkey
+
+    monkey.patch_all()
+    ctx.obj = {"config": load_settings(settings, platform), "platform": platform}
+
+
+@cli_scanfme_jobs.command()
+@click.option("--reports", default="csv",
+              help="Comma separated reports to run for each workgroup.")
+@click.option("--workgroups", default="all",
+              help="Comma separated workgroups UUID, or 'all' registered ones.")
+@click.option("--folder", default="reports",
+              help="Folder where workers write the reports.")
+@click.option("--name", default="job",
+              help="Suffix of the output filenames.")
+@click.option("--timeout", default=None, type=float,
+              help="Time budget of each job in seconds.")
+@click.pass_context
+def publish(ctx, reports, workgroups, folder, name, timeout):
+    """Publish one job per workgroup."""
+    config, platform = ctx.obj.get("config"), ctx.obj.get("platform")
+    if workgroups == "all":
+        app = utils(config, platform)
+        app.connect()
+        wgs = app.workgroups()
+    else:
+        wgs = [wg.strip() for wg in workgroups.split(",") if wg.strip()]
+
+    conn = broker(config)
+    with conn.channel() as channel:
+        count = publish_jobs(channel, wgs, reports.split(","), folder=folder,
+                             name=name, timeout=timeout)
+    conn.close()
+    click.echo("{} jobs published.".format(count))
+
+
+@cli_scanfme_jobs.command()
+@click.option("--prefetch", default=1,
+              help="Maximum number of unacknowledged jobs.")
+@click.option("--max-jobs", default=None, type=int,
+              help="Stop after this number of jobs.")
+@click.option("--idle-timeout", default=None, type=float,
+              help="Stop when no job is received during this number of seconds.")
+@click.pass_context
+def work(ctx, prefetch, max_jobs, idle_timeout):
+    """Consume jobs and publish their results."""
+    config, platform = ctx.obj.get("config"), ctx.obj.get("platform")
+    app = utils(config, platform)
+    app.connect()
+
+    conn = broker(config)
+    channel = conn.channel()
+    worker = JobWorker(conn, channel, app, prefetch=prefetch)
+    done = worker.run(max_jobs=max_jobs, idle_timeout=idle_timeout)
+    conn.close()
+    click.echo("{} jobs done, {} failed.".format(done, worker.failed))
+
+
+# #############################################################################
+# ##### Stand alone program ########
+# ##################################
+
+if __name__ == '__main__':
+    """Standalone execution."""
+    cli_scanfme_jobs()
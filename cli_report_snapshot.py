@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Command-line exporting a snapshot of the database for offline analysis.
+
+    Author: Isogeo
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import configparser
+from pathlib import Path
+
+# 3rd party library
+import click
+
+# modules
+from reporting.logs import logging_options, setup_logging
+from reporting.report_global import IsogeoScanUtils, logger
+from reporting.snapshot import export_snapshot
+
+
+# #############################################################################
+# ####### Command-line ############
+# #################################
+
+@click.command()
+@click.option("--settings", default="settings.ini",
+              help="Settings file.")
+@click.option("--platform", default="prod",
+              help="Database platform to read. Available values: 'prod' | 'qa'.")
+@click.option("--folder", default="snapshot",
+              help="Snapshot folder to write.")
+def cli_scanfme_snapshot(settings, platform, folder):
+    """Export key fields of every collection into a local snapshot.
+
+    :param str settings: path to a settings file containing credentials to read database
+    :param str platform: deployed database to read (production or quality assurance)
+    :param str folder: snapshot folder to write
+    """
+    # check settings file
+    settings_file = Path(settings)
+    if not settings_file.exists():
+        raise IOError("settings file doesn't exist: {}".format(settings))
+    settings_file = Path(settings).resolve()
+    logger.info("Settings file used: {}".format(settings))
+
+    # check platform value
+    if platform not in ["prod", "qa"]:
+        raise ValueError("Platform option must be one of: prod | qa")
+
+    # load settings
+    config = configparser.ConfigParser()
+    config.read(settings_file)
+    setup_logging(**logging_options(config))
+    access = {"username": config.get(platform, "username"),
+              "password": config.get(platform, "password"),
+              "server": config.get(platform, "server"),
+              "port": config.get(platform, "port"),
+              "db_name": config.get(platform, "db_name"),
+              "replicaSet": config.get(platform, "replicaSet"),
+              }
+    logger.info("Settings loaded. Database: {}".format(access.get("db_name")))
+
+    # Start
+    app = IsogeoScanUtils(access=access,
+                          def_wg=config.get(platform, "wg"),
+                          platform=platform,
+                          wk_v=config.get(platform, "srv_version"))
+    app.connect()
+
+    counts = export_snapshot(app, folder)
+    for coll, count in counts.items():
+        click.echo("{}: {} documents".format(coll, count))
+
+
+# #############################################################################
+# ##### Stand alone program ########
+# ##################################
+
+if __name__ == '__main__':
+    """Standalone execution."""
+    cli_scanfme_snapshot()
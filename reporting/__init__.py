@@ -0,0 +1,15 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Scan FME reporting utilities.
+
+    Nothing is imported here, so that importing a module only loads what it
+     needs (e.g. reporting.diff doesn't load pymongo). Import from modules:
+
+        from reporting.report_global import IsogeoScanUtils
+
+    No side effect happens at import time: entry points set logging up
+     (reporting.logs.setup_logging) and apply gevent monkey patching
+     themselves when they run concurrent queries.
+"""
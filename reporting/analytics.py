@@ -0,0 +1,275 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Fleet statistics: per-workgroup diagnosis outputs are loaded into a
+     workgroup x metric matrix, then distributions, ratios, z-scores and
+     top-N are computed column-wise with NumPy to flag abnormal workgroups.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+import logging
+
+# 3rd party library
+import numpy as np
+
+# modules
+from .formats import register_dialects
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.analytics")
+
+# metrics loaded by workgroup: (name, diagnosis, key)
+METRICS = (
+    ("datasets", "colls", "datasets"),
+    ("procdatasets", "colls", "procdatasets"),
+    ("requests", "colls", "requests"),
+    ("subscriptions", "colls", "subscriptions"),
+    ("no_isogeo_id", "ds", "no_isogeo_id"),
+    ("rq_finish", "rq", "rq_finish"),
+    ("rq_broken", "rq", "rq_broken"),
+    ("rq_killed", "rq", "rq_killed"),
+)
+
+# indicators watched for outliers: name -> (numerator, denominator) metrics.
+# A None denominator means the raw numerator is watched.
+INDICATORS = {
+    "rq_failure_ratio": (
+        ("rq_broken", "rq_killed"),
+        ("rq_finish", "rq_broken", "rq_killed"),
+    ),
+    "pd_ds_ratio": (("procdatasets",), ("datasets",)),
+    "no_isogeo_id": (("no_isogeo_id",), None),
+}
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def workgroup_metrics(app) -> dict:
+    """
+        Flatten the diagnosis of the default workgroup into metrics. Metrics
+         which timed out are None.
+
+        :param IsogeoScanUtils app: connected utils instance
+    """
+    # only the metrics analysed are computed: last requests aren't read
+    only = {diag: {key for _, d, key in METRICS if d == diag} for _, diag, _ in METRICS}
+    diagnosis = {
+        "colls": app.colls_stats(only=only.get("colls")),
+        "ds": app.ds_diagnosis(only=only.get("ds")),
+        "rq": app.rq_diagnosis(only=only.get("rq")),
+    }
+    return {name: diagnosis.get(diag).get(key) for name, diag, key in METRICS}
+
+
+def collect(app, workgroups: list = None) -> dict:
+    """
+        Get metrics of every workgroup: {wg_id: {metric: value}}.
+
+        :param IsogeoScanUtils app: connected utils instance
+        :param list workgroups: workgroups UUID, defaults to all of them
+    """
+    workgroups = app.workgroups() if workgroups is None else workgroups
+    return {wg: workgroup_metrics(app.workgroup(wg)) for wg in workgroups}
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class FleetStats(object):
+    """Workgroup x metric matrix, missing values stored as NaN."""
+
+    def __init__(self, workgroups: list, metrics: tuple, matrix: np.ndarray):
+        """
+            :param list workgroups: workgroups UUID, one by row
+            :param tuple metrics: metrics names, one by column
+            :param np.ndarray matrix: float values
+        """
+        if matrix.shape != (len(workgroups), len(metrics)):
+            raise ValueError("Matrix shape doesn't match workgroups and metrics.")
+        else:
+            pass
+        self.workgroups = np.asarray(workgroups, dtype=object)
+        self.metrics = tuple(metrics)
+        self.matrix = matrix
+        self._index = {metric: i for i, metric in enumerate(self.metrics)}
+
+    @classmethod
+    def from_rows(cls, rows: dict, metrics: tuple = None) -> "FleetStats":
+        """
+            Load metrics by workgroup, as returned by collect().
+
+            :param dict rows: {wg_id: {metric: value}}
+            :param tuple metrics: metrics to load, defaults to METRICS names
+        """
+        metrics = metrics or tuple(name for name, diag, key in METRICS)
+        matrix = np.array(
+            [
+                [np.nan if row.get(m) is None else row.get(m) for m in metrics]
+                for row in rows.values()
+            ],
+            dtype=float,
+        ).reshape(len(rows), len(metrics))
+        return cls(list(rows), metrics, matrix)
+
+    def column(self, metric: str) -> np.ndarray:
+        """Values of a metric for every workgroup."""
+        return self.matrix[:, self._index[metric]]
+
+    def total(self, metrics: tuple) -> np.ndarray:
+        """Sum of several metrics, NaN if one of them is missing."""
+        return self.matrix[:, [self._index[m] for m in metrics]].sum(axis=1)
+
+    def ratio(self, numerator: tuple, denominator: tuple) -> np.ndarray:
+        """
+            Ratio of metrics sums by workgroup, NaN where the denominator is
+             missing or zero.
+
+            :param tuple numerator: metrics summed as numerator
+            :param tuple denominator: metrics summed as denominator
+        """
+        num, den = self.total(numerator), self.total(denominator)
+        ratio = np.full(len(self.workgroups), np.nan)
+        np.divide(num, den, out=ratio, where=den > 0)
+        return ratio
+
+    def indicator(self, name: str) -> np.ndarray:
+        """Values of an indicator (see INDICATORS) for every workgroup."""
+        numerator, denominator = INDICATORS.get(name)
+        if denominator is None:
+            return self.total(numerator)
+        else:
+            return self.ratio(numerator, denominator)
+
+    @staticmethod
+    def describe(values: np.ndarray) -> dict:
+        """Distribution of values, NaN ignored."""
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return {"count": 0}
+        else:
+            pass
+        p50, p90, p99 = np.percentile(values, (50, 90, 99))
+        return {
+            "count": int(values.size),
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+            "min": float(values.min()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(values.max()),
+        }
+
+    @staticmethod
+    def zscores(values: np.ndarray, robust: bool = True) -> np.ndarray:
+        """
+            Z-scores of values, NaN ignored. The robust variant (modified
+             z-score) uses median and median absolute deviation, which are
+             not dragged by the outliers themselves.
+
+            :param np.ndarray values: values to score
+            :param bool robust: use median and MAD instead of mean and std
+        """
+        scores = np.full(values.shape, np.nan)
+        known = ~np.isnan(values)
+        if not known.any():
+            return scores
+        else:
+            pass
+        if robust:
+            center = np.median(values[known])
+            deviations = np.abs(values[known] - center)
+            spread = np.median(deviations) / 0.6745
+            if not spread:
+                # more than half values are equal: mean absolute deviation
+                spread = deviations.mean() * 1.2533
+            else:
+                pass
+        else:
+            center = values[known].mean()
+            spread = values[known].std()
+        if spread:
+            scores[known] = (values[known] - center) / spread
+        else:
+            scores[known] = 0
+        return scores
+
+    def top(self, values: np.ndarray, n: int = 10) -> list:
+        """
+            Workgroups with the highest values, as (wg_id, value) sorted by
+             decreasing value. NaN are ignored.
+
+            :param np.ndarray values: values by workgroup
+            :param int n: number of workgroups to return
+        """
+        known = np.flatnonzero(~np.isnan(values))
+        n = min(n, known.size)
+        if not n:
+            return []
+        else:
+            pass
+        best = known[np.argpartition(-values[known], n - 1)[:n]]
+        best = best[np.argsort(-values[best], kind="stable")]
+        return [(self.workgroups[i], float(values[i])) for i in best]
+
+    def outliers(
+        self, threshold: float = 3.5, indicators: tuple = None, robust: bool = True
+    ) -> list:
+        """
+            Workgroups with an indicator far above the fleet, as dicts sorted
+             by decreasing z-score.
+
+            :param float threshold: minimal z-score flagged
+            :param tuple indicators: indicators to watch, defaults to all
+            :param bool robust: use modified z-scores
+        """
+        flagged = []
+        for name in indicators or tuple(INDICATORS):
+            values = self.indicator(name)
+            scores = self.zscores(values, robust=robust)
+            for i in np.flatnonzero(scores >= threshold):
+                flagged.append(
+                    {
+                        "wg_id": self.workgroups[i],
+                        "indicator": name,
+                        "value": float(values[i]),
+                        "zscore": float(scores[i]),
+                    }
+                )
+        flagged.sort(key=lambda row: row.get("zscore"), reverse=True)
+        logger.info("{} outliers flagged.".format(len(flagged)))
+        return flagged
+
+    def write_outliers(self, csv_out: str, threshold: float = 3.5) -> int:
+        """
+            Write outliers into a CSV file. Returns the number of rows.
+
+            :param str csv_out: path to the CSV file
+            :param float threshold: minimal z-score flagged
+        """
+        register_dialects()
+        rows = self.outliers(threshold)
+        with open(csv_out, "w", newline="") as csvfile:
+            fieldnames = ("wg_id", "wg_url", "indicator", "value", "zscore")
+            writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=fieldnames)
+            writer.writeheader()
+            for row in rows:
+                row["wg_url"] = "https://daemons.isogeo.com/g/{}".format(
+                    row.get("wg_id")
+                )
+                writer.writerow(row)
+        return len(rows)
@@ -0,0 +1,367 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Reports archive: report files are stored by the SHA-256 of their content,
+     compressed with zlib and a dictionary shared by the archive, and indexed
+     by platform, workgroup, report and date in a SQLite database. A report
+     identical to its previous version is not stored again: only the check
+     date of the previous version is updated.
+
+    Objects never change once written, so that syncing an archive only copies
+     new files.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from datetime import datetime
+import hashlib
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import zlib
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.archive")
+
+# zlib window: longer dictionaries are not used
+ZDICT_SIZE = 32768
+
+# reports sampled to build the shared dictionary
+ZDICT_SAMPLES = 8
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS reports ("
+    " platform TEXT NOT NULL, workgroup TEXT NOT NULL, report TEXT NOT NULL,"
+    " created TEXT NOT NULL, checked TEXT NOT NULL, digest TEXT NOT NULL,"
+    " filename TEXT)",
+    "CREATE INDEX IF NOT EXISTS reports_lookup"
+    " ON reports (platform, workgroup, report, created)",
+    "CREATE TABLE IF NOT EXISTS objects ("
+    " digest TEXT PRIMARY KEY, size INTEGER, stored INTEGER, zdict TEXT)",
+    "CREATE TABLE IF NOT EXISTS dictionaries ("
+    " digest TEXT PRIMARY KEY, created TEXT NOT NULL, data BLOB NOT NULL)",
+)
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def content_digest(data: bytes) -> str:
+    """
+        Address of a content in the archive.
+
+        :param bytes data: report content
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def compress(data: bytes, zdict: bytes = None) -> bytes:
+    """
+        Compress data, with a preset dictionary if any.
+
+        :param bytes data: data to compress
+        :param bytes zdict: shared dictionary
+    """
+    if zdict:
+        compressor = zlib.compressobj(9, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(9)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, zdict: bytes = None) -> bytes:
+    """
+        Decompress data compressed with the same dictionary.
+
+        :param bytes data: compressed data
+        :param bytes zdict: shared dictionary
+    """
+    decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class ReportArchive(object):
+    """Content-addressed and compressed reports, indexed in SQLite."""
+
+    def __init__(self, folder: str, samples: int = ZDICT_SAMPLES):
+        """
+            Open or create an archive.
+
+            :param str folder: archive folder
+            :param int samples: objects to store before building the shared
+                                dictionary from them. 0 disables it.
+        """
+        self.folder = Path(folder)
+        (self.folder / "objects").mkdir(parents=True, exist_ok=True)
+        self.samples = samples
+        self.db = sqlite3.connect(str(self.folder / "index.db"))
+        self.db.row_factory = sqlite3.Row
+        with self.db:
+            for statement in SCHEMA:
+                self.db.execute(statement)
+        self._zdicts = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the index."""
+        self.db.close()
+
+    def _path(self, digest: str) -> Path:
+        """File of an object, in a subfolder by first hex digits."""
+        return self.folder / "objects" / digest[:2] / digest[2:]
+
+    def _zdict(self, digest: str) -> bytes:
+        """Shared dictionary by digest, None for no dictionary."""
+        if digest is None:
+            return None
+        elif digest not in self._zdicts:
+            row = self.db.execute(
+                "SELECT data FROM dictionaries WHERE digest = ?", (digest,)
+            ).fetchone()
+            self._zdicts[digest] = bytes(row["data"])
+        else:
+            pass
+        return self._zdicts[digest]
+
+    @property
+    def zdict(self) -> str:
+        """Digest of the current shared dictionary, None before it is built."""
+        row = self.db.execute(
+            "SELECT digest FROM dictionaries ORDER BY created DESC, rowid DESC"
+        ).fetchone()
+        return row["digest"] if row else None
+
+    def build_dictionary(self, samples: int = None, size: int = ZDICT_SIZE) -> str:
+        """
+            Build a new shared dictionary from the latest distinct reports.
+             Objects already stored keep their dictionary. Returns its digest.
+
+            :param int samples: number of reports sampled
+            :param int size: dictionary size in bytes
+        """
+        rows = self.db.execute(
+            "SELECT digest FROM reports GROUP BY digest"
+            " ORDER BY MAX(created) DESC LIMIT ?",
+            (samples or self.samples or ZDICT_SAMPLES,),
+        ).fetchall()
+        if not rows:
+            return None
+        else:
+            pass
+        part = size // len(rows)
+        # zlib favours the end of the dictionary: newest reports go last
+        data = b"".join(self.read(row["digest"])[:part] for row in reversed(rows))
+        digest = content_digest(data)
+        with self.db:
+            self.db.execute(
+                "INSERT OR IGNORE INTO dictionaries VALUES (?, ?, ?)",
+                (digest, datetime.utcnow().isoformat(), data),
+            )
+        logger.info(
+            "Shared dictionary built from {} reports: {} bytes.".format(
+                len(rows), len(data)
+            )
+        )
+        return digest
+
+    def _store(self, data: bytes, digest: str):
+        """Write an object, unless the same content is already stored."""
+        if self.db.execute(
+            "SELECT 1 FROM objects WHERE digest = ?", (digest,)
+        ).fetchone():
+            return
+        else:
+            pass
+        zdict = self.zdict
+        if zdict is None and self.samples:
+            count = self.db.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+            zdict = self.build_dictionary() if count >= self.samples else None
+        else:
+            pass
+        packed = compress(data, self._zdict(zdict))
+        out = self._path(digest)
+        out.parent.mkdir(exist_ok=True)
+        # written aside then renamed: objects are complete or missing
+        tmp = out.with_name(out.name + ".tmp")
+        with tmp.open("wb") as obj:
+            obj.write(packed)
+        os.replace(str(tmp), str(out))
+        self.db.execute(
+            "INSERT INTO objects VALUES (?, ?, ?, ?)",
+            (digest, len(data), len(packed), zdict),
+        )
+
+    def add(
+        self,
+        filepath: str,
+        platform: str,
+        workgroup: str,
+        report: str,
+        created: datetime = None,
+    ) -> bool:
+        """
+            Archive a report file. Returns False if it is unchanged since its
+             previous version.
+
+            :param str filepath: report file
+            :param str platform: database platform, qa or prod
+            :param str workgroup: workgroup UUID, or 'DB' for whole database
+            :param str report: report name, e.g. csv or workers
+            :param datetime created: report date, defaults to now (UTC)
+        """
+        data = Path(filepath).read_bytes()
+        digest = content_digest(data)
+        created = (created or datetime.utcnow()).isoformat()
+        previous = self.latest(platform, workgroup, report)
+        with self.db:
+            if previous is not None and previous.get("digest") == digest:
+                self.db.execute(
+                    "UPDATE reports SET checked = ? WHERE rowid = ?",
+                    (max(created, previous.get("checked")), previous.get("rowid")),
+                )
+                logger.debug("{} unchanged: {}".format(report, digest))
+                return False
+            else:
+                pass
+            self._store(data, digest)
+            self.db.execute(
+                "INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    platform,
+                    workgroup,
+                    report,
+                    created,
+                    created,
+                    digest,
+                    Path(filepath).name,
+                ),
+            )
+        logger.info("{} archived: {}".format(report, digest))
+        return True
+
+    def latest(self, platform: str, workgroup: str, report: str, at=None) -> dict:
+        """
+            Index entry of a report at a date, None if there is none.
+
+            :param str platform: database platform, qa or prod
+            :param str workgroup: workgroup UUID, or 'DB' for whole database
+            :param str report: report name
+            :param datetime at: date of the version, defaults to the latest
+        """
+        row = self.db.execute(
+            "SELECT rowid, * FROM reports"
+            " WHERE platform = ? AND workgroup = ? AND report = ? AND created <= ?"
+            " ORDER BY created DESC, rowid DESC",
+            (platform, workgroup, report, (at or datetime.max).isoformat()),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def read(self, digest: str) -> bytes:
+        """
+            Content of an archived report.
+
+            :param str digest: content SHA-256
+        """
+        row = self.db.execute(
+            "SELECT zdict FROM objects WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            raise KeyError("Unknown report content: {}".format(digest))
+        else:
+            pass
+        data = decompress(self._path(digest).read_bytes(), self._zdict(row["zdict"]))
+        if content_digest(data) != digest:
+            raise IOError("Corrupted report content: {}".format(digest))
+        else:
+            pass
+        return data
+
+    def get(self, platform: str, workgroup: str, report: str, at=None) -> bytes:
+        """
+            Content of a report at a date, None if there is none.
+
+            :param str platform: database platform, qa or prod
+            :param str workgroup: workgroup UUID, or 'DB' for whole database
+            :param str report: report name
+            :param datetime at: date of the version, defaults to the latest
+        """
+        entry = self.latest(platform, workgroup, report, at)
+        return self.read(entry.get("digest")) if entry else None
+
+    def history(
+        self,
+        platform: str = None,
+        workgroup: str = None,
+        report: str = None,
+        since: datetime = None,
+        until: datetime = None,
+    ) -> list:
+        """
+            Index entries matching criteria, oldest first.
+
+            :param str platform: database platform, qa or prod
+            :param str workgroup: workgroup UUID, or 'DB' for whole database
+            :param str report: report name
+            :param datetime since: versions created from
+            :param datetime until: versions created before
+        """
+        clauses, params = [], []
+        for column, value in (
+            ("platform", platform),
+            ("workgroup", workgroup),
+            ("report", report),
+        ):
+            if value is not None:
+                clauses.append("{} = ?".format(column))
+                params.append(value)
+            else:
+                pass
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since.isoformat())
+        else:
+            pass
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until.isoformat())
+        else:
+            pass
+        rows = self.db.execute(
+            "SELECT * FROM reports{} ORDER BY created, rowid".format(
+                " WHERE " + " AND ".join(clauses) if clauses else ""
+            ),
+            params,
+        )
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        """Number of versions and objects, raw and stored sizes in bytes."""
+        objects = self.db.execute(
+            "SELECT COUNT(*), TOTAL(size), TOTAL(stored) FROM objects"
+        ).fetchone()
+        return {
+            "reports": self.db.execute("SELECT COUNT(*) FROM reports").fetchone()[0],
+            "objects": objects[0],
+            "size": int(objects[1]),
+            "stored": int(objects[2]),
+        }
@@ -0,0 +1,643 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Storage backends: the query shapes used by IsogeoScanUtils, implemented
+     on top of MongoDB and in memory (for tests and benchmarks).
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from copy import deepcopy
+import logging
+
+# 3rd party library
+from pymongo import ASCENDING, DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.backends")
+
+# value of a path missing from a document, in aggregation expressions
+MISSING = object()
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class Backend(object):
+    """Query shapes used by IsogeoScanUtils."""
+
+    def count(self, coll: str, query: dict, max_time_ms: int = None) -> int:
+        """
+            Count documents matching a query.
+
+            :param str coll: collection name
+            :param dict query: MongoDB filter
+            :param int max_time_ms: server-side time limit
+        """
+        raise NotImplementedError
+
+    def first(self, coll: str, query: dict, max_time_ms: int = None) -> dict:
+        """
+            First document matching a query, in natural order. None if no
+             document matches.
+
+            :param str coll: collection name
+            :param dict query: MongoDB filter
+            :param int max_time_ms: server-side time limit
+        """
+        raise NotImplementedError
+
+    def find(
+        self,
+        coll: str,
+        query: dict,
+        projection: dict = None,
+        sort: list = None,
+        max_time_ms: int = None,
+    ):
+        """
+            Iterate over documents matching a query.
+
+            :param str coll: collection name
+            :param dict query: MongoDB filter
+            :param dict projection: fields to return
+            :param list sort: list of (field, direction)
+            :param int max_time_ms: server-side time limit
+        """
+        raise NotImplementedError
+
+    def distinct(self, coll: str, field: str, query: dict = None) -> list:
+        """
+            Distinct values of a field.
+
+            :param str coll: collection name
+            :param str field: field name
+            :param dict query: MongoDB filter
+        """
+        raise NotImplementedError
+
+    def server_status(self) -> dict:
+        """Server load indicators (serverStatus command output)."""
+        raise NotImplementedError
+
+    def aggregate(self, coll: str, pipeline: list) -> list:
+        """
+            Run an aggregation pipeline and returns its output documents.
+
+            :param str coll: collection name
+            :param list pipeline: aggregation stages
+        """
+        raise NotImplementedError
+
+    def drop(self, coll: str):
+        """
+            Drop a collection, if it exists.
+
+            :param str coll: collection name
+        """
+        raise NotImplementedError
+
+    def rename(self, coll: str, new_name: str):
+        """
+            Rename a collection, replacing the target if it exists.
+
+            :param str coll: collection name
+            :param str new_name: new collection name
+        """
+        raise NotImplementedError
+
+    def bulk_write(self, coll: str, operations: list, ordered: bool = True) -> dict:
+        """
+            Write a batch of operations targeting documents by _id, and returns
+             the number of deleted, modified and upserted documents.
+             Operations are tuples:
+
+                - ("delete", _id)
+                - ("set", _id, values, fields): values set, fields unset
+                - ("restore", document): document replaced or inserted
+
+            :param str coll: collection name
+            :param list operations: operations to write
+            :param bool ordered: stop at the first error
+        """
+        raise NotImplementedError
+
+
+class MongoBackend(Backend):
+    """Queries sent to MongoDB, reads retried through a connection manager."""
+
+    def __init__(self, db, conn=None):
+        """
+            :param db: pymongo database
+            :param ConnectionManager conn: manager retrying reads, optional
+        """
+        self.db = db
+        self.conn = conn
+
+    def _read(self, func, *args):
+        """Run an idempotent read, transparently retried on failover."""
+        if self.conn is None:
+            return func(*args)
+        else:
+            return self.conn.call(func, *args)
+
+    def _cursor(self, coll, query, projection=None, sort=None, max_time_ms=None):
+        """Build a cursor."""
+        cursor = self.db.get_collection(coll).find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        else:
+            pass
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+        else:
+            pass
+        return cursor
+
+    def count(self, coll: str, query: dict, max_time_ms: int = None) -> int:
+        return self._read(self._cursor(coll, query, max_time_ms=max_time_ms).count)
+
+    def first(self, coll: str, query: dict, max_time_ms: int = None) -> dict:
+        def read():
+            cursor = self._cursor(coll, query, max_time_ms=max_time_ms).limit(1)
+            return next(iter(cursor), None)
+
+        return self._read(read)
+
+    def find(
+        self,
+        coll: str,
+        query: dict,
+        projection: dict = None,
+        sort: list = None,
+        max_time_ms: int = None,
+    ):
+        if self.conn is None:
+            return self._cursor(coll, query, projection, sort, max_time_ms)
+        else:
+            return self._documents(coll, query, projection, sort, max_time_ms)
+
+    def _documents(self, coll, query, projection=None, sort=None, max_time_ms=None):
+        """
+            Iterate over a cursor created and read through the connection
+             manager. After a failover, the query is sent again, skipping the
+             documents already read: unsorted reads rely on the natural order
+             of the new primary.
+        """
+        state = {"cursor": None, "read": 0}
+
+        def read():
+            if state.get("cursor") is None:
+                state["cursor"] = self._cursor(
+                    coll, query, projection, sort, max_time_ms
+                ).skip(state.get("read"))
+            else:
+                pass
+            try:
+                return next(state.get("cursor"))
+            except ConnectionFailure:
+                state["cursor"] = None
+                raise
+
+        while True:
+            try:
+                doc = self.conn.call(read)
+            except StopIteration:
+                return
+            state["read"] += 1
+            yield doc
+
+    def distinct(self, coll: str, field: str, query: dict = None) -> list:
+        return self._read(self.db.get_collection(coll).distinct, field, query)
+
+    def server_status(self) -> dict:
+        return self._read(self.db.command, "serverStatus")
+
+    def aggregate(self, coll: str, pipeline: list) -> list:
+        # pipelines of this package write with $merge by _id: safe to retry
+        def read():
+            return list(
+                self.db.get_collection(coll).aggregate(pipeline, allowDiskUse=True)
+            )
+
+        return self._read(read)
+
+    def drop(self, coll: str):
+        self._read(self.db.drop_collection, coll)
+
+    def rename(self, coll: str, new_name: str):
+        self.db.get_collection(coll).rename(new_name, dropTarget=True)
+
+    @staticmethod
+    def _request(operation: tuple):
+        """pymongo request of a bulk operation, None if there is nothing to do."""
+        action, target = operation[0], operation[1]
+        if action == "delete":
+            return DeleteOne({"_id": target})
+        elif action == "restore":
+            return ReplaceOne({"_id": target.get("_id")}, target, upsert=True)
+        elif action == "set":
+            update = {}
+            if operation[2]:
+                update["$set"] = operation[2]
+            else:
+                pass
+            if operation[3]:
+                update["$unset"] = {field: "" for field in operation[3]}
+            else:
+                pass
+            return UpdateOne({"_id": target}, update) if update else None
+        else:
+            raise ValueError("Unknown bulk operation: {}".format(action))
+
+    def bulk_write(self, coll: str, operations: list, ordered: bool = True) -> dict:
+        requests = [
+            request for request in map(self._request, operations) if request is not None
+        ]
+        if not requests:
+            return {"deleted": 0, "modified": 0, "upserted": 0}
+        else:
+            pass
+        # operations target documents by _id, with absolute values: safe to retry
+        result = self._read(self.db.get_collection(coll).bulk_write, requests, ordered)
+        return {
+            "deleted": result.deleted_count,
+            "modified": result.modified_count,
+            "upserted": result.upserted_count,
+        }
+
+
+class MemoryBackend(Backend):
+    """
+        Collections held in memory, as lists of documents. Supports the subset
+         of the query language used by this package: equality (arrays and
+         dotted paths included), $exists, $ne, $size, $in, $nin, $gt, $gte,
+         $lt, $lte, $and, $or. Aggregation stages: $match, $unwind, $group
+         ($sum, $first, $max, $min, $push, $addToSet; $cond and comparison
+         expressions) and $merge by _id.
+         Bulk writes by _id.
+    """
+
+    def __init__(self, data: dict = None):
+        """:param dict data: lists of documents by collection name"""
+        self.data = {coll: list(docs) for coll, docs in (data or {}).items()}
+
+    def insert(self, coll: str, docs: list):
+        """
+            Add documents to a collection.
+
+            :param str coll: collection name
+            :param list docs: documents to add
+        """
+        self.data.setdefault(coll, []).extend(docs)
+
+    # -- matching --
+
+    @staticmethod
+    def _resolve(value, parts: list) -> list:
+        """Values found at a dotted path, traversing arrays."""
+        if not parts:
+            return [value]
+        elif isinstance(value, list):
+            return [v for item in value for v in MemoryBackend._resolve(item, parts)]
+        elif isinstance(value, dict) and parts[0] in value:
+            return MemoryBackend._resolve(value.get(parts[0]), parts[1:])
+        else:
+            return []
+
+    @staticmethod
+    def _equals(values: list, expected) -> bool:
+        """Equality, an array matching if one of its items does."""
+        if expected is None and not values:
+            return True
+        else:
+            pass
+        for value in values:
+            if value == expected:
+                return True
+            elif isinstance(value, list) and expected in value:
+                return True
+            else:
+                pass
+        return False
+
+    @staticmethod
+    def _compare(values: list, operator: str, expected) -> bool:
+        """Comparison operators, ignoring values of another type."""
+        for value in values:
+            items = value if isinstance(value, list) else [value]
+            for item in items:
+                try:
+                    if operator == "$gt" and item > expected:
+                        return True
+                    elif operator == "$gte" and item >= expected:
+                        return True
+                    elif operator == "$lt" and item < expected:
+                        return True
+                    elif operator == "$lte" and item <= expected:
+                        return True
+                    else:
+                        pass
+                except TypeError:
+                    pass
+        return False
+
+    def _match_field(self, doc: dict, field: str, condition) -> bool:
+        """Check a condition on a field."""
+        values = self._resolve(doc, field.split("."))
+        operators = isinstance(condition, dict) and condition
+        if not (operators and all(key.startswith("$") for key in condition)):
+            return self._equals(values, condition)
+        else:
+            pass
+
+        for operator, expected in condition.items():
+            if operator == "$exists":
+                matched = bool(values) == bool(expected)
+            elif operator == "$ne":
+                matched = not self._equals(values, expected)
+            elif operator == "$size":
+                matched = any(
+                    isinstance(value, list) and len(value) == expected
+                    for value in values
+                )
+            elif operator == "$in":
+                matched = any(self._equals(values, item) for item in expected)
+            elif operator == "$nin":
+                matched = not any(self._equals(values, item) for item in expected)
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                matched = self._compare(values, operator, expected)
+            else:
+                raise NotImplementedError(
+                    "Operator not supported in memory: {}".format(operator)
+                )
+            if not matched:
+                return False
+            else:
+                pass
+        return True
+
+    def match(self, doc: dict, query: dict) -> bool:
+        """
+            Says if a document matches a query.
+
+            :param dict doc: document
+            :param dict query: MongoDB filter
+        """
+        for field, condition in (query or {}).items():
+            if field == "$and":
+                matched = all(self.match(doc, sub) for sub in condition)
+            elif field == "$or":
+                matched = any(self.match(doc, sub) for sub in condition)
+            else:
+                matched = self._match_field(doc, field, condition)
+            if not matched:
+                return False
+            else:
+                pass
+        return True
+
+    # -- query shapes --
+
+    def _matching(self, coll: str, query: dict) -> list:
+        return [doc for doc in self.data.get(coll, []) if self.match(doc, query)]
+
+    def count(self, coll: str, query: dict, max_time_ms: int = None) -> int:
+        return len(self._matching(coll, query))
+
+    def first(self, coll: str, query: dict, max_time_ms: int = None) -> dict:
+        return next(iter(self._matching(coll, query)), None)
+
+    def find(
+        self,
+        coll: str,
+        query: dict,
+        projection: dict = None,
+        sort: list = None,
+        max_time_ms: int = None,
+    ):
+        docs = self._matching(coll, query)
+        for field, direction in reversed(sort or []):
+            docs.sort(
+                key=lambda doc: (doc.get(field) is not None, doc.get(field)),
+                reverse=direction != ASCENDING,
+            )
+        if projection:
+            fields = [field for field, shown in projection.items() if shown]
+            docs = [
+                {
+                    key: value
+                    for key, value in doc.items()
+                    if key in fields or (key == "_id" and projection.get("_id", 1))
+                }
+                for doc in docs
+            ]
+        else:
+            docs = [deepcopy(doc) for doc in docs]
+        return docs
+
+    def distinct(self, coll: str, field: str, query: dict = None) -> list:
+        values = []
+        for doc in self._matching(coll, query):
+            for value in self._resolve(doc, field.split(".")):
+                for item in value if isinstance(value, list) else [value]:
+                    if item not in values:
+                        values.append(item)
+                    else:
+                        pass
+        return values
+
+    # -- aggregation --
+
+    def _value(self, doc: dict, expression):
+        """
+            Value of an expression: "$field" path, $cond or comparison
+             operator, document of them or constant. Like MongoDB, a missing
+             path is MISSING, and dropped from documents.
+        """
+        if isinstance(expression, str) and expression.startswith("$"):
+            values = self._resolve(doc, expression[1:].split("."))
+            return values[0] if values else MISSING
+        elif isinstance(expression, dict) and "$cond" in expression:
+            condition, true, false = expression.get("$cond")
+            return self._value(doc, true if self._value(doc, condition) else false)
+        elif isinstance(expression, dict) and len(expression) == 1:
+            (operator, operands), = expression.items()
+            if operator in ("$gt", "$gte", "$lt", "$lte"):
+                left, right = (
+                    None if value is MISSING else value
+                    for value in (self._value(doc, operand) for operand in operands)
+                )
+                return self._compare([left], operator, right)
+            else:
+                return {operator: self._value(doc, operands)}
+        elif isinstance(expression, dict):
+            values = {key: self._value(doc, value) for key, value in expression.items()}
+            return {key: value for key, value in values.items() if value is not MISSING}
+        else:
+            return expression
+
+    @staticmethod
+    def _unwind(docs: list, field: str) -> list:
+        """$unwind stage: one document by array item, nulls and [] dropped."""
+        unwound = []
+        for doc in docs:
+            value = doc.get(field)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not None:
+                    unwound.append(dict(doc, **{field: item}))
+                else:
+                    pass
+        return unwound
+
+    def _group(self, docs: list, spec: dict) -> list:
+        """$group stage."""
+        groups = {}
+        for doc in docs:
+            key = self._value(doc, spec.get("_id"))
+            key = None if key is MISSING else key
+            # compound keys are not hashable
+            hashed = tuple(sorted(key.items())) if isinstance(key, dict) else key
+            if hashed not in groups:
+                groups[hashed] = {"_id": key}
+            else:
+                pass
+            group = groups[hashed]
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                else:
+                    pass
+                (operator, expression), = accumulator.items()
+                value = self._value(doc, expression)
+                if value is MISSING:
+                    # missing values aren't pushed, other accumulators take null
+                    if operator in ("$push", "$addToSet"):
+                        continue
+                    else:
+                        value = None
+                else:
+                    pass
+                if operator == "$sum":
+                    group[field] = group.get(field, 0) + (value or 0)
+                elif operator == "$first":
+                    group.setdefault(field, value)
+                elif operator in ("$max", "$min"):
+                    current = group.get(field)
+                    if value is not None and (
+                        current is None
+                        or (value > current if operator == "$max" else value < current)
+                    ):
+                        group[field] = value
+                    else:
+                        group.setdefault(field, None)
+                elif operator == "$push":
+                    group.setdefault(field, []).append(value)
+                elif operator == "$addToSet":
+                    items = group.setdefault(field, [])
+                    if value is not None and value not in items:
+                        items.append(value)
+                    else:
+                        pass
+                else:
+                    raise NotImplementedError(
+                        "Accumulator not supported in memory: {}".format(operator)
+                    )
+        return list(groups.values())
+
+    def _merge(self, docs: list, spec: dict):
+        """
+            $merge stage, by _id: matching documents are updated. Like
+             MongoDB, nothing is created without documents.
+        """
+        if not docs:
+            return
+        else:
+            pass
+        target = self.data.setdefault(spec.get("into"), [])
+        by_id = {doc.get("_id"): doc for doc in target}
+        for doc in docs:
+            if doc.get("_id") in by_id:
+                by_id.get(doc.get("_id")).update(deepcopy(doc))
+            else:
+                by_id[doc.get("_id")] = deepcopy(doc)
+                target.append(by_id.get(doc.get("_id")))
+
+    def server_status(self) -> dict:
+        # nothing is shared in memory: never busy
+        return {}
+
+    def aggregate(self, coll: str, pipeline: list) -> list:
+        docs = [deepcopy(doc) for doc in self.data.get(coll, [])]
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                docs = [doc for doc in docs if self.match(doc, spec)]
+            elif operator == "$unwind":
+                docs = self._unwind(docs, spec[1:])
+            elif operator == "$group":
+                docs = self._group(docs, spec)
+            elif operator == "$merge":
+                self._merge(docs, spec)
+                docs = []
+            else:
+                raise NotImplementedError(
+                    "Stage not supported in memory: {}".format(operator)
+                )
+        return docs
+
+    def drop(self, coll: str):
+        self.data.pop(coll, None)
+
+    def rename(self, coll: str, new_name: str):
+        if coll not in self.data:
+            raise OperationFailure("Source collection doesn't exist: {}".format(coll))
+        else:
+            pass
+        self.data[new_name] = self.data.pop(coll)
+
+    def bulk_write(self, coll: str, operations: list, ordered: bool = True) -> dict:
+        docs = self.data.setdefault(coll, [])
+        counts = {"deleted": 0, "modified": 0, "upserted": 0}
+        for operation in operations:
+            action = operation[0]
+            _id = operation[1].get("_id") if action == "restore" else operation[1]
+            index = next(
+                (i for i, doc in enumerate(docs) if doc.get("_id") == _id), None
+            )
+            if action == "delete":
+                if index is not None:
+                    del docs[index]
+                    counts["deleted"] += 1
+                else:
+                    pass
+            elif action == "restore":
+                if index is not None:
+                    counts["modified"] += docs[index] != operation[1]
+                    docs[index] = deepcopy(operation[1])
+                else:
+                    docs.append(deepcopy(operation[1]))
+                    counts["upserted"] += 1
+            elif action == "set":
+                if index is not None:
+                    doc = docs[index]
+                    before = deepcopy(doc)
+                    doc.update(deepcopy(operation[2] or {}))
+                    for field in operation[3] or []:
+                        doc.pop(field, None)
+                    counts["modified"] += doc != before
+                else:
+                    pass
+            else:
+                raise ValueError("Unknown bulk operation: {}".format(action))
+        return counts
@@ -0,0 +1,220 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Requests backlog: requests not finished, broken nor killed yet (pending or
+     running in front of the super worker) are grouped by workgroup and state
+     in a single aggregation. Ages are read from their ObjectId: the oldest one
+     is exact, percentiles come from counts by age bucket, per workgroup and
+     globally.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import logging
+import math
+
+# 3rd party library
+from bson import ObjectId
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.backlog")
+
+# states of requests in the backlog
+ACTIVE_STATES = ("pending", "running")
+
+# age percentiles reported
+PERCENTILES = (50, 90, 99)
+
+# upper bounds of age buckets in seconds, 20% apart from a minute to a month:
+# percentiles are rounded up to them
+AGE_BUCKETS = tuple(int(60 * 1.2 ** i) for i in range(60))
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def backlog_pipeline(query: dict = None, now: datetime = None) -> list:
+    """
+        Pipeline grouping active requests by workgroup and state: count,
+         first _id and counts by age bucket.
+
+        :param dict query: extra filter, e.g. a workgroup
+        :param datetime now: reference of ages, defaults to now
+    """
+    now = now or datetime.now(timezone.utc)
+    group = {
+        "_id": {"groupId": "$groupId", "state": "$state"},
+        "count": {"$sum": 1},
+        "first": {"$min": "$_id"},
+    }
+    for bucket in AGE_BUCKETS:
+        since = ObjectId.from_datetime(now - timedelta(seconds=bucket))
+        group["age_{}".format(bucket)] = {
+            "$sum": {"$cond": [{"$gte": ["$_id", since]}, 1, 0]}
+        }
+    return [
+        {"$match": dict(query or {}, state={"$in": list(ACTIVE_STATES)})},
+        {"$group": group},
+    ]
+
+
+def age_group(key: dict, ids: list, now: datetime) -> dict:
+    """
+        Group of backlog_pipeline computed from the _id of its requests.
+
+        :param dict key: group _id, workgroup and state
+        :param list ids: ObjectId of the requests
+        :param datetime now: reference of ages
+    """
+    ids = [oid for oid in ids if isinstance(oid, ObjectId)]
+    group = {"_id": key, "count": len(ids), "first": min(ids, default=None)}
+    for bucket in AGE_BUCKETS:
+        since = ObjectId.from_datetime(now - timedelta(seconds=bucket))
+        group["age_{}".format(bucket)] = sum(1 for oid in ids if oid >= since)
+    return group
+
+
+def percentile(stats: dict, rank: float) -> float:
+    """
+        Nearest-rank percentile of ages, rounded up to its age bucket and at
+         most the oldest age. None if there is no request.
+
+        :param dict stats: count, oldest age and counts by age bucket
+        :param float rank: percentile, between 0 and 100
+    """
+    if not stats.get("count"):
+        return None
+    else:
+        pass
+    position = max(1, math.ceil(rank / 100 * stats.get("count")))
+    for bucket in AGE_BUCKETS:
+        if stats.get("age_{}".format(bucket), 0) >= position:
+            return min(float(bucket), stats.get("oldest"))
+        else:
+            pass
+    return stats.get("oldest")
+
+
+def age_stats(stats: dict, percentiles: tuple = PERCENTILES) -> dict:
+    """
+        Count, oldest age and percentiles of ages, in seconds.
+
+        :param dict stats: count, oldest age and counts by age bucket
+        :param tuple percentiles: percentiles to compute
+    """
+    ages = {"count": stats.get("count", 0), "oldest": stats.get("oldest")}
+    for rank in percentiles:
+        ages["p{}".format(rank)] = percentile(stats, rank)
+    return ages
+
+
+def summarize(groups: list, now: datetime = None, percentiles=PERCENTILES) -> dict:
+    """
+        Backlog report from the pipeline output: age statistics by state,
+         per workgroup and overall.
+
+        :param list groups: output of backlog_pipeline
+        :param datetime now: reference of ages, the one of the pipeline
+        :param tuple percentiles: percentiles to compute
+    """
+    now = now or datetime.now(timezone.utc)
+    by_wg, overall = {}, {}
+    for group in groups:
+        wg, state = group["_id"].get("groupId"), group["_id"].get("state")
+        first = group.get("first")
+        oldest = (
+            max(0.0, (now - first.generation_time).total_seconds())
+            if isinstance(first, ObjectId)
+            else None
+        )
+        for stats in (
+            by_wg.setdefault(wg, {}).setdefault(state, {}),
+            overall.setdefault(state, {}),
+        ):
+            stats["count"] = stats.get("count", 0) + group.get("count", 0)
+            if oldest is not None:
+                stats["oldest"] = max(stats.get("oldest") or 0.0, oldest)
+            else:
+                stats.setdefault("oldest", None)
+            for bucket in AGE_BUCKETS:
+                key = "age_{}".format(bucket)
+                stats[key] = stats.get(key, 0) + (group.get(key) or 0)
+    return {
+        "created": now,
+        "overall": {
+            state: age_stats(stats, percentiles) for state, stats in overall.items()
+        },
+        "workgroups": {
+            wg: {
+                state: age_stats(stats, percentiles) for state, stats in states.items()
+            }
+            for wg, states in by_wg.items()
+        },
+    }
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class BacklogMonitor(object):
+    """Raise alerts from successive backlog reports."""
+
+    def __init__(self, max_age: float = None, growth: int = 3, metric: str = "p90"):
+        """
+            :param float max_age: oldest age (seconds) raising an alert
+            :param int growth: consecutive increases of the metric raising
+                               an alert
+            :param str metric: age statistic watched for growth
+        """
+        self.max_age = max_age
+        self.growth = growth
+        self.metric = metric
+        self.history = deque(maxlen=growth + 1)
+
+    def check(self, report: dict) -> list:
+        """
+            Alerts raised by a backlog report, as messages, also logged.
+
+            :param dict report: output of summarize
+        """
+        alerts = []
+        overall = (report or {}).get("overall", {})
+        for state, stats in sorted(overall.items(), key=lambda item: str(item[0])):
+            if self.max_age is not None and (stats.get("oldest") or 0) > self.max_age:
+                alerts.append(
+                    "{} requests waiting for {:.0f}s (limit {:.0f}s).".format(
+                        state, stats.get("oldest"), self.max_age
+                    )
+                )
+            else:
+                pass
+        self.history.append(
+            max((stats.get(self.metric) or 0 for stats in overall.values()), default=0)
+        )
+        values = list(self.history)
+        if len(values) > self.growth and all(
+            later > earlier for earlier, later in zip(values, values[1:])
+        ):
+            alerts.append(
+                "Backlog {} age grew {} times in a row: {:.0f}s.".format(
+                    self.metric, self.growth, values[-1]
+                )
+            )
+        else:
+            pass
+        for alert in alerts:
+            logger.warning(alert)
+        return alerts
@@ -0,0 +1,91 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Time budget shared by the queries of a report: an overall deadline is
+     split across the queries still to run so that one pathological query
+     can't hang the whole report.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import logging
+from time import monotonic
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.budget")
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class TimeBudget(object):
+    """Overall deadline of a report, fairly shared among its queries."""
+
+    def __init__(self, seconds: float, queries: int = 1):
+        """
+            Start the clock.
+
+            :param float seconds: overall time allowed to the report
+            :param int queries: expected number of queries in the report
+        """
+        if seconds <= 0:
+            raise ValueError("Time budget must be a positive number of seconds.")
+        else:
+            pass
+
+        if queries < 1:
+            raise ValueError("A time budget requires at least one query.")
+        else:
+            pass
+
+        self.seconds = seconds
+        self.queries_left = queries
+        self.deadline = monotonic() + seconds
+        self.timed_out = []
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(self.deadline - monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        """True once the deadline is reached."""
+        return self.remaining() == 0
+
+    def slice_ms(self) -> int:
+        """
+            Time allowed to the next query, in milliseconds: the remaining time
+             evenly split among the queries left. Time saved by fast queries is
+             thus given back to the following ones.
+
+            Returns 0 when the deadline is already reached.
+        """
+        left = max(self.queries_left, 1)
+        self.queries_left = max(self.queries_left - 1, 0)
+        remaining = self.remaining()
+        if not remaining:
+            return 0
+        else:
+            return max(int(remaining * 1000 / left), 1)
+
+    def mark(self, metric: str):
+        """
+            Store a metric which didn't complete in time.
+
+            :param str metric: name of the metric which timed out
+        """
+        logger.warning("Metric '{}' exceeded its time budget.".format(metric))
+        self.timed_out.append(metric)
+
+    @property
+    def partial(self) -> bool:
+        """True if at least one metric timed out."""
+        return bool(self.timed_out)
@@ -0,0 +1,259 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Resumable exports: rows are written into a part file next to the
+     target, and the position of the last row written (e.g. its _id) is
+     saved with the part file size at regular intervals. After a failure,
+     the export truncates the part file to the saved size and goes on from
+     the saved position. The target only appears, by an atomic rename, once
+     the export is complete.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+import logging
+import os
+
+# 3rd party library
+from bson import json_util
+
+# modules
+from .formats import register_dialects
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.checkpoint")
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def _remove(filepath: str):
+    """Remove a file if it exists."""
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class Checkpoint(object):
+    """Small JSON state file, replaced atomically on each save."""
+
+    def __init__(self, filepath: str):
+        """:param str filepath: path to the state file"""
+        self.path = filepath
+
+    def load(self) -> dict:
+        """Saved state, None if there is none."""
+        try:
+            with open(self.path) as state_file:
+                return json_util.loads(state_file.read())
+        except FileNotFoundError:
+            return None
+
+    def save(self, state: dict):
+        """
+            Save a state: written aside then renamed, so that a crash leaves
+             either the previous state or the new one.
+
+            :param dict state: BSON-serializable state
+        """
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as state_file:
+            state_file.write(json_util.dumps(state))
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        """Remove the saved state."""
+        _remove(self.path)
+        _remove(self.path + ".tmp")
+
+
+class CheckpointedWriter(object):
+    """
+        CSV writer resuming after a failure. Use it as a context manager:
+         the saved position is available as `position` once entered, rows
+         are added with writerow() and commit() publishes the target.
+
+        If the block raises an error, a checkpoint is saved before the part
+         file is closed. If the process is killed, rows written after the
+         last checkpoint are dropped on the next run.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        fieldnames: tuple,
+        every: int = 10000,
+        header: bool = True,
+        key: str = None,
+        buffering: int = -1,
+        **kwargs
+    ):
+        """
+            :param str target: path to the final CSV file
+            :param tuple fieldnames: CSV columns
+            :param int every: rows written between two checkpoints
+            :param bool header: write a header row
+            :param str key: export parameters. A checkpoint saved with
+                            another key is ignored.
+            :param int buffering: buffer size of the part file
+            :param kwargs: extra csv.DictWriter parameters
+        """
+        self.target = target
+        self.part = target + ".part"
+        self.checkpoint = Checkpoint(target + ".ckpt")
+        self.fieldnames = fieldnames
+        self.every = every
+        self.header = header
+        self.key = key
+        self.buffering = buffering
+        self.kwargs = kwargs
+        self.file = None
+        self.writer = None
+        self.rows = 0
+        self.position = None
+        self.done = False
+
+    def __enter__(self) -> "CheckpointedWriter":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and issubclass(exc_type, Exception):
+            if self.file is not None and not self.file.closed:
+                self.save()
+                logger.warning(
+                    "{} interrupted after {} rows: {}".format(
+                        self.target, self.rows, exc_value
+                    )
+                )
+            else:
+                pass
+        else:
+            pass
+        self.close()
+
+    def open(self):
+        """
+            Open the part file, resuming from the last checkpoint if any.
+             Returns the saved position, None for a fresh start.
+        """
+        register_dialects()
+        state = self.checkpoint.load()
+        if state is not None and state.get("key") != self.key:
+            logger.warning(
+                "{}: checkpoint of other parameters ignored.".format(self.part)
+            )
+            state = None
+        elif (
+            state is not None
+            and os.path.exists(self.part)
+            and os.path.getsize(self.part) >= state.get("offset")
+        ):
+            os.truncate(self.part, state.get("offset"))
+        else:
+            state = None
+
+        if state is None:
+            self.file = open(self.part, "w", newline="", buffering=self.buffering)
+            self.rows, self.position, self.done = 0, None, False
+        else:
+            self.file = open(self.part, "a", newline="", buffering=self.buffering)
+            self.rows = state.get("rows")
+            self.position = state.get("position")
+            self.done = state.get("done", False)
+            logger.info("{} resumed after {} rows.".format(self.target, self.rows))
+        self.writer = csv.DictWriter(
+            self.file, dialect="pipe", fieldnames=self.fieldnames, **self.kwargs
+        )
+        if state is None and self.header:
+            self.writer.writeheader()
+        else:
+            pass
+        return self.position
+
+    def writerow(self, row: dict, position):
+        """
+            Write a row, saving a checkpoint every `every` rows.
+
+            :param dict row: CSV row
+            :param position: where to resume once this row is written
+        """
+        self.writer.writerow(row)
+        self.rows += 1
+        self.position = position
+        if not self.rows % self.every:
+            self.save()
+        else:
+            pass
+
+    def writerows(self, rows: list, position):
+        """
+            Write rows at once, saving a checkpoint if `every` rows or more
+             were written since the last one.
+
+            :param list rows: CSV rows
+            :param position: where to resume once these rows are written
+        """
+        self.writer.writerows(rows)
+        previous, self.rows = self.rows, self.rows + len(rows)
+        self.position = position
+        if self.rows // self.every > previous // self.every:
+            self.save()
+        else:
+            pass
+
+    def save(self, done: bool = False):
+        """
+            Sync the part file, then save its size with the current position.
+
+            :param bool done: mark the part file complete
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.done = done
+        self.checkpoint.save(
+            {
+                "key": self.key,
+                "offset": os.fstat(self.file.fileno()).st_size,
+                "rows": self.rows,
+                "position": self.position,
+                "done": done,
+            }
+        )
+
+    def close(self):
+        """Close the part file, keeping it to resume later."""
+        if self.file is not None:
+            self.file.close()
+        else:
+            pass
+
+    def commit(self) -> int:
+        """
+            Publish the part file as the target (atomic rename) and drop the
+             checkpoint. Returns the number of rows.
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.part, self.target)
+        self.checkpoint.clear()
+        return self.rows
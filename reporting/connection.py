@@ -0,0 +1,223 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Resilient access to the Scan FME cluster: retries with jittered
+     exponential backoff and a circuit breaker to stop hammering a dead
+     cluster.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import logging
+import random
+from time import monotonic, sleep
+
+# 3rd party library
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.connection")
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class CircuitOpenError(ConnectionFailure):
+    """Raised when the circuit breaker refuses to query the cluster."""
+
+
+class RetryPolicy(object):
+    """Jittered exponential backoff ("full jitter")."""
+
+    def __init__(
+        self, attempts: int = 5, base: float = 0.5, cap: float = 30.0, rand=random
+    ):
+        """
+            Set backoff parameters.
+
+            :param int attempts: maximum number of tries (first one included)
+            :param float base: delay in seconds before the first retry
+            :param float cap: maximum delay in seconds between two tries
+            :param rand: random generator (for tests)
+        """
+        if attempts < 1:
+            raise ValueError("At least one attempt is required.")
+        else:
+            pass
+
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.rand = rand
+
+    def delays(self):
+        """Yields the delays to wait before each retry."""
+        for attempt in range(self.attempts - 1):
+            yield self.rand.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """
+        Stop querying after consecutive failures and let a single trial go
+         through once the reset timeout is elapsed.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self, threshold: int = 5, reset_timeout: float = 30.0, clock=monotonic
+    ):
+        """
+            Set breaker parameters.
+
+            :param int threshold: consecutive failures opening the circuit
+            :param float reset_timeout: seconds before a trial is allowed
+            :param clock: time function (for tests)
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        """Current state of the circuit."""
+        if self.opened_at is None:
+            return self.CLOSED
+        elif self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        else:
+            return self.OPEN
+
+    def allow(self) -> bool:
+        """
+            True if a query can be sent to the cluster. Once half-open, only
+             the first caller is allowed, as the trial, until its outcome is
+             recorded.
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        elif state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        else:
+            return False
+
+    def record_success(self):
+        """Close the circuit."""
+        if self.opened_at is not None:
+            logger.info("Circuit closed: cluster is reachable again.")
+        else:
+            pass
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        """Count a failure and open the circuit when threshold is reached."""
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                logger.error(
+                    "Circuit opened after {} consecutive failures.".format(
+                        self.failures
+                    )
+                )
+            else:
+                pass
+            self.opened_at = self.clock()
+        else:
+            pass
+
+
+class ConnectionManager(object):
+    """Build the client and run idempotent reads with retries."""
+
+    def __init__(
+        self,
+        uri: str,
+        policy: RetryPolicy = None,
+        breaker: CircuitBreaker = None,
+        wait=sleep,
+        **client_kwargs
+    ):
+        """
+            Store connection parameters. Nothing is opened until connect().
+
+            :param str uri: MongoDB URI
+            :param RetryPolicy policy: retry policy to apply
+            :param CircuitBreaker breaker: circuit breaker to share
+            :param wait: sleep function (for tests)
+            :param client_kwargs: extra parameters passed to MongoClient
+        """
+        self.uri = uri
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.wait = wait
+        self.client_kwargs = dict({"serverSelectionTimeoutMS": 5000}, **client_kwargs)
+        self.client = None
+
+    def connect(self) -> MongoClient:
+        """
+            Create the client and wait for the cluster to answer.
+
+            Raises ConnectionFailure if it still doesn't answer once retries
+             are exhausted.
+        """
+        if self.client is None:
+            self.client = MongoClient(self.uri, **self.client_kwargs)
+        else:
+            pass
+        self.call(self.client.admin.command, "ismaster")
+        return self.client
+
+    def call(self, func, *args, **kwargs):
+        """
+            Run an idempotent read, retrying on network errors and failovers.
+             Server-side errors (time outs included) are not retried.
+
+            :param func: callable performing the read
+        """
+        delays = self.policy.delays()
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError("Circuit is open: cluster is not queried.")
+            else:
+                pass
+            try:
+                result = func(*args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except ConnectionFailure as e:
+                self.breaker.record_failure()
+                delay = next(delays, None)
+                if delay is None or not self.breaker.allow():
+                    raise
+                else:
+                    logger.warning(
+                        "Read failed ({}), retrying in {:.2f}s.".format(e, delay)
+                    )
+                    self.wait(delay)
+            except Exception:
+                # server-side errors and exhausted cursors: the cluster answered
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
@@ -0,0 +1,244 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Long-lived reporting: the connection is kept warm and each report is
+     refreshed on its own interval, with workgroups staggered over time so
+     that their queries never hit the cluster at once.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import logging
+from os import path
+import random
+import shelve
+from time import monotonic
+
+# 3rd party library
+from bson import json_util
+import gevent
+from gevent.event import Event
+
+# modules
+from .planner import REPORTS, ReportPlan
+from .sketches import SketchStore, distinct_report, update_sketches
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.daemon")
+
+# job rebuilding the summary collection (see IsogeoScanUtils.refresh_summary)
+SUMMARY_JOB = "summary"
+
+# report of the requests backlog, per workgroup within a single query
+BACKLOG_JOB = "backlog"
+
+# job updating the distinct counts sketches (see sketches)
+SKETCH_JOB = "distinct"
+
+# reports run on the whole database, whatever the workgroup
+DB_REPORTS = ("workers", SUMMARY_JOB, BACKLOG_JOB, SKETCH_JOB)
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class RefreshJob(object):
+    """A report refreshed on a regular interval for a workgroup."""
+
+    def __init__(self, report: str, interval: float, wg: str = None, offset=0.0):
+        """
+            Store job parameters.
+
+            :param str report: report name, among planner REPORTS, or
+                               SUMMARY_JOB, SKETCH_JOB
+            :param float interval: seconds between two refreshes
+            :param str wg: workgroup UUID. None for whole database reports.
+            :param float offset: seconds to wait before the first refresh
+        """
+        self.report = report
+        self.interval = interval
+        self.wg = wg
+        self.offset = offset
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration = None
+
+    @property
+    def key(self) -> str:
+        """Job identifier, used in the store."""
+        return "{}|{}".format(self.report, self.wg or "DB")
+
+
+class ReportDaemon(object):
+    """Schedule staggered report refreshes over a single connection."""
+
+    def __init__(
+        self,
+        app,
+        workgroups: list,
+        intervals: dict,
+        folder: str = "./reports",
+        store: str = None,
+        jitter: float = 0.1,
+        rand=random,
+        monitor=None,
+        archive=None,
+    ):
+        """
+            Plan refresh jobs.
+
+            :param IsogeoScanUtils app: connected utils instance
+            :param list workgroups: workgroups UUID to report on
+            :param dict intervals: refresh interval in seconds by report name.
+                                   SUMMARY_JOB rebuilds the summary collection,
+                                   SKETCH_JOB updates distinct counts.
+            :param str folder: folder where reports are written
+            :param str store: path to a shelve file keeping latest results
+            :param float jitter: random part of intervals, as a ratio
+            :param rand: random generator (for tests)
+            :param BacklogMonitor monitor: checks backlog reports for alerts
+            :param ReportArchive archive: keeps every changed report version
+        """
+        unknown = set(intervals) - set(REPORTS) - {SUMMARY_JOB, SKETCH_JOB}
+        if unknown:
+            raise ValueError("Unknown reports: {}".format(", ".join(sorted(unknown))))
+        else:
+            pass
+
+        self.app = app
+        self.folder = folder
+        self.store = store
+        self.jitter = jitter
+        self.rand = rand
+        self.monitor = monitor
+        self.archive = archive
+        self.stopped = Event()
+        self.jobs = []
+        for report, interval in sorted(intervals.items()):
+            targets = [None] if report in DB_REPORTS else list(workgroups)
+            # spread first runs evenly across the interval, plus jitter
+            for i, wg in enumerate(targets):
+                offset = interval * i / len(targets) + self._jitter(interval)
+                self.jobs.append(RefreshJob(report, interval, wg, offset))
+
+    def _jitter(self, interval: float) -> float:
+        """Random delay added to an interval."""
+        return self.rand.uniform(0, interval * self.jitter)
+
+    def _report(self, job: RefreshJob) -> dict:
+        """
+            Run and write a report, keeping results in the store if any.
+             Returns the results of the report diagnosis.
+
+            :param RefreshJob job: job to run
+        """
+        # own instance by job: time budgets are held by the instance
+        if job.wg is None:
+            app, wg = self.app.copy(), 0
+        else:
+            app, wg = self.app.workgroup(job.wg), 1
+        plan = ReportPlan([job.report], wg=wg)
+        # a refresh can't run over the next one
+        with app.time_budget(job.interval, queries=plan.queries_count(app)) as budget:
+            results = plan.execute(app, concurrency=1)
+            outputs = plan.write(app, results, csv_name="latest", folder=self.folder)
+        if self.archive is not None:
+            plan.archive(app, outputs, self.archive)
+        else:
+            pass
+        if self.store:
+            with shelve.open(self.store) as store:
+                store[job.key] = {
+                    "results": {"{}|{}".format(*k): v for k, v in results.items()},
+                    "timed_out": budget.timed_out,
+                }
+        else:
+            pass
+        return results
+
+    def _distinct(self) -> dict:
+        """
+            Update sketches with new documents and write distinct counts
+             estimates. Sketches are kept in the reports folder.
+        """
+        store = SketchStore(
+            path.join(self.folder, "ScanFME_Sketches_{}".format(self.app.platform))
+        )
+        update_sketches(self.app.backend, store, throttle=self.app.throttle)
+        report = distinct_report(store)
+        out = "ScanFME_Report_{}_DB_distinct_latest.json".format(
+            self.app.platform.upper()
+        )
+        with open(path.join(self.folder, out), "w") as json_file:
+            json_file.write(json_util.dumps(report, indent=2))
+        return report
+
+    def refresh(self, job: RefreshJob):
+        """
+            Run a job once. Errors are logged and never propagated, so that
+             a failing refresh doesn't stop the daemon.
+
+            :param RefreshJob job: job to run
+        """
+        start = monotonic()
+        try:
+            if job.report == SUMMARY_JOB:
+                self.app.refresh_summary()
+            elif job.report == SKETCH_JOB:
+                self._distinct()
+            elif job.report == BACKLOG_JOB and self.monitor is not None:
+                self.monitor.check(self._report(job).get(("rq_backlog", 0)))
+            else:
+                self._report(job)
+            job.runs += 1
+        except Exception as e:
+            job.failures += 1
+            logger.error("Refresh of {} failed: {}".format(job.key, e))
+        job.last_duration = monotonic() - start
+        logger.debug("{} refreshed in {:.2f}s".format(job.key, job.last_duration))
+
+    def _loop(self, job: RefreshJob):
+        """
+            Refresh a job forever at fixed rate. Ticks missed because of a slow
+             refresh are skipped instead of piling up.
+
+            :param RefreshJob job: job to run
+        """
+        next_run = monotonic() + job.offset
+        while not self.stopped.wait(max(next_run - monotonic(), 0)):
+            self.refresh(job)
+            next_run += job.interval
+            now = monotonic()
+            if next_run < now:
+                missed = int((now - next_run) // job.interval) + 1
+                job.skipped += missed
+                logger.warning("{} missed {} refreshes.".format(job.key, missed))
+                next_run += missed * job.interval
+            else:
+                pass
+            next_run += self._jitter(job.interval) - job.interval * self.jitter / 2
+
+    def run(self):
+        """Start every job in its own greenlet and wait until stopped."""
+        logger.info("Daemon started with {} jobs.".format(len(self.jobs)))
+        greenlets = [gevent.spawn(self._loop, job) for job in self.jobs]
+        try:
+            self.stopped.wait()
+        finally:
+            self.stopped.set()
+            gevent.joinall(greenlets)
+        logger.info("Daemon stopped.")
+
+    def stop(self):
+        """Ask every job to stop after its current refresh."""
+        self.stopped.set()
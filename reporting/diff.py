@@ -0,0 +1,213 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Compare two runs of a CSV report in constant memory: both files are
+     sorted by key (external merge sort for large files), then streamed
+     through a merge-join listing added, removed and changed rows.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from collections import Counter, namedtuple
+import csv
+import heapq
+from itertools import islice
+import logging
+from os import path, remove
+import tempfile
+
+# modules
+from .formats import register_dialects
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.diff")
+
+# keys identifying rows of known reports
+REPORT_KEYS = {"csv": ("wg_id",), "workers": ("wg_id", "wk_id")}
+
+RowDiff = namedtuple("RowDiff", ("change", "key", "old", "new", "deltas"))
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def _row_key(key: tuple):
+    """Build a function extracting the key of a row."""
+    return lambda row: tuple(row.get(field) or "" for field in key)
+
+
+def _write_run(rows: list, fieldnames: list, folder: str) -> str:
+    """Write a sorted run into a temporary file and returns its path."""
+    handle, run = tempfile.mkstemp(suffix=".csv", dir=folder)
+    with open(handle, "w", newline="") as run_file:
+        writer = csv.DictWriter(run_file, dialect="pipe", fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    return run
+
+
+def _read_rows(csv_path: str):
+    """Stream rows of a pipe CSV file."""
+    with open(csv_path, newline="") as csvfile:
+        for row in csv.DictReader(csvfile, dialect="pipe"):
+            yield row
+
+
+def sort_csv(
+    csv_in: str, key: tuple, csv_out: str, chunk_rows: int = 100000, folder=None
+) -> str:
+    """
+        Sort a pipe CSV file by key, using sorted runs of at most chunk_rows
+         rows merged together. Returns the output path.
+
+        :param str csv_in: file to sort
+        :param tuple key: fields to sort on
+        :param str csv_out: sorted file to write
+        :param int chunk_rows: maximum number of rows held in memory
+        :param str folder: folder for temporary runs, defaults to output one
+    """
+    register_dialects()
+    row_key = _row_key(key)
+    folder = folder or path.dirname(path.abspath(csv_out))
+    runs = []
+    try:
+        with open(csv_in, newline="") as csvfile:
+            reader = csv.DictReader(csvfile, dialect="pipe")
+            fieldnames = reader.fieldnames or []
+            while True:
+                chunk = list(islice(reader, chunk_rows))
+                if not chunk:
+                    break
+                else:
+                    chunk.sort(key=row_key)
+                    runs.append(_write_run(chunk, fieldnames, folder))
+        logger.debug("{} sorted in {} runs.".format(csv_in, len(runs)))
+
+        merged = heapq.merge(*(_read_rows(run) for run in runs), key=row_key)
+        with open(csv_out, "w", newline="") as out_file:
+            writer = csv.DictWriter(out_file, dialect="pipe", fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(merged)
+    finally:
+        for run in runs:
+            remove(run)
+
+    return csv_out
+
+
+def _delta(old: str, new: str):
+    """Numeric difference of two cells, None if they are not numbers."""
+    try:
+        delta = float(new) - float(old)
+    except (TypeError, ValueError):
+        return None
+    return int(delta) if delta.is_integer() else delta
+
+
+def compare_rows(old: dict, new: dict) -> dict:
+    """
+        Get changed columns of two rows: {column: (old, new, delta)}.
+
+        :param dict old: row of the previous run
+        :param dict new: row of the current run
+    """
+    deltas = {}
+    for column in list(old) + [col for col in new if col not in old]:
+        if old.get(column) != new.get(column):
+            deltas[column] = (
+                old.get(column),
+                new.get(column),
+                _delta(old.get(column), new.get(column)),
+            )
+        else:
+            pass
+    return deltas
+
+
+def merge_join(old_rows, new_rows, key: tuple):
+    """
+        Stream differences between two iterables of rows sorted by key.
+
+        :param old_rows: rows of the previous run, sorted by key
+        :param new_rows: rows of the current run, sorted by key
+        :param tuple key: fields identifying a row
+    """
+    row_key = _row_key(key)
+    old_rows, new_rows = iter(old_rows), iter(new_rows)
+    old, new = next(old_rows, None), next(new_rows, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and row_key(old) < row_key(new)):
+            yield RowDiff("removed", row_key(old), old, None, None)
+            old = next(old_rows, None)
+        elif old is None or row_key(new) < row_key(old):
+            yield RowDiff("added", row_key(new), None, new, None)
+            new = next(new_rows, None)
+        else:
+            deltas = compare_rows(old, new)
+            if deltas:
+                yield RowDiff("changed", row_key(old), old, new, deltas)
+            else:
+                pass
+            old, new = next(old_rows, None), next(new_rows, None)
+
+
+def diff_reports(csv_old: str, csv_new: str, key: tuple, chunk_rows: int = 100000):
+    """
+        Stream differences between two runs of a report.
+
+        :param str csv_old: previous run
+        :param str csv_new: current run
+        :param tuple key: fields identifying a row
+        :param int chunk_rows: maximum number of rows held in memory to sort
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        sorted_old = sort_csv(
+            csv_old, key, path.join(folder, "old.csv"), chunk_rows, folder
+        )
+        sorted_new = sort_csv(
+            csv_new, key, path.join(folder, "new.csv"), chunk_rows, folder
+        )
+        for row_diff in merge_join(_read_rows(sorted_old), _read_rows(sorted_new), key):
+            yield row_diff
+
+
+def write_diff(
+    csv_old: str, csv_new: str, csv_out: str, key: tuple, chunk_rows: int = 100000
+) -> Counter:
+    """
+        Write differences between two runs into a CSV file, one line per
+         changed cell. Returns the number of rows by change.
+
+        :param str csv_old: previous run
+        :param str csv_new: current run
+        :param str csv_out: diff file to write
+        :param tuple key: fields identifying a row
+        :param int chunk_rows: maximum number of rows held in memory to sort
+    """
+    register_dialects()
+    summary = Counter()
+    with open(csv_out, "w", newline="") as csvfile:
+        fieldnames = ("change", "key", "column", "old", "new", "delta")
+        writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=fieldnames)
+        writer.writeheader()
+        for row_diff in diff_reports(csv_old, csv_new, key, chunk_rows):
+            summary[row_diff.change] += 1
+            line = {"change": row_diff.change, "key": "/".join(row_diff.key)}
+            if row_diff.change == "changed":
+                for column, (old, new, delta) in row_diff.deltas.items():
+                    writer.writerow(
+                        dict(line, column=column, old=old, new=new, delta=delta)
+                    )
+            else:
+                writer.writerow(line)
+
+    return summary
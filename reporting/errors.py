@@ -0,0 +1,313 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Error signatures of failed requests: `err` fields of broken and killed
+     requests are streamed, normalized into signatures (paths, ids, numbers
+     and quoted values stripped) by a pool of processes, then counted by
+     workgroup and globally with first and last seen dates.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from collections import deque
+import csv
+import logging
+import multiprocessing
+import re
+
+# 3rd party library
+from bson import ObjectId
+
+# modules
+from .formats import register_dialects
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.errors")
+
+# states of failed requests
+FAILED_STATES = ("broken", "killed")
+
+# signature of errors once the signatures table is full
+OTHER = "<other>"
+
+# replacements applied in order: the most specific patterns first
+PATTERNS = (
+    (re.compile(r"\b[a-z][\w+.-]*://\S+", re.I), "<url>"),
+    (re.compile(r"(?:\b[a-z]:|\\\\[\w.$-]+)\\[^\s\"'<>|]*", re.I), "<path>"),
+    (re.compile(r"(?<![\w.])(?:/[^\s/\"'<>]+)+/?"), "<path>"),
+    (
+        re.compile(
+            r"\b[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}\b",
+            re.I,
+        ),
+        "<id>",
+    ),
+    (re.compile(r"\b[0-9a-f]{24,}\b", re.I), "<id>"),
+    (re.compile(r"(?<!\w)(?:'[^']*'|\"[^\"]*\")(?!\w)"), "<str>"),
+    (re.compile(r"\b0x[0-9a-f]+\b|\b\d+(?:[.,:]\d+)*\b", re.I), "<n>"),
+    (re.compile(r"\s+"), " "),
+)
+
+# maximum length of a signature
+SIGNATURE_LENGTH = 200
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def err_text(err) -> str:
+    """
+        Get the text of an err field, whatever its shape.
+
+        :param err: err field of a request (str, dict, list or None)
+    """
+    if err is None:
+        return ""
+    elif isinstance(err, dict):
+        for key in ("msg", "message", "error", "errmsg"):
+            if key in err:
+                return err_text(err.get(key))
+        return " ".join("{}={}".format(k, err_text(v)) for k, v in sorted(err.items()))
+    elif isinstance(err, (list, tuple)):
+        return " ".join(err_text(item) for item in err)
+    else:
+        return str(err)
+
+
+def normalize(text: str) -> str:
+    """
+        Turn an error message into a signature shared by errors of the same
+         kind.
+
+        :param str text: error message
+    """
+    for pattern, replacement in PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text.strip()[:SIGNATURE_LENGTH] or "<empty>"
+
+
+def normalize_chunk(texts: list) -> list:
+    """Normalize a chunk of error messages (run in worker processes)."""
+    return [normalize(text) for text in texts]
+
+
+def err_date(doc: dict):
+    """Creation date of a request, from its ObjectId. None if unknown."""
+    _id = doc.get("_id")
+    return _id.generation_time if isinstance(_id, ObjectId) else None
+
+
+def _chunks(docs, chunk_size: int):
+    """Group failed requests into chunks of (groupId, state, date, text)."""
+    chunk = []
+    for doc in docs:
+        chunk.append(
+            (
+                doc.get("groupId"),
+                doc.get("state"),
+                err_date(doc),
+                err_text(doc.get("err")),
+            )
+        )
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+        else:
+            pass
+    if chunk:
+        yield chunk
+    else:
+        pass
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class SignatureStats(object):
+    """Occurrences of an error signature."""
+
+    __slots__ = ("count", "first_seen", "last_seen", "example")
+
+    def __init__(self, example: str):
+        """:param str example: first raw error message met"""
+        self.count = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.example = example[:SIGNATURE_LENGTH]
+
+    def add(self, date):
+        """Count an occurrence at a date (None if unknown)."""
+        self.count += 1
+        if date is not None:
+            if self.first_seen is None or date < self.first_seen:
+                self.first_seen = date
+            else:
+                pass
+            if self.last_seen is None or date > self.last_seen:
+                self.last_seen = date
+            else:
+                pass
+        else:
+            pass
+
+
+class ErrorSignatures(object):
+    """Counts of error signatures by workgroup and globally."""
+
+    def __init__(self, max_signatures: int = 10000):
+        """
+            :param int max_signatures: maximum number of (workgroup, state,
+                                       signature) entries kept in memory.
+                                       Further new signatures count as OTHER.
+        """
+        self.max_signatures = max_signatures
+        self.by_wg = {}
+        self.overall = {}
+        self.errors = 0
+
+    def _stats(self, table: dict, key: tuple, text: str) -> SignatureStats:
+        stats = table.get(key)
+        if stats is None:
+            if len(table) >= self.max_signatures:
+                key = key[:-1] + (OTHER,)
+                stats = table.get(key)
+            else:
+                pass
+        else:
+            pass
+        if stats is None:
+            stats = table[key] = SignatureStats(text)
+        else:
+            pass
+        return stats
+
+    def add(self, wg_id: str, state: str, date, text: str, signature: str):
+        """
+            Count a failed request.
+
+            :param str wg_id: workgroup of the request
+            :param str state: request state
+            :param datetime date: request creation date
+            :param str text: raw error message
+            :param str signature: normalized error message
+        """
+        self.errors += 1
+        self._stats(self.by_wg, (wg_id, state, signature), text).add(date)
+        self._stats(self.overall, (state, signature), text).add(date)
+
+    def rows(self):
+        """Yields report rows: global signatures first, then by workgroup."""
+        tables = (
+            (((None,) + key, stats) for key, stats in self.overall.items()),
+            self.by_wg.items(),
+        )
+        for table in tables:
+            for (wg_id, state, signature), stats in sorted(
+                table, key=lambda item: (item[0][0] or "", -item[1].count)
+            ):
+                yield {
+                    "scope": wg_id or "*",
+                    "state": state,
+                    "signature": signature,
+                    "count": stats.count,
+                    "first_seen": stats.first_seen,
+                    "last_seen": stats.last_seen,
+                    "example": stats.example,
+                }
+
+    def write(self, csv_out: str) -> int:
+        """
+            Write signatures into a CSV file. Returns the number of rows.
+
+            :param str csv_out: path to the CSV file
+        """
+        register_dialects()
+        rows = 0
+        with open(csv_out, "w", newline="") as csvfile:
+            fieldnames = (
+                "scope",
+                "state",
+                "signature",
+                "count",
+                "first_seen",
+                "last_seen",
+                "example",
+            )
+            writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=fieldnames)
+            writer.writeheader()
+            for row in self.rows():
+                writer.writerow(row)
+                rows += 1
+        return rows
+
+
+class ErrorScan(object):
+    """Stream failed requests and normalize their errors in a process pool."""
+
+    def __init__(
+        self, processes: int = None, chunk_size: int = 5000, max_signatures: int = 10000
+    ):
+        """
+            :param int processes: pool size, defaults to the number of cores.
+                                  1 normalizes in the current process.
+            :param int chunk_size: errors sent at once to a worker process
+            :param int max_signatures: see ErrorSignatures
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.max_signatures = max_signatures
+
+    def _normalized(self, chunks):
+        """
+            Yields (chunk, signatures) in order. At most two chunks by process
+             are in flight, which bounds memory whatever the number of errors.
+        """
+        if self.processes == 1:
+            for chunk in chunks:
+                yield chunk, normalize_chunk([item[-1] for item in chunk])
+            return
+        else:
+            pass
+
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(self.processes) as pool:
+            pending = deque()
+            for chunk in chunks:
+                texts = [item[-1] for item in chunk]
+                pending.append((chunk, pool.apply_async(normalize_chunk, (texts,))))
+                if len(pending) >= self.processes * 2:
+                    chunk, result = pending.popleft()
+                    yield chunk, result.get()
+                else:
+                    pass
+            while pending:
+                chunk, result = pending.popleft()
+                yield chunk, result.get()
+
+    def run(self, docs) -> ErrorSignatures:
+        """
+            Count error signatures of failed requests.
+
+            :param docs: iterable of requests with _id, groupId, state and err
+        """
+        signatures = ErrorSignatures(self.max_signatures)
+        for chunk, normalized in self._normalized(_chunks(docs, self.chunk_size)):
+            for (wg_id, state, date, text), signature in zip(chunk, normalized):
+                signatures.add(wg_id, state, date, text, signature)
+        logger.info(
+            "{} failed requests, {} signatures.".format(
+                signatures.errors, len(signatures.overall)
+            )
+        )
+        return signatures
@@ -0,0 +1,25 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Output formats shared by reports.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def register_dialects():
+    """Register CSV dialects used by reports (see: https://pymotw.com/3/csv/)."""
+    if "pipe" not in csv.list_dialects():
+        csv.register_dialect("pipe", delimiter="|", escapechar="\\", skipinitialspace=1)
+    else:
+        pass
@@ -0,0 +1,310 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Distribute reports over several nodes: a producer publishes one job per
+     workgroup to an AMQP queue and workers consume them, run the reports
+     and publish their results.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from collections import deque
+from itertools import count
+import json
+import logging
+import socket
+
+# modules
+from .planner import REPORTS, ReportPlan
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.jobs")
+
+JOBS_QUEUE = "scanfme.reports.jobs"
+RESULTS_QUEUE = "scanfme.reports.results"
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def connect_broker(
+    host: str = "localhost:5672",
+    userid: str = "guest",
+    password: str = "guest",
+    virtual_host: str = "/",
+):
+    """
+        Open a connection to the AMQP broker and returns it.
+
+        :param str host: broker host and port
+        :param str userid: broker user
+        :param str password: broker password
+        :param str virtual_host: broker virtual host
+    """
+    import amqp
+
+    conn = amqp.Connection(
+        host=host, userid=userid, password=password, virtual_host=virtual_host
+    )
+    conn.connect()
+    return conn
+
+
+def declare_queues(channel):
+    """
+        Declare durable jobs and results queues.
+
+        :param channel: AMQP channel
+    """
+    for queue in (JOBS_QUEUE, RESULTS_QUEUE):
+        channel.queue_declare(queue=queue, durable=True, auto_delete=False)
+
+
+def check_reports(reports: list) -> list:
+    """
+        Check reports can run for a single workgroup: whole database reports
+         would be run again by every job. Raises ValueError otherwise.
+
+        :param list reports: report names, among planner REPORTS keys
+    """
+    # unknown reports
+    ReportPlan(reports)
+    db_wide = [
+        report
+        for report in reports
+        if any(scope == 0 for method, scope in REPORTS.get(report))
+    ]
+    if db_wide:
+        raise ValueError(
+            "Whole database reports can't run by workgroup: {}".format(
+                ", ".join(db_wide)
+            )
+        )
+    else:
+        pass
+    return reports
+
+
+def publish_jobs(
+    channel,
+    workgroups: list,
+    reports: list,
+    folder: str = "./reports",
+    name: str = "job",
+    timeout: float = None,
+    message_cls=None,
+) -> int:
+    """
+        Publish one persistent job per workgroup. Returns the number of jobs.
+
+        :param channel: AMQP channel
+        :param list workgroups: workgroups UUID
+        :param list reports: reports to run for each workgroup
+        :param str folder: folder where workers write the reports
+        :param str name: suffix of the output filenames
+        :param float timeout: time budget of each job in seconds
+        :param message_cls: message class. Defaults to amqp.Message.
+    """
+    if message_cls is None:
+        from amqp import Message as message_cls
+    else:
+        pass
+
+    # fail early on unknown or whole database reports
+    check_reports(reports)
+
+    declare_queues(channel)
+    for wg in workgroups:
+        body = {
+            "wg": wg,
+            "reports": list(reports),
+            "folder": folder,
+            "name": name,
+            "timeout": timeout,
+        }
+        channel.basic_publish(
+            message_cls(
+                json.dumps(body), content_type="application/json", delivery_mode=2
+            ),
+            routing_key=JOBS_QUEUE,
+        )
+    logger.info("{} jobs published.".format(len(workgroups)))
+    return len(workgroups)
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class JobWorker(object):
+    """Consume report jobs and publish their results."""
+
+    def __init__(self, connection, channel, app, prefetch: int = 1, message_cls=None):
+        """
+            Set up consumption.
+
+            :param connection: AMQP connection (to drain events)
+            :param channel: AMQP channel
+            :param IsogeoScanUtils app: connected utils instance
+            :param int prefetch: maximum number of unacknowledged jobs
+            :param message_cls: message class. Defaults to amqp.Message.
+        """
+        if message_cls is None:
+            from amqp import Message as message_cls
+        else:
+            pass
+
+        self.connection = connection
+        self.channel = channel
+        self.app = app
+        self.message_cls = message_cls
+        self.done = 0
+        self.failed = 0
+        declare_queues(channel)
+        channel.basic_qos(prefetch_size=0, prefetch_count=prefetch, a_global=False)
+
+    def handle(self, message):
+        """
+            Run a job, publish its result then acknowledge it. A failing job
+             is requeued once, then rejected. Invalid jobs are never requeued,
+             malformed messages are rejected without result.
+
+            :param message: AMQP message
+        """
+        tag = message.delivery_info.get("delivery_tag")
+        try:
+            job = json.loads(message.body)
+            if not isinstance(job, dict):
+                raise ValueError("A job must be a JSON object.")
+            else:
+                pass
+        except (TypeError, ValueError) as e:
+            # nothing to report about: dropped, never requeued
+            logger.error("Malformed job rejected: {}".format(e))
+            self.failed += 1
+            self.channel.basic_reject(tag, requeue=False)
+            return
+        result = {"wg": job.get("wg"), "outputs": [], "timed_out": [], "error": None}
+        name, folder, timeout = job.get("name"), job.get("folder"), job.get("timeout")
+        try:
+            app = self.app.workgroup(job.get("wg"))
+            plan = ReportPlan(check_reports(job.get("reports")), wg=1)
+            if timeout:
+                with app.time_budget(timeout, plan.queries_count(app)) as budget:
+                    results = plan.execute(app, concurrency=1)
+                    outputs = plan.write(app, results, name, folder)
+                result["timed_out"] = budget.timed_out
+            else:
+                results = plan.execute(app, concurrency=1)
+                outputs = plan.write(app, results, name, folder)
+            result["outputs"] = outputs
+        except Exception as e:
+            logger.error("Job for workgroup {} failed: {}".format(job.get("wg"), e))
+            redelivered = message.delivery_info.get("redelivered")
+            if not redelivered and not isinstance(e, ValueError):
+                self.channel.basic_reject(tag, requeue=True)
+                return
+            else:
+                self.failed += 1
+                result["error"] = str(e)
+        else:
+            self.done += 1
+
+        self.channel.basic_publish(
+            self.message_cls(
+                json.dumps(result), content_type="application/json", delivery_mode=2
+            ),
+            routing_key=RESULTS_QUEUE,
+        )
+        self.channel.basic_ack(tag)
+
+    def run(self, max_jobs: int = None, idle_timeout: float = None):
+        """
+            Consume jobs until max_jobs are handled or the queue stays empty
+             for idle_timeout seconds. Both None means forever.
+
+            :param int max_jobs: number of jobs to handle before returning
+            :param float idle_timeout: seconds without job before returning
+        """
+        self.channel.basic_consume(queue=JOBS_QUEUE, callback=self.handle)
+        while max_jobs is None or self.done + self.failed < max_jobs:
+            try:
+                self.connection.drain_events(timeout=idle_timeout)
+            except socket.timeout:
+                logger.info("No more jobs.")
+                break
+        return self.done
+
+
+class Message(object):
+    """Subset of amqp.Message used by the in-process broker."""
+
+    def __init__(self, body, **properties):
+        self.body = body
+        self.properties = properties
+        self.delivery_info = {}
+
+
+class InProcessBroker(object):
+    """
+        Stand-in of an AMQP connection and channel, in a single process:
+         persistent queues, prefetch limits, acks and requeues.
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.consumers = []
+        self.unacked = {}
+        self.prefetch = 0
+        self.tags = count(1)
+
+    def queue_declare(self, queue: str, durable: bool = False, auto_delete=True):
+        self.queues.setdefault(queue, deque())
+
+    def basic_publish(self, msg, exchange: str = "", routing_key: str = ""):
+        self.queues.setdefault(routing_key, deque()).append((msg, False))
+
+    def basic_qos(self, prefetch_size=0, prefetch_count=0, a_global=False):
+        self.prefetch = prefetch_count
+
+    def basic_consume(self, queue: str, callback=None, no_ack: bool = False):
+        self.consumers.append((queue, callback))
+        return "ctag{}".format(len(self.consumers))
+
+    def basic_ack(self, delivery_tag):
+        del self.unacked[delivery_tag]
+
+    def basic_reject(self, delivery_tag, requeue: bool):
+        msg = self.unacked.pop(delivery_tag)
+        if requeue:
+            self.queues[msg.delivery_info.get("routing_key")].appendleft((msg, True))
+        else:
+            pass
+
+    def drain_events(self, timeout: float = None):
+        """Deliver one pending message, within the prefetch limit."""
+        if self.prefetch and len(self.unacked) >= self.prefetch:
+            raise socket.timeout("Prefetch limit reached.")
+        for queue, callback in self.consumers:
+            if self.queues.get(queue):
+                msg, redelivered = self.queues.get(queue).popleft()
+                tag = next(self.tags)
+                msg.delivery_info = {
+                    "delivery_tag": tag,
+                    "redelivered": redelivered,
+                    "routing_key": queue,
+                }
+                self.unacked[tag] = msg
+                callback(msg)
+                return
+        raise socket.timeout("No message delivered.")
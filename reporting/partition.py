@@ -0,0 +1,429 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Range-partitioned scans: a collection is split into _id ranges from a
+     sample of its documents, then ranges are scanned in parallel by a pool
+     of processes. Each partition feeds a task (reducer or writer) and
+     partial results are combined at the end. Exports checkpoint each
+     partition, so that a failed run goes on where it stopped.
+
+    Identifiers of a collection must share the same type (ObjectId in Scan
+     FME collections): MongoDB compares values of one type only, so ranges
+     bounded by ObjectIds never match identifiers of another type.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from collections import Counter
+import csv
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+
+# modules
+from .checkpoint import Checkpoint, CheckpointedWriter
+from .formats import register_dialects
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.partition")
+
+# clients of the process by URI, closed when it exits (see MongoOpener)
+_CLIENTS = {}
+
+# documents sampled by matching one, when splitting a filtered scan
+QUERY_OVERSAMPLING = 10
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def split_points(
+    collection, partitions: int, sample_size: int = 1000, query: dict = None
+) -> list:
+    """
+        Get _id values splitting a collection into partitions of about the
+         same size, from a random sample of documents.
+
+        A filtered collection is sampled first, then filtered: sampling
+         matching documents would read and randomly sort all of them. The
+         sample is larger, and a very selective query may get no split point
+         (a single partition).
+
+        :param collection: pymongo collection to split
+        :param int partitions: number of partitions wanted
+        :param int sample_size: number of documents to sample
+        :param dict query: filter of the documents to split
+    """
+    if partitions < 2:
+        return []
+    else:
+        pass
+    if query:
+        pipeline = [
+            {"$sample": {"size": sample_size * QUERY_OVERSAMPLING}},
+            {"$match": query},
+            {"$project": {"_id": 1}},
+        ]
+    else:
+        pipeline = [{"$sample": {"size": sample_size}}, {"$project": {"_id": 1}}]
+    ids = sorted(doc.get("_id") for doc in collection.aggregate(pipeline))
+    points = []
+    for i in range(1, partitions):
+        point = ids[len(ids) * i // partitions] if ids else None
+        if point is not None and point not in points:
+            points.append(point)
+        else:
+            pass
+    return points
+
+
+def id_ranges(points: list) -> list:
+    """
+        Turn split points into contiguous (lower, upper) _id ranges. None
+         means unbounded.
+
+        :param list points: sorted split points
+    """
+    bounds = [None] + list(points) + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def range_query(bounds: tuple, query: dict = None) -> dict:
+    """
+        Add an _id range predicate to a query. Ranges include their lower
+         bound and exclude their upper bound.
+
+        :param tuple bounds: (lower, upper) _id values
+        :param dict query: query to restrict
+    """
+    lower, upper = bounds
+    id_range = {}
+    if lower is not None:
+        id_range["$gte"] = lower
+    else:
+        pass
+    if upper is not None:
+        id_range["$lt"] = upper
+    else:
+        pass
+    query = dict(query or {})
+    if id_range:
+        query["_id"] = dict(query.get("_id", {}), **id_range)
+    else:
+        pass
+    return query
+
+
+def _scan(opener, query: dict, projection: dict, task, index: int):
+    """
+        Scan a partition in a worker process and returns the task partial
+         result.
+
+        :param opener: callable returning the collection to read
+        :param dict query: partition query
+        :param dict projection: fields to read
+        :param PartitionTask task: work to run on each document
+        :param int index: partition index
+    """
+    collection = opener()
+    state = task.start(index)
+    try:
+        query = task.resume(state, query)
+        if query is not None:
+            for doc in collection.find(query, projection).sort("_id", 1):
+                state = task.feed(state, doc)
+        else:
+            pass
+    except Exception:
+        task.abort(state)
+        raise
+    return task.finish(state)
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class PartitionError(Exception):
+    """Raised when partitions still fail once retries are exhausted."""
+
+
+class MongoOpener(object):
+    """
+        Picklable opener of a collection, connecting from the worker process.
+         A worker keeps a single client for its partitions, closed when the
+         worker exits.
+    """
+
+    def __init__(self, uri: str, collection: str):
+        """
+            :param str uri: MongoDB URI, with default database
+            :param str collection: collection name
+        """
+        self.uri = uri
+        self.collection = collection
+
+    def __call__(self):
+        client = _CLIENTS.get(self.uri)
+        if client is None:
+            from pymongo import MongoClient
+
+            client = _CLIENTS[self.uri] = MongoClient(self.uri)
+            multiprocessing.util.Finalize(None, client.close, exitpriority=10)
+        else:
+            pass
+        return client.get_default_database().get_collection(self.collection)
+
+
+class PartitionTask(object):
+    """Work run on each partition. Subclasses must be picklable."""
+
+    def start(self, index: int):
+        """Returns the initial state of a partition."""
+        raise NotImplementedError
+
+    def resume(self, state, query: dict) -> dict:
+        """
+            Returns the query of the documents left to scan in a partition,
+             None if the partition is already done.
+        """
+        return query
+
+    def feed(self, state, doc: dict):
+        """Handle a document and returns the new state."""
+        raise NotImplementedError
+
+    def abort(self, state):
+        """Release the state of a failing partition."""
+        pass
+
+    def finish(self, state):
+        """Returns the partial result of a partition."""
+        return state
+
+    def combine(self, partials: list):
+        """Combine partial results, ordered by partition."""
+        raise NotImplementedError
+
+
+class CountBy(PartitionTask):
+    """Count documents by value of a field."""
+
+    def __init__(self, field: str):
+        """:param str field: field to group by"""
+        self.field = field
+
+    def start(self, index: int):
+        return Counter()
+
+    def feed(self, state, doc: dict):
+        state[doc.get(self.field)] += 1
+        return state
+
+    def combine(self, partials: list) -> Counter:
+        total = Counter()
+        for partial in partials:
+            total.update(partial)
+        return total
+
+
+class CsvExport(PartitionTask):
+    """
+        Write documents fields into a CSV file, one part per partition.
+         Parts are checkpointed (see CheckpointedWriter): scanning again a
+         partition resumes after the last _id saved, and skips completed
+         partitions.
+    """
+
+    def __init__(
+        self, csv_out: str, fieldnames: tuple, every: int = 10000, key: str = None
+    ):
+        """
+            :param str csv_out: path to the final CSV file
+            :param tuple fieldnames: fields to export
+            :param int every: rows written between two checkpoints
+            :param str key: export parameters. Parts checkpointed with another
+                            key are written again.
+        """
+        self.csv_out = csv_out
+        self.fieldnames = fieldnames
+        self.every = every
+        self.key = key
+
+    def part(self, index: int) -> str:
+        """Path to the part file of a partition (before its .part suffix)."""
+        return "{}.{:04d}".format(self.csv_out, index)
+
+    def start(self, index: int) -> CheckpointedWriter:
+        writer = CheckpointedWriter(
+            self.part(index),
+            self.fieldnames,
+            every=self.every,
+            header=False,
+            key=self.key,
+            extrasaction="ignore",
+        )
+        writer.open()
+        return writer
+
+    def resume(self, state, query: dict) -> dict:
+        if state.done:
+            return None
+        elif state.position is not None:
+            query = dict(query or {})
+            query["_id"] = dict(query.get("_id", {}), **{"$gt": state.position})
+            return query
+        else:
+            return query
+
+    def feed(self, state, doc: dict):
+        state.writerow(doc, doc.get("_id"))
+        return state
+
+    def abort(self, state):
+        state.save()
+        state.close()
+
+    def finish(self, state):
+        state.save(done=True)
+        state.close()
+        return (state.part, state.rows)
+
+    def combine(self, partials: list) -> int:
+        """
+            Concatenate parts behind a header into the final file, renamed
+             once complete. Returns the number of rows.
+        """
+        register_dialects()
+        tmp = self.csv_out + ".part"
+        with open(tmp, "w", newline="") as csvfile:
+            csv.DictWriter(
+                csvfile, dialect="pipe", fieldnames=self.fieldnames
+            ).writeheader()
+            for part, rows in partials:
+                with open(part, newline="") as part_file:
+                    for line in part_file:
+                        csvfile.write(line)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        os.replace(tmp, self.csv_out)
+        for index, (part, rows) in enumerate(partials):
+            os.remove(part)
+            Checkpoint(self.part(index) + ".ckpt").clear()
+        return sum(rows for part, rows in partials)
+
+
+class PartitionedScan(object):
+    """Scan _id ranges of a collection in a pool of processes."""
+
+    def __init__(
+        self,
+        opener,
+        query: dict = None,
+        projection: dict = None,
+        processes: int = None,
+        retries: int = 1,
+    ):
+        """
+            Store scan parameters.
+
+            :param opener: picklable callable returning the collection to read
+            :param dict query: filter applied to every partition
+            :param dict projection: fields to read
+            :param int processes: pool size, defaults to the number of cores
+            :param int retries: extra tries given to a failing partition
+        """
+        self.opener = opener
+        self.query = query
+        self.projection = projection
+        self.processes = processes or multiprocessing.cpu_count()
+        self.retries = retries
+        self.bounds = []
+        self.partials = {}
+        self.failed = {}
+
+    def split(self, collection, partitions: int = None, sample_size: int = 1000):
+        """
+            Compute partitions bounds. Results of a previous run are dropped.
+
+            :param collection: pymongo collection to split
+            :param int partitions: number of partitions, defaults to 4 by process
+            :param int sample_size: number of documents to sample
+        """
+        partitions = partitions or self.processes * 4
+        self.bounds = id_ranges(
+            split_points(collection, partitions, sample_size, self.query)
+        )
+        self.partials = {}
+        self.failed = {}
+        logger.debug("{} partitions planned.".format(len(self.bounds)))
+        return self.bounds
+
+    def run(self, task: PartitionTask):
+        """
+            Scan partitions not done yet, then combine partial results.
+
+            Raises PartitionError if some partitions still fail: calling run()
+             again only scans the failed ones.
+
+            :param PartitionTask task: work to run on each partition
+        """
+        if not self.bounds:
+            self.bounds = id_ranges([])
+        else:
+            pass
+
+        todo = [i for i in range(len(self.bounds)) if i not in self.partials]
+        self.failed = {}
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(min(self.processes, len(todo) or 1)) as pool:
+
+            def submit(i):
+                args = (
+                    self.opener,
+                    range_query(self.bounds[i], self.query),
+                    self.projection,
+                    task,
+                    i,
+                )
+                return pool.apply_async(_scan, args)
+
+            pending = {i: submit(i) for i in todo}
+            attempts = Counter()
+            while pending:
+                for i, result in list(pending.items()):
+                    try:
+                        self.partials[i] = result.get()
+                        del pending[i]
+                    except Exception as e:
+                        attempts[i] += 1
+                        if attempts[i] > self.retries:
+                            logger.error("Partition {} failed: {}".format(i, e))
+                            self.failed[i] = e
+                            del pending[i]
+                        else:
+                            logger.warning("Partition {} retried: {}".format(i, e))
+                            pending[i] = submit(i)
+            # workers exit on their own, running their finalizers
+            pool.close()
+            pool.join()
+
+        if self.failed:
+            raise PartitionError(
+                "Partitions failed: {}".format(", ".join(map(str, sorted(self.failed))))
+            )
+        else:
+            pass
+
+        return task.combine([self.partials[i] for i in range(len(self.bounds))])
@@ -0,0 +1,177 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Pipelined exports: a fetch thread pulls documents from a cursor into
+     batches put on a bounded queue, while the calling thread turns batches
+     into rows and writes them in bulk. Network waits and disk writes
+     overlap, and counters by stage tell which side is the bottleneck. A
+     throttle can pause the fetch stage while the cluster is busy.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from itertools import islice
+import logging
+import queue
+import threading
+from time import perf_counter
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.pipeline")
+
+# buffer size of files written by pipelines
+WRITE_BUFFER = 1 << 20
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class StageStats(object):
+    """Activity of a pipeline stage."""
+
+    __slots__ = ("name", "items", "batches", "busy", "waiting")
+
+    def __init__(self, name: str):
+        """:param str name: stage name"""
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items handled by second of work, None before any work."""
+        return self.items / self.busy if self.busy else None
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "busy": round(self.busy, 3),
+            "waiting": round(self.waiting, 3),
+            "throughput": self.throughput,
+        }
+
+
+class Pipeline(object):
+    """Fetch stage (thread) and write stage (caller) linked by a bounded queue."""
+
+    def __init__(self, batch_size: int = 1000, depth: int = 4, throttle=None):
+        """
+            :param int batch_size: items by batch
+            :param int depth: batches queued at most, bounding memory
+            :param AdaptiveThrottle throttle: paces the fetch of batches
+        """
+        self.batch_size = batch_size
+        self.depth = depth
+        self.throttle = throttle
+        self.fetch = StageStats("fetch")
+        self.write = StageStats("write")
+
+    @property
+    def bottleneck(self) -> str:
+        """Stage the other one waited for the most."""
+        return "fetch" if self.write.waiting >= self.fetch.waiting else "write"
+
+    def _put(self, batches: queue.Queue, item: tuple, stop: threading.Event) -> bool:
+        """Queue an item unless the write stage stopped. Returns False if so."""
+        start = perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            self.fetch.waiting += perf_counter() - start
+
+    def _fetch(self, items, batches: queue.Queue, stop: threading.Event):
+        """
+            Fetch stage: batches of items, then the end or the error met.
+             Items fetched before an error are queued first.
+        """
+        iterator, error = iter(items), None
+        while error is None and not stop.is_set():
+            if self.throttle is not None and self.fetch.batches:
+                self.throttle.pace()
+            else:
+                pass
+            batch = []
+            start = perf_counter()
+            try:
+                for item in islice(iterator, self.batch_size):
+                    batch.append(item)
+            except Exception as e:
+                error = e
+            self.fetch.busy += perf_counter() - start
+            if batch:
+                self.fetch.items += len(batch)
+                self.fetch.batches += 1
+                if not self._put(batches, ("batch", batch), stop):
+                    return
+                else:
+                    pass
+            elif error is None:
+                break
+            else:
+                pass
+        if error is None:
+            self._put(batches, ("end", None), stop)
+        else:
+            self._put(batches, ("error", error), stop)
+
+    def run(self, items, write_batch) -> int:
+        """
+            Run the pipeline until items are exhausted. Errors of the fetch
+             stage are raised here, once previous batches are written.
+             Returns the number of items written.
+
+            :param items: iterable of items, e.g. a cursor
+            :param write_batch: callable writing a list of items
+        """
+        batches = queue.Queue(self.depth)
+        stop = threading.Event()
+        fetcher = threading.Thread(
+            target=self._fetch, args=(items, batches, stop), name="pipeline-fetch"
+        )
+        fetcher.daemon = True
+        fetcher.start()
+        try:
+            while True:
+                start = perf_counter()
+                kind, payload = batches.get()
+                self.write.waiting += perf_counter() - start
+                if kind == "batch":
+                    start = perf_counter()
+                    write_batch(payload)
+                    self.write.busy += perf_counter() - start
+                    self.write.items += len(payload)
+                    self.write.batches += 1
+                elif kind == "error":
+                    raise payload
+                else:
+                    break
+        finally:
+            stop.set()
+            fetcher.join()
+            logger.info(
+                "{} items written, bottleneck: {}. fetch: {}, write: {}".format(
+                    self.write.items,
+                    self.bottleneck,
+                    self.fetch.as_dict(),
+                    self.write.as_dict(),
+                )
+            )
+        return self.write.items
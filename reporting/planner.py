@@ -0,0 +1,219 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Plan several reports at once: diagnosis shared by reports are queried
+     only once, concurrently, then every output is written from the same
+     data pass.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import logging
+from os import path
+from pathlib import Path
+
+# 3rd party library
+from bson import json_util
+
+# modules
+from .profiling import stage
+from .window import to_datetime
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.planner")
+
+# diagnosis methods and the number of queries they run, or a function of the
+# instance and scope counting them
+QUERIES = {
+    "colls_stats": 7,  # one per collection
+    "ds_diagnosis": 1,
+    "rq_diagnosis": 6,
+    "wk_diagnosis": lambda app, wg: len(app._wk_queries(wg)),
+    "rq_backlog": 1,
+}
+
+# available reports and the diagnosis they need. None means "report scope".
+REPORTS = {
+    "colls": (("colls_stats", None),),
+    "ds": (("ds_diagnosis", None),),
+    "rq": (("rq_diagnosis", None),),
+    "backlog": (("rq_backlog", None),),
+    "wk": (("wk_diagnosis", None),),
+    "csv": (("colls_stats", None),),
+    "workers": (("wk_diagnosis", 0),),
+}
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class ReportPlan(object):
+    """Union of the queries required by a list of reports."""
+
+    def __init__(self, reports: list, wg: bool = 1, since=None, until=None):
+        """
+            Check requested reports and list the diagnosis to run.
+
+            :param list reports: report names, among REPORTS keys
+            :param bool wg: scope of the reports, default workgroup or whole DB
+            :param since: documents created from, datetime or timedelta back
+                          from now
+            :param until: documents created before, datetime or timedelta
+                          back from now
+        """
+        unknown = set(reports) - set(REPORTS)
+        if unknown:
+            raise ValueError(
+                "Unknown reports: {}. Available: {}".format(
+                    ", ".join(sorted(unknown)), ", ".join(REPORTS)
+                )
+            )
+        else:
+            pass
+
+        if wg not in (0, 1):
+            raise ValueError("A boolean value is required.")
+        else:
+            pass
+
+        self.reports = list(reports)
+        self.wg = wg
+        # bounds are fixed once, for every diagnosis of the plan
+        self.since, self.until = to_datetime(since), to_datetime(until)
+        self.queries = []
+        for report in self.reports:
+            for method, scope in REPORTS.get(report):
+                query = (method, self.wg if scope is None else scope)
+                if query not in self.queries:
+                    self.queries.append(query)
+                else:
+                    pass
+
+    def queries_count(self, app) -> int:
+        """
+            Number of underlying queries run by the plan.
+
+            :param IsogeoScanUtils app: instance to run the plan with
+        """
+        count = 0
+        for method, wg in self.queries:
+            queries = QUERIES.get(method)
+            count += queries(app, wg) if callable(queries) else queries
+        return count
+
+    def execute(self, app, concurrency: int = 4) -> dict:
+        """
+            Run every planned diagnosis once, concurrently.
+
+            Workers cursors are read once and stored as lists, so that several
+             reports can iterate over them.
+
+            :param IsogeoScanUtils app: connected utils instance
+            :param int concurrency: maximum number of diagnosis run at once
+        """
+        from gevent.pool import Pool
+
+        def run(query):
+            method, wg = query
+            logger.debug("Running {}({})".format(method, wg))
+            if self.since is None and self.until is None:
+                result = getattr(app, method)(wg)
+            else:
+                result = getattr(app, method)(wg, since=self.since, until=self.until)
+            if method == "wk_diagnosis":
+                result = {k: list(v or ()) for k, v in result.items()}
+            else:
+                pass
+            return query, result
+
+        pool = Pool(concurrency)
+        results = dict(pool.imap_unordered(run, self.queries))
+        logger.info(
+            "{} diagnosis run for {} reports.".format(len(results), len(self.reports))
+        )
+        return results
+
+    def write(self, app, results: dict, csv_name: str, folder: str = "./reports"):
+        """
+            Write every report output from executed diagnosis. Returns the
+             written paths.
+
+            :param IsogeoScanUtils app: utils instance used to execute the plan
+            :param dict results: output of execute()
+            :param str csv_name: filename suffix (extension excluded)
+            :param str folder: parent folder where to write the files
+        """
+        scope = app.def_wg if self.wg == 1 else "DB"
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        outputs = []
+        for report in self.reports:
+            # export stage, when memory is profiled
+            with stage(getattr(app, "profiler", None), "write_" + report):
+                if report == "csv":
+                    app.csv_report(
+                        "{}.csv".format(csv_name),
+                        wg=self.wg,
+                        folder=folder,
+                        stats={"colls": results.get(("colls_stats", self.wg))},
+                    )
+                    if self.wg == 1:
+                        out = "ScanFME_Report_{}_{}_{}.csv".format(
+                            app.platform.upper(), app.def_wg, csv_name
+                        )
+                    else:
+                        out = "ScanFME_Report_{}_DB_{}.csv".format(
+                            app.platform, csv_name
+                        )
+                elif report == "workers":
+                    app.workers_report(
+                        "{}.csv".format(csv_name),
+                        folder=folder,
+                        wks=results.get(("wk_diagnosis", 0)),
+                    )
+                    out = "ScanFME_Report_Workers_{}_{}.csv".format(
+                        app.platform, csv_name
+                    )
+                else:
+                    method = REPORTS.get(report)[0][0]
+                    out = "ScanFME_Report_{}_{}_{}_{}.json".format(
+                        app.platform.upper(), scope, report, csv_name
+                    )
+                    with open(path.join(folder, out), "w") as json_file:
+                        json_file.write(
+                            json_util.dumps(results.get((method, self.wg)), indent=2)
+                        )
+            outputs.append(path.normpath(path.join(folder, out)))
+
+        return outputs
+
+    def archive(self, app, outputs: list, archive, created=None) -> list:
+        """
+            Add written outputs to a reports archive. Returns the outputs
+             which changed since their previous version.
+
+            :param IsogeoScanUtils app: utils instance used to execute the plan
+            :param list outputs: output of write()
+            :param ReportArchive archive: reports archive
+            :param datetime created: reports date, defaults to now
+        """
+        changed = []
+        for report, output in zip(self.reports, outputs):
+            # whole database reports, whatever the plan scope
+            if self.wg == 1 and REPORTS.get(report)[0][1] != 0:
+                scope = app.def_wg
+            else:
+                scope = "DB"
+            if archive.add(output, app.platform, scope, report, created):
+                changed.append(output)
+            else:
+                pass
+        return changed
@@ -0,0 +1,406 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Memory profiling, opt-in: methods and export stages run under a profiler
+     record Python allocations (tracemalloc) and the resident set size of the
+     process, sampled in the background. The profile gives the peak memory,
+     allocation hot spots and the overhead per document of each stage, as
+     JSON written next to the reports.
+
+    Stages are inclusive: a method calling others accounts for their memory
+     too. Stages running concurrently share the process peaks.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from contextlib import contextmanager
+from datetime import datetime
+import functools
+import json
+import logging
+import os
+import platform
+import threading
+import time
+import tracemalloc
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.profiling")
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def rss() -> int:
+    """Resident set size of the process in bytes, None if unknown."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def _task() -> int:
+    """Identifier of the running greenlet, or thread without greenlets."""
+    try:
+        from greenlet import getcurrent
+
+        return id(getcurrent())
+    except ImportError:
+        return threading.get_ident()
+
+
+def profiled(method):
+    """
+        Run a method as a stage of the profiler of its instance, if any.
+
+        :param method: method of an object with a 'profiler' attribute
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with stage(getattr(self, "profiler", None), method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def stage(profiler: "MemoryProfiler", name: str):
+    """
+        Profile a block as a stage, doing nothing without profiler.
+
+        :param MemoryProfiler profiler: running profiler, or None
+        :param str name: stage name
+    """
+    if profiler is None:
+        yield None
+    else:
+        with profiler.stage(name) as record:
+            yield record
+
+
+def documents(profiler: "MemoryProfiler", count: int):
+    """
+        Account documents processed by the running stages, if profiled.
+
+        :param MemoryProfiler profiler: running profiler, or None
+        :param int count: number of documents
+    """
+    if profiler is not None and count:
+        profiler.documents(count)
+    else:
+        pass
+
+
+def regressions(baseline: dict, profile: dict, tolerance: float = 0.2) -> list:
+    """
+        Stages whose peak memory grew beyond a tolerance, compared to a
+         baseline profile, as messages.
+
+        :param dict baseline: profile of a reference run
+        :param dict profile: profile to check
+        :param float tolerance: allowed growth, as a ratio
+    """
+    messages = []
+    for name, stats in sorted(profile.get("stages", {}).items()):
+        before = baseline.get("stages", {}).get(name)
+        if before is None:
+            continue
+        else:
+            pass
+        for metric in ("peak_increase", "per_document"):
+            old, new = before.get(metric), stats.get(metric)
+            if old and new and new > old * (1 + tolerance):
+                messages.append(
+                    "{}: {} grew from {:.0f} to {:.0f} bytes.".format(
+                        name, metric, old, new
+                    )
+                )
+            else:
+                pass
+    return messages
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class StageStats(object):
+    """Memory used by the calls of a stage."""
+
+    __slots__ = (
+        "name",
+        "calls",
+        "seconds",
+        "docs",
+        "allocated",
+        "peak",
+        "peak_increase",
+        "rss_peak",
+        "hotspots",
+    )
+
+    def __init__(self, name: str):
+        """:param str name: stage name"""
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.docs = 0
+        self.allocated = 0
+        self.peak = 0
+        self.peak_increase = 0
+        self.rss_peak = None
+        self.hotspots = []
+
+    def as_dict(self) -> dict:
+        """Stage statistics, sizes in bytes."""
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 3),
+            "documents": self.docs,
+            "allocated": self.allocated,
+            "peak": self.peak,
+            "peak_increase": self.peak_increase,
+            "per_document": self.peak_increase / self.docs if self.docs else None,
+            "rss_peak": self.rss_peak,
+            "hotspots": self.hotspots,
+        }
+
+
+class _Frame(object):
+    """A stage call running."""
+
+    __slots__ = ("stats", "start", "traced", "peak", "rss_peak", "snapshot")
+
+    def __init__(self, stats: StageStats, traced: int, snapshot=None):
+        self.stats = stats
+        self.start = time.monotonic()
+        self.traced = traced
+        self.peak = traced
+        self.rss_peak = rss()
+        self.snapshot = snapshot
+
+
+class MemoryProfiler(object):
+    """Profile memory of stages: traced allocations and sampled RSS."""
+
+    def __init__(self, frames: int = 1, top: int = 10, interval: float = 0.05):
+        """
+            :param int frames: frames stored by allocation traceback
+            :param int top: allocation hot spots kept by stage
+            :param float interval: seconds between two RSS samples
+        """
+        self.frames = frames
+        self.top = top
+        self.interval = interval
+        self.stages = {}
+        self.rss_peak = rss()
+        self.peak = 0
+        self.started = None
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+        self._tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """Start tracing allocations and sampling RSS."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._tracing = True
+        else:
+            pass
+        self.started = datetime.utcnow()
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        """Stop sampling, and tracing if started by the profiler."""
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        else:
+            pass
+        self._collect()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        else:
+            pass
+
+    def _sample(self):
+        """
+            Sample RSS until stopped, for the profile and running stages, and
+             traced memory where its peak can't be reset.
+        """
+        while not self._stopped.wait(self.interval):
+            value = rss()
+            if not hasattr(tracemalloc, "reset_peak"):
+                self._collect()
+            else:
+                pass
+            if value is None:
+                continue
+            else:
+                pass
+            with self._lock:
+                self.rss_peak = max(self.rss_peak or 0, value)
+                for stack in self._stacks.values():
+                    for frame in stack:
+                        frame.rss_peak = max(frame.rss_peak or 0, value)
+
+    def _collect(self) -> int:
+        """
+            Report the traced peak to every running stage and reset it, so
+             that nested stages get their own peak. Returns traced memory.
+
+            Python < 3.9 can't reset the peak, which is since the start of
+             tracing: stages get traced memory instead, sampled in between.
+        """
+        if not tracemalloc.is_tracing():
+            return 0
+        else:
+            pass
+        traced, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+            stage_peak = peak
+        else:
+            stage_peak = traced
+        with self._lock:
+            self.peak = max(self.peak, peak)
+            for stack in self._stacks.values():
+                for frame in stack:
+                    frame.peak = max(frame.peak, stage_peak)
+        return traced
+
+    def _hotspots(self, snapshot) -> list:
+        """Lines which allocated the most since a snapshot."""
+        stats = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+        return [
+            {
+                "line": "{}:{}".format(
+                    stat.traceback[0].filename, stat.traceback[0].lineno
+                ),
+                "size": stat.size_diff,
+                "count": stat.count_diff,
+            }
+            for stat in stats[: self.top]
+            if stat.size_diff > 0
+        ]
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+            Profile a block as a stage. Allocation hot spots are computed for
+             outermost stages only, snapshots being costly.
+
+            :param str name: stage name
+        """
+        task = _task()
+        with self._lock:
+            stack = self._stacks.setdefault(task, [])
+            stats = self.stages.setdefault(name, StageStats(name))
+        traced = self._collect()
+        outermost = not stack and tracemalloc.is_tracing()
+        frame = _Frame(
+            stats, traced, tracemalloc.take_snapshot() if outermost else None
+        )
+        with self._lock:
+            stack.append(frame)
+        try:
+            yield stats
+        finally:
+            traced = self._collect()
+            with self._lock:
+                stack.remove(frame)
+                if not stack:
+                    del self._stacks[task]
+                else:
+                    pass
+                stats.calls += 1
+                stats.seconds += time.monotonic() - frame.start
+                stats.allocated += traced - frame.traced
+                stats.peak = max(stats.peak, frame.peak)
+                stats.peak_increase = max(
+                    stats.peak_increase, frame.peak - frame.traced
+                )
+                if frame.rss_peak is not None:
+                    stats.rss_peak = max(stats.rss_peak or 0, frame.rss_peak)
+                else:
+                    pass
+            if frame.snapshot is not None:
+                hotspots = self._hotspots(frame.snapshot)
+                if sum(h.get("size") for h in hotspots) >= sum(
+                    h.get("size") for h in stats.hotspots
+                ):
+                    stats.hotspots = hotspots
+                else:
+                    pass
+            else:
+                pass
+
+    def documents(self, count: int):
+        """
+            Account documents processed by the running stages of the caller.
+
+            :param int count: number of documents
+        """
+        with self._lock:
+            for frame in self._stacks.get(_task(), ()):
+                frame.stats.docs += count
+
+    def profile(self) -> dict:
+        """Profile of every stage, sizes in bytes."""
+        self._collect()
+        return {
+            "created": (self.started or datetime.utcnow()).isoformat(),
+            "python": platform.python_version(),
+            "peak": self.peak,
+            "rss_peak": self.rss_peak,
+            "stages": {
+                name: stats.as_dict() for name, stats in sorted(self.stages.items())
+            },
+        }
+
+    def write(self, filepath: str) -> dict:
+        """
+            Write the profile as JSON. Returns the profile.
+
+            :param str filepath: path to the JSON file
+        """
+        profile = self.profile()
+        with open(filepath, "w") as json_file:
+            json.dump(profile, json_file, indent=2)
+        logger.info(
+            "Memory profile written to {}: peak {} bytes traced, RSS {}.".format(
+                filepath, profile.get("peak"), profile.get("rss_peak")
+            )
+        )
+        return profile
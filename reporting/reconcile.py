@@ -0,0 +1,229 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Reconciliation of datasets without isogeo_id: Isogeo metadata records,
+     exported to a local file, are indexed by workgroup and technical name.
+     Unmatched datasets are then streamed and looked up in the index, one
+     dictionary access by dataset, into a match report and, optionally, a
+     journaled batched update (see remediation).
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from collections import Counter
+import csv
+import json
+import logging
+from pathlib import Path
+
+# modules
+from .formats import register_dialects
+from .remediation import Change
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.reconcile")
+
+# outcomes of a lookup
+MATCHED, AMBIGUOUS, UNMATCHED = "matched", "ambiguous", "unmatched"
+
+# fields of the match report
+FIELDNAMES = ("_id", "groupId", "featureType", "status", "isogeo_id")
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def normalize(name) -> str:
+    """Key of a technical name: case and surrounding spaces ignored."""
+    return str(name).strip().lower() if name is not None else ""
+
+
+def _field(record: dict, field: str):
+    """Value of a field, dotted paths (JSON records) included."""
+    if field in record:
+        return record.get(field)
+    else:
+        pass
+    value = record
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def matches(backend, index: "RecordIndex", scope: dict = None):
+    """
+        Stream datasets without isogeo_id, as (dataset, status, isogeo_id).
+
+        :param Backend backend: storage backend
+        :param RecordIndex index: Isogeo records
+        :param dict scope: filter on datasets, e.g. a workgroup
+    """
+    query = dict(scope or {}, isogeo_id={"$exists": False})
+    docs = backend.find(
+        "datasets",
+        query,
+        projection={"groupId": 1, "featureType": 1, "name": 1},
+        sort=[("_id", 1)],
+    )
+    for doc in docs:
+        status, isogeo_id = index.lookup(
+            doc.get("groupId"), doc.get("featureType"), doc.get("name")
+        )
+        yield doc, status, isogeo_id
+
+
+def reconcile(
+    backend, index: "RecordIndex", csv_out: str, scope: dict = None, remediation=None
+) -> Counter:
+    """
+        Write the match report of datasets without isogeo_id and, given a
+         remediation, set the isogeo_id of matched datasets by batches.
+         Returns the number of datasets by status.
+
+        :param Backend backend: storage backend
+        :param RecordIndex index: Isogeo records
+        :param str csv_out: path to the match report
+        :param dict scope: filter on datasets, e.g. a workgroup
+        :param Remediation remediation: applies the updates, None for a dry run
+    """
+    register_dialects()
+    counts = Counter()
+    with open(csv_out, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=FIELDNAMES)
+        writer.writeheader()
+
+        def changes():
+            for doc, status, isogeo_id in matches(backend, index, scope):
+                counts[status] += 1
+                writer.writerow(
+                    {
+                        "_id": doc.get("_id"),
+                        "groupId": doc.get("groupId"),
+                        "featureType": doc.get("featureType"),
+                        "status": status,
+                        "isogeo_id": isogeo_id or "",
+                    }
+                )
+                if status == MATCHED:
+                    yield Change(
+                        "datasets",
+                        "set",
+                        doc,
+                        fields={"isogeo_id": isogeo_id},
+                        reason="reconciled on name",
+                    )
+                else:
+                    pass
+
+        if remediation is None:
+            for change in changes():
+                pass
+        else:
+            remediation.apply(changes())
+    logger.info("Datasets without isogeo_id: {}".format(dict(counts)))
+    return counts
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class RecordIndex(object):
+    """Isogeo records ids by (workgroup, technical name)."""
+
+    def __init__(self):
+        self.ids = {}
+        # keys shared by several records: never matched
+        self.ambiguous = set()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, wg: str, name: str, isogeo_id: str):
+        """
+            Index a record.
+
+            :param str wg: workgroup UUID
+            :param str name: technical name of the record
+            :param str isogeo_id: record UUID
+        """
+        key = (wg, normalize(name))
+        if not wg or not key[1] or not isogeo_id:
+            return
+        elif self.ids.get(key, isogeo_id) != isogeo_id:
+            self.ambiguous.add(key)
+        else:
+            self.ids[key] = isogeo_id
+
+    def lookup(self, wg: str, *names) -> tuple:
+        """
+            Match a dataset, as (status, isogeo_id), trying its names in order.
+
+            :param str wg: workgroup UUID
+            :param names: featureType, name...
+        """
+        for name in names:
+            key = (wg, normalize(name))
+            if key in self.ambiguous:
+                return AMBIGUOUS, None
+            elif key in self.ids:
+                return MATCHED, self.ids.get(key)
+            else:
+                pass
+        return UNMATCHED, None
+
+    @classmethod
+    def from_file(
+        cls,
+        filepath: str,
+        id_field: str = "_id",
+        wg_field: str = "_creator._id",
+        name_field: str = "name",
+    ) -> "RecordIndex":
+        """
+            Load records from a JSON (list or lines of objects) or CSV (pipe or
+             comma separated) export.
+
+            :param str filepath: path to the export
+            :param str id_field: field of the record UUID
+            :param str wg_field: field of the workgroup UUID, dotted in JSON
+            :param str name_field: field of the technical name
+        """
+        index = cls()
+        path = Path(filepath)
+        with path.open(newline="") as records_file:
+            if path.suffix.lower() == ".csv":
+                register_dialects()
+                sample = records_file.readline()
+                records_file.seek(0)
+                records = csv.DictReader(
+                    records_file, dialect="pipe" if "|" in sample else "excel"
+                )
+            elif records_file.read(1) == "[":
+                records_file.seek(0)
+                records = json.load(records_file)
+            else:
+                records_file.seek(0)
+                records = (json.loads(line) for line in records_file if line.strip())
+            for record in records:
+                index.add(
+                    _field(record, wg_field),
+                    _field(record, name_field),
+                    _field(record, id_field),
+                )
+        logger.info(
+            "{} records indexed from {}, {} ambiguous names.".format(
+                len(index), filepath, len(index.ambiguous)
+            )
+        )
+        return index
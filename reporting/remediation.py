@@ -0,0 +1,317 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Bulk remediation: fixes are first planned (dry run) as a list of
+     changes, which can be reviewed, then applied by batches of bulk writes.
+     Each batch is recorded in a journal before being written, so that a
+     run can be undone, even partially applied.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from collections import Counter
+from itertools import groupby
+import logging
+import os
+
+# 3rd party library
+from bson import ObjectId, json_util
+
+# modules
+from .throttle import throttled
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.remediation")
+
+# collections which can be purged of old documents
+PURGEABLE = ("procdatasets", "sessions")
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def _keeper(docs: list) -> dict:
+    """Dataset kept among duplicates: the newest matched one, else the newest."""
+    matched = [doc for doc in docs if doc.get("isogeo_id")]
+    return (matched or docs)[-1]
+
+
+def plan_dedupe(backend, scope: dict = None) -> list:
+    """
+        Plan the deletion of duplicated datasets: same workgroup and same
+         featureType. The newest dataset matched with Isogeo is kept, or the
+         newest one if none is matched.
+
+        Duplicated keys are grouped by the server with their identifiers:
+         only whole documents to delete are read then. Datasets without
+         workgroup are left aside.
+
+        :param Backend backend: storage backend
+        :param dict scope: filter on datasets, e.g. a workgroup
+    """
+    duplicates = backend.aggregate(
+        "datasets",
+        [
+            {"$match": dict(scope or {}, featureType={"$exists": True})},
+            {
+                "$group": {
+                    "_id": {"groupId": "$groupId", "featureType": "$featureType"},
+                    "count": {"$sum": 1},
+                    "docs": {"$push": {"_id": "$_id", "isogeo_id": "$isogeo_id"}},
+                }
+            },
+            {"$match": {"count": {"$gt": 1}}},
+        ],
+    )
+    changes = []
+    for group in sorted(
+        duplicates,
+        key=lambda group: (
+            str(group.get("_id").get("groupId")),
+            str(group.get("_id").get("featureType")),
+        ),
+    ):
+        key = group.get("_id")
+        # MongoDB drops a missing groupId from the key: datasets without
+        # workgroup aren't duplicates of each other
+        if key.get("groupId") is None:
+            continue
+        else:
+            pass
+        docs = sorted(group.get("docs"), key=lambda doc: doc.get("_id"))
+        keeper = _keeper(docs)
+        deleted = [doc.get("_id") for doc in docs if doc is not keeper]
+        query = {
+            "_id": {"$in": deleted},
+            "groupId": key.get("groupId"),
+            "featureType": key.get("featureType"),
+        }
+        for doc in backend.find("datasets", query, sort=[("_id", 1)]):
+            changes.append(
+                Change(
+                    "datasets",
+                    "delete",
+                    doc,
+                    reason="duplicate of {}".format(keeper.get("_id")),
+                )
+            )
+    return changes
+
+
+def plan_purge(backend, coll: str, before, scope: dict = None) -> list:
+    """
+        Plan the deletion of documents created before a date, from their
+         ObjectId.
+
+        :param Backend backend: storage backend
+        :param str coll: collection to purge, among PURGEABLE
+        :param datetime before: creation date limit (excluded)
+        :param dict scope: filter on documents, e.g. a workgroup
+    """
+    if coll not in PURGEABLE:
+        raise ValueError("Collection can't be purged: {}".format(coll))
+    else:
+        pass
+    query = dict(scope or {}, _id={"$lt": ObjectId.from_datetime(before)})
+    return [
+        Change(coll, "delete", doc, reason="created before {}".format(before))
+        for doc in backend.find(coll, query, sort=[("_id", 1)])
+    ]
+
+
+def plan_backfill(backend, coll: str, field: str, value, scope: dict = None) -> list:
+    """
+        Plan setting a default value where a field is missing.
+
+        :param Backend backend: storage backend
+        :param str coll: collection name
+        :param str field: field to fill
+        :param value: value to set
+        :param dict scope: filter on documents, e.g. a workgroup
+    """
+    query = dict(scope or {}, **{field: {"$exists": False}})
+    return [
+        Change(coll, "set", doc, fields={field: value}, reason="missing " + field)
+        for doc in backend.find(coll, query, sort=[("_id", 1)])
+    ]
+
+
+def write_plan(changes: list, plan_out: str) -> Counter:
+    """
+        Write planned changes as JSON lines, for review. Returns the number of
+         changes by (collection, action).
+
+        :param list changes: planned changes
+        :param str plan_out: path to the output file
+    """
+    with open(plan_out, "w") as plan_file:
+        for change in changes:
+            plan_file.write(json_util.dumps(change.as_dict()) + "\n")
+    return Counter((change.coll, change.action) for change in changes)
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class Change(object):
+    """A planned change of a document, with what is needed to revert it."""
+
+    __slots__ = ("coll", "action", "_id", "fields", "before", "missing", "reason")
+
+    def __init__(
+        self, coll: str, action: str, doc: dict, fields: dict = None, reason: str = ""
+    ):
+        """
+            :param str coll: collection name
+            :param str action: "delete" or "set"
+            :param dict doc: current document
+            :param dict fields: new values, for "set"
+            :param str reason: why the change is planned
+        """
+        if action not in ("delete", "set"):
+            raise ValueError("Unknown action: {}".format(action))
+        else:
+            pass
+        self.coll = coll
+        self.action = action
+        self._id = doc.get("_id")
+        self.fields = fields or {}
+        self.reason = reason
+        if action == "delete":
+            self.before = doc
+            self.missing = []
+        else:
+            self.before = {f: doc.get(f) for f in self.fields if f in doc}
+            self.missing = [f for f in self.fields if f not in doc]
+
+    def operation(self) -> tuple:
+        """Bulk operation applying the change (see Backend.bulk_write)."""
+        if self.action == "delete":
+            return ("delete", self._id)
+        else:
+            return ("set", self._id, self.fields, [])
+
+    def as_dict(self) -> dict:
+        return {
+            "coll": self.coll,
+            "action": self.action,
+            "_id": self._id,
+            "fields": self.fields,
+            "before": self.before,
+            "missing": self.missing,
+            "reason": self.reason,
+        }
+
+    @staticmethod
+    def inverse(entry: dict) -> tuple:
+        """
+            Bulk operation reverting a journal entry.
+
+            :param dict entry: journal entry, see as_dict()
+        """
+        if entry.get("action") == "delete":
+            return ("restore", entry.get("before"))
+        else:
+            return ("set", entry.get("_id"), entry.get("before"), entry.get("missing"))
+
+
+class Remediation(object):
+    """Apply planned changes by batches, journaled to be undone."""
+
+    def __init__(
+        self,
+        backend,
+        journal: str,
+        batch_size: int = 500,
+        ordered: bool = False,
+        throttle=None,
+    ):
+        """
+            :param Backend backend: storage backend
+            :param str journal: path to the JSON lines journal
+            :param int batch_size: operations by bulk write
+            :param bool ordered: stop a batch at its first error
+            :param AdaptiveThrottle throttle: limits and paces bulk writes
+        """
+        self.backend = backend
+        self.journal = journal
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.throttle = throttle
+
+    def _batches(self, changes):
+        """Consecutive changes of a collection, in batches."""
+        coll, batch = None, []
+        for change in changes:
+            if batch and (change.coll != coll or len(batch) >= self.batch_size):
+                yield coll, batch
+                batch = []
+            else:
+                pass
+            coll = change.coll
+            batch.append(change)
+        if batch:
+            yield coll, batch
+        else:
+            pass
+
+    def _write(self, coll: str, operations: list) -> Counter:
+        """Run a bulk write, paced by the throttle."""
+        if self.throttle is not None:
+            self.throttle.pace()
+        else:
+            pass
+        with throttled(self.throttle):
+            return Counter(
+                self.backend.bulk_write(coll, operations, ordered=self.ordered)
+            )
+
+    def apply(self, changes) -> Counter:
+        """
+            Apply changes, in order. Each batch is appended to the journal, and
+             synced, before being written. Returns counts of the bulk writes.
+
+            :param changes: iterable of planned changes, streamed
+        """
+        counts, applied = Counter(), 0
+        with open(self.journal, "a") as journal:
+            for coll, batch in self._batches(changes):
+                for change in batch:
+                    journal.write(json_util.dumps(change.as_dict()) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+                counts += self._write(coll, [change.operation() for change in batch])
+                applied += len(batch)
+        logger.info("{} changes applied: {}".format(applied, dict(counts)))
+        return counts
+
+    def undo(self) -> Counter:
+        """
+            Revert the changes recorded in the journal, latest first. Changes
+             journaled but not written are reverted harmlessly. Returns counts
+             of the bulk writes.
+        """
+        with open(self.journal) as journal:
+            entries = [json_util.loads(line) for line in journal if line.strip()]
+        counts = Counter()
+        entries.reverse()
+        for coll, group in groupby(entries, key=lambda entry: entry.get("coll")):
+            group = list(group)
+            for i in range(0, len(group), self.batch_size):
+                counts += self._write(
+                    coll,
+                    [Change.inverse(entry) for entry in group[i : i + self.batch_size]],
+                )
+        logger.info("{} changes reverted: {}".format(len(entries), dict(counts)))
+        return counts
@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Lazy report: every metric of the diagnosis methods is available, but none
+     is computed before it is accessed. Metrics required together are
+     grouped by diagnosis method, so that each method runs once, restricted
+     to the requested metrics.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import logging
+
+# modules
+from .window import to_datetime
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.report")
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class Report(object):
+    """Diagnosis metrics computed on first access, in batches."""
+
+    def __init__(self, app, metrics: dict, wg: bool = 1, since=None, until=None):
+        """
+            :param IsogeoScanUtils app: connected utils instance
+            :param dict metrics: diagnosis method by metric name
+            :param bool wg: scope of the report, default workgroup or whole DB
+            :param since: documents created from, datetime or timedelta back
+                          from now
+            :param until: documents created before, datetime or timedelta
+                          back from now
+        """
+        if wg not in (0, 1):
+            raise ValueError("A boolean value is required.")
+        else:
+            pass
+
+        self.app = app
+        self.metrics = metrics
+        self.wg = wg
+        # bounds are fixed once, for every batch of the report
+        self.since, self.until = to_datetime(since), to_datetime(until)
+        self.values = {}
+        self.pending = set()
+        self.batches = 0
+
+    def __getitem__(self, name: str):
+        """Value of a metric, computed with every pending metric if needed."""
+        return self.get(name).get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.metrics
+
+    def require(self, *names) -> "Report":
+        """
+            Declare metrics needed later, to compute them in the same batch.
+
+            :param str names: metric names, among metrics keys
+        """
+        unknown = set(names) - set(self.metrics)
+        if unknown:
+            raise KeyError(
+                "Unknown metrics: {}. Available: {}".format(
+                    ", ".join(sorted(unknown)), ", ".join(sorted(self.metrics))
+                )
+            )
+        else:
+            pass
+        self.pending.update(name for name in names if name not in self.values)
+        return self
+
+    def get(self, *names) -> dict:
+        """
+            Values of metrics, computing the missing ones with every pending
+             metric. Metrics not applicable to the scope or timed out are None.
+
+            :param str names: metric names, among metrics keys
+        """
+        self.require(*names)
+        if self.pending:
+            self._compute()
+        else:
+            pass
+        return {name: self.values.get(name) for name in names}
+
+    def update(self, values: dict):
+        """
+            Reuse metrics already computed, e.g. by a report plan.
+
+            :param dict values: metric values by name
+        """
+        self.values.update(
+            (name, value) for name, value in values.items() if name in self.metrics
+        )
+        self.pending.difference_update(values)
+
+    def _compute(self):
+        """Run each diagnosis method once for the pending metrics."""
+        batches = {}
+        for name in self.pending:
+            batches.setdefault(self.metrics.get(name), set()).add(name)
+        for method, names in sorted(batches.items()):
+            logger.debug("Running {}({}) for {}".format(method, self.wg, len(names)))
+            result = getattr(self.app, method)(
+                self.wg, since=self.since, until=self.until, only=names
+            )
+            # dependencies (e.g. counts of 'last' metrics) are kept as well
+            self.values.update(result or {})
+            for name in names:
+                self.values.setdefault(name, None)
+        self.batches += len(batches)
+        self.pending.clear()
@@ -11,44 +11,46 @@
 # ##################################
 
 # Standard library
-import configparser
+from contextlib import contextmanager
+from copy import copy
 import csv
+from datetime import datetime, timezone
 import logging
-from logging.handlers import RotatingFileHandler
 from os import path
 from pathlib import Path
-import pprint
-from urllib.parse import quote_plus
 
 # 3rd party library
-import click
-from gevent import monkey
+from bson import json_util
+from pymongo import ASCENDING
+from pymongo.errors import (
+    ConnectionFailure,
+    ExecutionTimeout,
+    ServerSelectionTimeoutError,
+)
 
-monkey.patch_all()
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+# modules
+from .backends import Backend, MongoBackend
+from .backlog import backlog_pipeline, summarize
+from .budget import TimeBudget
+from .checkpoint import Checkpoint, CheckpointedWriter
+from .connection import ConnectionManager, RetryPolicy
+from .errors import FAILED_STATES, ErrorScan
+from .formats import register_dialects
+from .logs import register_secret
+from .partition import CsvExport, MongoOpener, PartitionedScan
+from .pipeline import WRITE_BUFFER, Pipeline
+from .profiling import MemoryProfiler, documents, profiled
+from .report import Report
+from .summary import RQ_STATES, SUMMARY, refresh, summary_pipelines, totals
+from .throttle import AdaptiveThrottle, throttled
+from .window import id_window, to_datetime, window_key
 
 # #############################################################################
 # ########## Globals ###############
 # ##################################
 
-# required subfolders
-dir_reports = Path("reports/").mkdir(exist_ok=True)
-
-# settings
-log_lvl = logging.DEBUG
-
-# LOG FILE ##
+# logger: handlers are set by the entry point, see logs.setup_logging()
 logger = logging.getLogger("isogeo_scanfme_utils")
-logging.captureWarnings(True)
-logger.setLevel(log_lvl)
-log_form = logging.Formatter(
-    "%(asctime)s || %(levelname)s " "|| %(module)s || %(lineno)s || %(message)s"
-)
-logfile = RotatingFileHandler("LOG_ScanFME_Utils.log", "a", 5000000, 1)
-logfile.setLevel(log_lvl)
-logfile.setFormatter(log_form)
-logger.addHandler(logfile)
 
 # collections
 d_colls = {
@@ -61,8 +63,34 @@ d_colls = {
     "subscriptions": "Isogeo Worker clients registered | ABBRV: SB",
 }
 
-# CSV settings (see: https://pymotw.com/3/csv/)
-csv.register_dialect("pipe", delimiter="|", escapechar="\\", skipinitialspace=1)
+# metrics of the diagnosis methods, by name, for lazy reports
+METRICS = dict(
+    [(coll, "colls_stats") for coll in d_colls]
+    + [("no_isogeo_id", "ds_diagnosis")]
+    + [
+        (name, "rq_diagnosis")
+        for state, metric, field in RQ_STATES
+        for name in (metric, metric + "_last")
+    ]
+    + [
+        (name, "wk_diagnosis")
+        for name in ("srvs_uptodate", "srvs_outdated", "srvs_no_created")
+    ]
+    + [("srvs_no_install", "wk_diagnosis")]
+)
+
+# CSV report columns counting documents, by collection
+CSV_COUNTS = (
+    ("wg_ds_count", "datasets"),
+    ("wg_ep_count", "entrypoints"),
+    ("wg_wk_count", "subscriptions"),
+    ("wg_rq_count", "requests"),
+    ("wg_gd_count", "geodatabases"),
+    ("wg_pd_count", "procdatasets"),
+)
+
+# queries run by a CSV report: one count per column
+CSV_REPORT_QUERIES = len(CSV_COUNTS)
 
 
 # #############################################################################
@@ -74,7 +102,16 @@ class IsogeoScanUtils(object):
     """Make easy to get some metrics about Scan FME usage."""
 
     def __init__(
-        self, access: dict, def_wg: str = None, platform="qa", wk_v: str = "2.1.0"
+        self,
+        access: dict,
+        def_wg: str = None,
+        platform="qa",
+        wk_v: str = "2.1.0",
+        retry: RetryPolicy = None,
+        backend: Backend = None,
+        summary: bool = False,
+        throttle: AdaptiveThrottle = None,
+        profiler: MemoryProfiler = None,
     ):
         """
             Instanciate class, check parameters and add object attributes.
@@ -84,6 +121,16 @@ class IsogeoScanUtils(object):
             :param str def_wg: default workgroup UUID to use
             :param str platform: cluster to use qa or prod
             :param str wk_v: service Isogeo worker reference version
+            :param RetryPolicy retry: backoff applied to connection and reads
+            :param Backend backend: storage backend to use instead of
+                                    connecting to MongoDB (e.g. in memory)
+            :param bool summary: read counts from the summary collection
+                                 (see refresh_summary) instead of counting
+                                 documents
+            :param AdaptiveThrottle throttle: adapt queries concurrency and
+                                              batches rate to the cluster load
+            :param MemoryProfiler profiler: profile memory of methods and
+                                            export stages
         """
         # check parameters
         if platform.lower() not in ("qa", "prod"):
@@ -108,11 +155,19 @@ class IsogeoScanUtils(object):
         self.platform = platform
         self.user = access.get("username")
         self.pswd = access.get("password")
+        register_secret(self.pswd)
         self.serv = access.get("server")
         self.port = access.get("port")
         self.db_name = access.get("db_name")
         self.rep_set = access.get("replicaSet")
         self.wk_vers = wk_v
+        self.retry = retry
+        self.budget = None
+        self.conn = None
+        self.backend = backend
+        self.use_summary = summary
+        self.throttle = throttle
+        self.profiler = profiler
 
     # -- CONNECTION -----------------------------------------------------------
 
@@ -122,7 +177,7 @@ class IsogeoScanUtils(object):
             uri = "mongodb://{}:{}@{}:{}/{}".format(
                 self.user, self.pswd, self.serv, self.port, self.db_name
             )
-            logger.debug("QA URI built: " + uri)
+            logger.debug("QA URI built for {}@{}".format(self.user, self.serv))
         elif self.platform == "prod":
             srv0, srv1 = self.serv.split("|")
             uri = "mongodb://{}:{}@{}:{},{}:{}/{}?replicaSet={}".format(
@@ -135,22 +190,40 @@ class IsogeoScanUtils(object):
                 self.db_name,
                 self.rep_set,
             )
-            logger.debug("PROD URI built: " + uri)
+            logger.debug("PROD URI built for {}@{}".format(self.user, self.serv))
         # method end
         return uri
 
     def connect(self) -> "pymongo client":
-        """Check connection and returns client object."""
-        self.client = MongoClient(self.uri())
+        """
+            Check connection and returns client object.
+
+            Connection is retried with backoff. Raises ConnectionFailure if the
+             cluster still doesn't answer once retries are exhausted.
+
+            If a backend has been given at instanciation, nothing is opened and
+             the backend is returned.
+        """
+        if self.backend is not None and not isinstance(self.backend, MongoBackend):
+            self.conn_state = 1
+            return self.backend
+        else:
+            pass
+
+        self.conn = ConnectionManager(self.uri(), policy=self.retry)
+        try:
+            self.client = self.conn.connect()
+        except ConnectionFailure as e:
+            logger.error("Server connection failed: {}".format(e))
+            raise
         self.db = self.client.get_default_database()
         self.conn_state = self.check_connection()
-
-        if self.conn_state:
-            self.collections_init()
+        self.collections_init()
+        self.backend = MongoBackend(self.db, self.conn)
+        if self.throttle is not None and self.throttle.status is None:
+            self.throttle.status = self.backend.server_status
         else:
-            logger.debug(
-                "Collections can't be filled because of " "lost server connection."
-            )
+            pass
 
         return self.client
 
@@ -167,6 +240,162 @@ class IsogeoScanUtils(object):
         self.colls = {coll: self.db.get_collection(coll) for coll in d_colls}
         pass
 
+    # -- TIME BUDGET -----------------------------------------------------------
+
+    @contextmanager
+    def time_budget(self, seconds: float, queries: int = 1):
+        """
+            Give an overall deadline to the queries run within the context.
+             Metrics which can't complete in time are set to None and listed
+             in the yielded budget 'timed_out' attribute.
+
+            :param float seconds: overall time allowed
+            :param int queries: expected number of queries to share it
+        """
+        self.budget = TimeBudget(seconds, queries)
+        try:
+            yield self.budget
+        finally:
+            self.budget = None
+
+    def _time_slice(self, metric: str):
+        """
+            Time allowed to the next query by the running budget, as
+             (allowed, max_time_ms). max_time_ms is None without budget.
+
+            :param str metric: metric name to report in case of time out
+        """
+        if self.budget is None:
+            return True, None
+        else:
+            pass
+        slice_ms = self.budget.slice_ms()
+        if not slice_ms:
+            self.budget.mark(metric)
+            return False, None
+        else:
+            return True, slice_ms
+
+    def _count(self, coll: str, query: dict, metric: str) -> int:
+        """
+            Count documents matching a query within the time budget.
+             Returns None if the metric timed out.
+
+            :param str coll: collection name
+            :param dict query: MongoDB filter
+            :param str metric: metric name to report in case of time out
+        """
+        allowed, max_time_ms = self._time_slice(metric)
+        if not allowed:
+            return None
+        try:
+            with throttled(self.throttle):
+                return self.backend.count(coll, query, max_time_ms=max_time_ms)
+        except ExecutionTimeout:
+            self.budget.mark(metric)
+            return None
+
+    def _first(self, coll: str, query: dict, metric: str, field: str):
+        """
+            Get a field of the first document matching a query within the
+             time budget. Returns None if the metric timed out.
+
+            :param str coll: collection name
+            :param dict query: MongoDB filter
+            :param str metric: metric name to report in case of time out
+            :param str field: document field to return
+        """
+        allowed, max_time_ms = self._time_slice(metric)
+        if not allowed:
+            return None
+        try:
+            with throttled(self.throttle):
+                doc = self.backend.first(coll, query, max_time_ms=max_time_ms)
+        except ExecutionTimeout:
+            self.budget.mark(metric)
+            return None
+        return ((doc or {}).get(field),)
+
+    def _find(self, coll: str, query: dict, metric: str, sort: list = None):
+        """
+            Iterate over documents matching a query within the time budget.
+             Returns None if the deadline is already reached.
+
+            :param str coll: collection name
+            :param dict query: MongoDB filter
+            :param str metric: metric name to report in case of time out
+            :param list sort: list of (field, direction)
+        """
+        allowed, max_time_ms = self._time_slice(metric)
+        if not allowed:
+            return None
+        return self.backend.find(coll, query, sort=sort, max_time_ms=max_time_ms)
+
+    # -- SUMMARY ---------------------------------------------------------------
+
+    @profiled
+    def refresh_summary(self) -> int:
+        """
+            Rebuild the summary collection: one document per workgroup with
+             collections counts, requests by state, unmatched datasets and
+             workers versions. Returns the number of workgroups.
+        """
+        return refresh(
+            self.backend,
+            summary_pipelines(tuple(d_colls), self._wk_queries(0)[:3]),
+            throttle=self.throttle,
+        )
+
+    def _summary(self, wg: bool = 1) -> dict:
+        """
+            Metrics read from the summary collection, in summary mode. None
+             otherwise, or if the summary has not been built yet.
+
+            :param bool wg: filter on the default workgroup
+        """
+        if not self.use_summary:
+            return None
+        elif self.backend.first(SUMMARY, {}) is None:
+            logger.warning("Summary not built yet: documents are counted.")
+            return None
+        elif wg == 1:
+            return self.backend.first(SUMMARY, {"_id": self.def_wg}) or {}
+        elif wg == 0:
+            return totals(self.backend.find(SUMMARY, {}))
+        else:
+            raise ValueError("A boolean value is required.")
+
+    # -- WORKGROUPS ------------------------------------------------------------
+
+    def copy(self) -> "IsogeoScanUtils":
+        """
+            Get an instance sharing the current connection, with its own time
+             budget, so that concurrent jobs don't clear each other's budgets.
+        """
+        clone = copy(self)
+        clone.budget = None
+        return clone
+
+    def workgroup(self, wg_id: str) -> "IsogeoScanUtils":
+        """
+            Get an instance bound to another default workgroup, sharing the
+             current connection.
+
+            :param str wg_id: workgroup UUID
+        """
+        if len(wg_id) != 32:
+            raise TypeError("Invalid workgroup UUID.")
+        else:
+            pass
+
+        clone = self.copy()
+        clone.def_wg = wg_id
+        return clone
+
+    def workgroups(self) -> list:
+        """Lists workgroups which have registered an Isogeo Worker."""
+        return sorted(self.backend.distinct("subscriptions", "groupId"))
+
     # -- SEARCH -----------------------------------------------------------
 
     def ds_is_duplicated(self, ds_name: str) -> bool:
@@ -175,59 +404,104 @@ class IsogeoScanUtils(object):
 
             :param str ds_name: dataset name to look for
         """
-        ct = (
-            self.colls.get("datasets")
-            .find({"groupId": self.def_wg, "featureType": ds_name})
-            .count()
+        ct = self.backend.count(
+            "datasets", {"groupId": self.def_wg, "featureType": ds_name}
         )
         return ct
 
     def get_ds_workgroup(self, workgroup_id: str):
         """Lists datasets which have been scanned by a specific workgroup."""
         counter = {
-            coll: self.db.get_collection(coll).find({"groupId": self.def_wg})
-            for coll in d_colls
+            coll: self.backend.find(coll, {"groupId": self.def_wg}) for coll in d_colls
         }
         return counter
 
     # -- METRICS -----------------------------------------------------------
 
-    def colls_stats(self, wg: bool = 1) -> dict:
+    def report(self, wg: bool = 1, since=None, until=None) -> Report:
+        """
+            Lazy report: metrics are computed when accessed, grouped by
+             diagnosis method. See METRICS for available metrics.
+
+            :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+        """
+        return Report(self, METRICS, wg, since, until)
+
+    @profiled
+    def colls_stats(
+        self, wg: bool = 1, since=None, until=None, only: set = None
+    ) -> dict:
         """
             Perform basic calculation about database.
 
             :param bool wg: option to filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: collections to count, all by default
         """
+        colls = [coll for coll in d_colls if only is None or coll in only]
+        window = id_window(since, until)
+        summary = None if window else self._summary(wg)
+        if summary is not None:
+            return {coll: summary.get(coll, 0) for coll in colls}
+        else:
+            pass
+
         if wg == 1:
             counter = {
-                coll: self.colls.get(coll).find({"groupId": self.def_wg}).count()
-                for coll in d_colls
+                coll: self._count(coll, {"groupId": self.def_wg, **window}, coll)
+                for coll in colls
             }
         elif wg == 0:
-            counter = {coll: self.db.get_collection(coll).count() for coll in d_colls}
+            counter = {coll: self._count(coll, dict(window), coll) for coll in colls}
         else:
             raise ValueError("A boolean value is required.")
 
         # method end
         return counter
 
-    def ds_diagnosis(self, wg: bool = 1) -> dict:
+    @profiled
+    def ds_diagnosis(
+        self, wg: bool = 1, since=None, until=None, only: set = None
+    ) -> dict:
         """
             Some diagnosis on datasets collection:
                 - count of scanned datasets without isogeo_id matching.
 
             :param bool wg: option to filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: metrics to compute, all by default
         """
-        datasets = self.colls.get("datasets")
+        if only is not None and "no_isogeo_id" not in only:
+            return {}
+        else:
+            pass
+
+        window = id_window(since, until)
+        summary = None if window else self._summary(wg)
+        if summary is not None:
+            return {"no_isogeo_id": summary.get("no_isogeo_id", 0)}
+        else:
+            pass
+
         if wg == 1:
             ds_report = {
-                "no_isogeo_id": datasets.find(
-                    {"groupId": self.def_wg, "isogeo_id": {"$exists": False}}
-                ).count()
+                "no_isogeo_id": self._count(
+                    "datasets",
+                    {"groupId": self.def_wg, "isogeo_id": {"$exists": False}, **window},
+                    "no_isogeo_id",
+                )
             }
         elif wg == 0:
             ds_report = {
-                "no_isogeo_id": datasets.find({"isogeo_id": {"$exists": False}}).count()
+                "no_isogeo_id": self._count(
+                    "datasets",
+                    {"isogeo_id": {"$exists": False}, **window},
+                    "no_isogeo_id",
+                )
             }
         else:
             raise ValueError("A boolean value is required.")
@@ -235,158 +509,269 @@ class IsogeoScanUtils(object):
         # method end
         return ds_report
 
-    def rq_diagnosis(self, wg: bool = 1):
+    @profiled
+    def rq_diagnosis(self, wg: bool = 1, since=None, until=None, only: set = None):
         """
-            Inform about requests.
+            Inform about requests: count of finished, broken and killed
+             requests, and the last one of each state (if any).
 
             :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: metrics to compute, all by default. A '_last'
+                             metric also computes its count.
         """
-        rqs = self.colls.get("requests")
+        states = [
+            (state, metric, field)
+            for state, metric, field in RQ_STATES
+            if only is None or metric in only or metric + "_last" in only
+        ]
+        window = id_window(since, until)
+        summary = None if window else self._summary(wg)
+        if summary is not None:
+            rq_report = {}
+            for state, metric, field in states:
+                rq_report[metric] = summary.get(metric, 0)
+                if rq_report.get(metric):
+                    rq_report[metric + "_last"] = (summary.get(metric + "_last"),)
+                else:
+                    rq_report[metric + "_last"] = None
+            return rq_report
+        else:
+            pass
+
         if wg == 1:
-            # finished requests
-            rq_finish = rqs.find({"groupId": self.def_wg, "state": "finished"}).count()
-            if rq_finish:
-                rq_finish_last = (
-                    rqs.find({"groupId": self.def_wg, "state": "finished"})
-                    .limit(1)[0]
-                    .get("_id"),
-                )
-            else:
-                rq_finish_last = None
-                pass
-            # broken requests
-            rq_broken = rqs.find({"groupId": self.def_wg, "state": "broken"}).count()
-            if rq_broken:
-                rq_broken_last = (
-                    rqs.find({"groupId": self.def_wg, "state": "broken"})
-                    .limit(1)[0]
-                    .get("err"),
-                )
-            else:
-                rq_broken_last = None
-                pass
-            # killed requests
-            rq_killed = rqs.find({"groupId": self.def_wg, "state": "killed"}).count()
-            if rq_killed:
-                rq_killed_last = (
-                    rqs.find({"groupId": self.def_wg, "state": "killed"})
-                    .limit(1)[0]
-                    .get("err"),
-                )
-            else:
-                rq_killed_last = None
-                pass
-            # storing
-            rq_report = {
-                "rq_finish": rq_finish,
-                "rq_finish_last": rq_finish_last,
-                "rq_broken": rq_broken,
-                "rq_broken_last": rq_broken_last,
-                "rq_killed": rq_killed,
-                "rq_killed_last": rq_killed_last,
-            }
+            scope = {"groupId": self.def_wg, **window}
         elif wg == 0:
-            # finished requests
-            rq_finish = rqs.find({"state": "finished"}).count()
-            if rq_finish:
-                rq_finish_last = (
-                    rqs.find({"state": "finished"}).limit(1)[0].get("_id"),
-                )
-            else:
-                rq_finish_last = None
-                pass
-            # broken requests
-            rq_broken = rqs.find({"state": "broken"}).count()
-            if rq_broken:
-                rq_broken_last = (rqs.find({"state": "broken"}).limit(1)[0].get("err"),)
-            else:
-                rq_broken_last = None
-                pass
-            # killed requests
-            rq_killed = rqs.find({"state": "killed"}).count()
-            if rq_killed:
-                rq_killed_last = (rqs.find({"state": "killed"}).limit(1)[0].get("err"),)
-            else:
-                rq_killed_last = None
-                pass
-            # storing
-            rq_report = {
-                "rq_finish": rq_finish,
-                "rq_finish_last": rq_finish_last,
-                "rq_broken": rq_broken,
-                "rq_broken_last": rq_broken_last,
-                "rq_killed": rq_killed,
-                "rq_killed_last": rq_killed_last,
-            }
+            scope = dict(window)
         else:
             raise ValueError("A boolean value is required.")
 
+        rq_report = {}
+        for state, metric, field in states:
+            query = dict(scope, state=state)
+            rq_report[metric] = self._count("requests", query, metric)
+            # the last request is only read if there is one
+            if rq_report.get(metric) and (only is None or metric + "_last" in only):
+                rq_report[metric + "_last"] = self._first(
+                    "requests", query, metric + "_last", field
+                )
+            else:
+                rq_report[metric + "_last"] = None
+
         # method end
         return rq_report
 
-    def wk_diagnosis(self, wg: bool = 1):
+    @profiled
+    def rq_backlog(self, wg: bool = 1, since=None, until=None) -> dict:
         """
-            Inform about installed services in a workgroup.
+            Requests not finished, broken nor killed yet (pending or running):
+             count, oldest age and age percentiles in seconds, by state, per
+             workgroup and overall. Computed by a single aggregation, cheap
+             enough to be polled: percentiles are rounded up to age buckets.
 
             :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
         """
-        wks = self.colls.get("subscriptions")
         if wg == 1:
-            wk_report = {
-                "srvs_uptodate": wks.find(
-                    {"groupId": self.def_wg, "workers.version": self.wk_vers}
-                ),
-                "srvs_outdated": wks.find(
-                    {
-                        "groupId": self.def_wg,
-                        "workers": {"$exists": 1},
-                        "workers.version": {"$ne": self.wk_vers},
-                    }
-                ),
-                "srvs_no_created": wks.find(
-                    {"groupId": self.def_wg, "workers": {"$exists": 0}}
-                ),
-            }
+            query = {"groupId": self.def_wg, **id_window(since, until)}
         elif wg == 0:
-            wk_report = {
-                "srvs_uptodate": wks.find({"workers.version": self.wk_vers}).sort(
-                    "groupId", ASCENDING
-                ),
-                "srvs_outdated": wks.find(
-                    {
+            query = id_window(since, until)
+        else:
+            raise ValueError("A boolean value is required.")
+
+        now = datetime.now(timezone.utc)
+        with throttled(self.throttle):
+            groups = self.backend.aggregate("requests", backlog_pipeline(query, now))
+        return summarize(groups, now)
+
+    def _wk_queries(self, wg: bool = 1, since=None, until=None) -> list:
+        """
+            Queries of the workers diagnosis, as (name, query).
+
+            :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+        """
+        if wg == 1:
+            scope = {"groupId": self.def_wg, **id_window(since, until)}
+        elif wg == 0:
+            scope = id_window(since, until)
+        else:
+            raise ValueError("A boolean value is required.")
+
+        queries = [
+            ("srvs_uptodate", dict(scope, **{"workers.version": self.wk_vers})),
+            (
+                "srvs_outdated",
+                dict(
+                    scope,
+                    **{
                         "workers": {"$exists": 1},
                         "workers.version": {"$ne": self.wk_vers},
                     }
-                ).sort("groupId", ASCENDING),
-                "srvs_no_created": wks.find({"workers": {"$exists": 0}}).sort(
-                    "groupId", ASCENDING
                 ),
-                "srvs_no_install": wks.find({"workers": {"$size": 0}}).sort(
-                    "groupId", ASCENDING
-                ),
-            }
+            ),
+            ("srvs_no_created", dict(scope, workers={"$exists": 0})),
+        ]
+        if wg == 0:
+            queries.append(("srvs_no_install", dict(scope, workers={"$size": 0})))
         else:
-            raise ValueError("A boolean value is required.")
+            pass
+        return queries
+
+    @profiled
+    def wk_diagnosis(self, wg: bool = 1, since=None, until=None, only: set = None):
+        """
+            Inform about installed services in a workgroup.
+
+            :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: metrics to compute, all by default
+        """
+        sort = [("groupId", ASCENDING)] if wg == 0 else None
+        wk_report = {
+            name: self._find("subscriptions", query, name, sort=sort)
+            for name, query in self._wk_queries(wg, since, until)
+            if only is None or name in only
+        }
 
         # method end
         return wk_report
 
+    # -- EXPORT ----------------------------------------------------------------
+
+    @profiled
+    def collection_export(
+        self,
+        coll: str,
+        csv_name: str,
+        fields: tuple,
+        wg: bool = 0,
+        folder: str = "./reports",
+        processes: int = None,
+        checkpoint: int = 10000,
+        since=None,
+        until=None,
+    ) -> int:
+        """
+            Export fields of a collection into a CSV file. The collection is
+             split into _id ranges scanned by a pool of processes. Returns the
+             number of exported rows.
+
+            Partitions and their progress are checkpointed next to the CSV
+             file: running the same export again after a failure only scans
+             what is left. The CSV file appears once complete.
+
+            :param str coll: collection name
+            :param str csv_name: CSV filename (extension required)
+            :param tuple fields: fields to export
+            :param bool wg: filter on the default workgroup
+            :param str folder: parent folder where to write the CSV file
+            :param int processes: pool size, defaults to the number of cores
+            :param int checkpoint: rows exported between two checkpoints
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+        """
+        if coll not in d_colls:
+            raise ValueError("Unknown collection: {}".format(coll))
+        else:
+            pass
+
+        if wg == 1:
+            query = {"groupId": self.def_wg}
+        elif wg == 0:
+            query = {}
+        else:
+            raise ValueError("A boolean value is required.")
+
+        csv_out = path.normpath(
+            path.join(
+                folder, "ScanFME_Export_{}_{}_{}".format(self.platform, coll, csv_name)
+            )
+        )
+        Path(folder).mkdir(parents=True, exist_ok=True)
+
+        # partitions and window of an interrupted run are kept to resume it
+        key = json_util.dumps(
+            {
+                "query": query,
+                "window": window_key(since, until),
+                "fields": list(fields),
+            },
+            sort_keys=True,
+        )
+        plan = Checkpoint(csv_out + ".plan")
+        state = plan.load()
+        resumed = state is not None and state.get("key") == key
+        if resumed:
+            query = state.get("query")
+            logger.info("{}: export resumed.".format(csv_out))
+        else:
+            query = dict(query, **id_window(since, until)) or None
+        scan = PartitionedScan(
+            MongoOpener(self.uri(), coll),
+            query=query,
+            projection={field: 1 for field in fields},
+            processes=processes,
+        )
+        if resumed:
+            scan.bounds = [tuple(bounds) for bounds in state.get("bounds")]
+        else:
+            scan.split(self.colls.get(coll))
+            plan.save({"key": key, "query": query, "bounds": scan.bounds})
+        rows = scan.run(CsvExport(csv_out, fields, every=checkpoint, key=key))
+        plan.clear()
+        documents(self.profiler, rows)
+        return rows
+
     # -- CSV REPORT ----------------------------------------------------------
 
-    def csv_report(self, csv_name: str, wg: bool = 1, folder: str = "./reports"):
+    @profiled
+    def csv_report(
+        self,
+        csv_name: str,
+        wg: bool = 1,
+        folder: str = "./reports",
+        timeout: float = None,
+        stats: dict = None,
+        since=None,
+        until=None,
+    ):
         """
-            Inform about installed services in a workgroup.
+            Inform about installed services in a workgroup, or in the whole
+             database counted as a single 'DB' row.
 
             :param str csv_name: CSV filename (extension required)
             :param bool wg: filter on the default workgroup
             :param str folder: parent folder where to write the CSV file
+            :param float timeout: overall time budget in seconds. Metrics
+                                  which time out are left empty and listed in
+                                  the 'timed_out' column.
+            :param dict stats: diagnosis already computed, to reuse instead of
+                               querying again. Keys: colls, ds, rq, wk.
+                               Only metrics written in the CSV are queried.
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
         """
+        # every diagnosis of the report share the same window
+        since, until = to_datetime(since), to_datetime(until)
+        if timeout is not None and self.budget is None:
+            with self.time_budget(timeout, queries=CSV_REPORT_QUERIES):
+                return self.csv_report(
+                    csv_name, wg, folder, stats=stats, since=since, until=until
+                )
+        else:
+            pass
+
+        register_dialects()
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        report = self.report(wg, since, until)
+        for key in ("colls", "ds", "rq", "wk"):
+            report.update((stats or {}).get(key) or {})
         if wg == 1:
-            # retrieve data
-            stats_colls = self.colls_stats()
-            stats_ds = self.ds_diagnosis()
-            stats_rq = self.rq_diagnosis()
-            stats_wk = self.wk_diagnosis()
             # prepare csv output file
             csv_out = path.normpath(
                 path.join(
@@ -396,229 +781,287 @@ class IsogeoScanUtils(object):
                     ),
                 )
             )
-            with open(csv_out, "w", newline="") as csvfile:
-                fieldnames = (
-                    "wg_id",
-                    "wg_url",
-                    "wg_ds_count",
-                    "wg_ep_count",
-                    "wg_wk_count",
-                    "wg_rq_count",
-                    "wg_gd_count",
-                    "wg_pd_count",
-                )
-                writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerow(
-                    {
-                        "wg_id": self.def_wg,
-                        "wg_url": "https://daemons.isogeo.com/g/{}".format(self.def_wg),
-                        "wg_ds_count": stats_colls.get("datasets"),
-                        "wg_wk_count": stats_colls.get("subscriptions"),
-                        "wg_rq_count": stats_colls.get("requests"),
-                        "wg_ep_count": stats_colls.get("entrypoints"),
-                        "wg_gd_count": stats_colls.get("geodatabases"),
-                        "wg_pd_count": stats_colls.get("procdatasets"),
-                    }
-                )
+            scope = {
+                "wg_id": self.def_wg,
+                "wg_url": "https://daemons.isogeo.com/g/{}".format(self.def_wg),
+            }
         elif wg == 0:
-            # retrieve data
-            stats_colls = self.colls_stats(0)
-            stats_ds = self.ds_diagnosis(0)
-            stats_rq = self.rq_diagnosis(0)
-            stats_wk = self.wk_diagnosis(0)
-            # prepare csv output file
+            # prepare csv output file: one row counting the whole database
             csv_out = path.normpath(
                 path.join(
                     folder, "ScanFME_Report_{}_DB_{}".format(self.platform, csv_name)
                 )
             )
-            with open(csv_out, "w", newline="") as csvfile:
-                fieldnames = ("wg_id", "wg_url", "wg_ds_count", "")
-                writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerow(
-                    {
-                        "wg_id": "hoho",
-                        "wg_url": "https://daemons.isogeo.com/g/{}".format(self.def_wg),
-                        "wg_url": "hihi",
-                        "wg_ds_count": "héhé",
-                    }
-                )
+            scope = {"wg_id": "DB", "wg_url": ""}
         else:
             raise ValueError("A boolean value is required.")
 
+        # retrieve data
+        counts = report.get(*(coll for column, coll in CSV_COUNTS))
+        with open(csv_out, "w", newline="") as csvfile:
+            fieldnames = (
+                "wg_id",
+                "wg_url",
+                "wg_ds_count",
+                "wg_ep_count",
+                "wg_wk_count",
+                "wg_rq_count",
+                "wg_gd_count",
+                "wg_pd_count",
+                "timed_out",
+            )
+            writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerow(
+                dict(
+                    {column: counts.get(coll) for column, coll in CSV_COUNTS},
+                    timed_out=",".join(self.budget.timed_out)
+                    if self.budget is not None
+                    else "",
+                    **scope
+                )
+            )
+
         # end method
         return csvfile
 
-    def workers_report(self, csv_name: str, folder: str = "./reports"):
-        """Inform about installed services.
+    def _wk_row(self, wk: dict, uptodate: bool) -> dict:
+        """
+            Workers report row of a subscription.
+
+            :param dict wk: subscription document
+            :param bool uptodate: workers are up to date
+        """
+        row = {
+            "wg_id": wk.get("groupId"),
+            "wg_url": "https://app.isogeo.com/groups/{}/admin/isogeo-worker".format(
+                wk.get("groupId")
+            ),
+            "wk_id": wk.get("_id"),
+            "wk_count": 0,
+            "wk_uptodate": int(uptodate),
+        }
+        workers = wk.get("workers")
+        if workers is not None:
+            first = workers[0] if workers else {"givenName": "", "version": ""}
+            row["wk_count"] = len(workers)
+            row["wk_name"] = first.get("givenName")
+            row["wk_version"] = first.get("version")
+        else:
+            pass
+        return row
+
+    @profiled
+    def workers_report(
+        self,
+        csv_name: str,
+        folder: str = "./reports",
+        timeout: float = None,
+        wks: dict = None,
+        checkpoint: int = None,
+        since=None,
+        until=None,
+    ) -> int:
+        """Inform about installed services. Returns the number of written rows.
 
         :param str csv_name: CSV filename (extension required)
         :param str foler: parent folder where to write the CSV file
+        :param float timeout: overall time budget in seconds
+        :param dict wks: whole DB workers diagnosis already computed
+        :param int checkpoint: stream subscriptions by _id, saving progress
+                               every this number of rows: calling again after
+                               a failure resumes the report. Not used if wks
+                               is given.
+        :param since: subscriptions created from, datetime or timedelta back
+                      from now. Not used if wks is given.
+        :param until: subscriptions created before, datetime or timedelta
+                      back from now. Not used if wks is given.
         """
-        # retrieve data
-        wks = self.wk_diagnosis(0)
+        if timeout is not None and self.budget is None:
+            with self.time_budget(timeout, queries=len(self._wk_queries(0)[:3])):
+                return self.workers_report(
+                    csv_name,
+                    folder,
+                    wks=wks,
+                    checkpoint=checkpoint,
+                    since=since,
+                    until=until,
+                )
+        else:
+            pass
+
+        register_dialects()
+        Path(folder).mkdir(parents=True, exist_ok=True)
+
         # prepare csv output file
         csv_out = path.normpath(
             path.join(
                 folder, "ScanFME_Report_Workers_{}_{}".format(self.platform, csv_name)
             )
         )
-        with open(csv_out, "w", newline="") as csvfile:
-            fieldnames = (
-                "wg_id",
-                "wg_url",
-                "wk_id",
-                "wk_count",
-                "wk_uptodate",
-                "wk_name",
-                "wk_version",
-            )
+        fieldnames = (
+            "wg_id",
+            "wg_url",
+            "wk_id",
+            "wk_count",
+            "wk_uptodate",
+            "wk_name",
+            "wk_version",
+        )
+        if wks is None and checkpoint:
+            return self._workers_export(csv_out, fieldnames, checkpoint, since, until)
+        else:
+            pass
+
+        # retrieve data
+        if wks is None:
+            wks = self.wk_diagnosis(0, since, until)
+        else:
+            pass
+        sections = (("srvs_uptodate", 1), ("srvs_outdated", 0), ("srvs_no_created", 0))
+        rows = 0
+        with open(csv_out, "w", newline="", buffering=WRITE_BUFFER) as csvfile:
             writer = csv.DictWriter(csvfile, dialect="pipe", fieldnames=fieldnames)
             writer.writeheader()
             try:
-                for wk in wks.get("srvs_uptodate"):
-                    writer.writerow(
-                        {
-                            "wg_id": wk.get("groupId"),
-                            "wg_url": "https://app.isogeo.com/groups/{}/admin/isogeo-worker".format(
-                                wk.get("groupId")
-                            ),
-                            "wk_id": wk.get("_id"),
-                            "wk_count": len(wk.get("workers")),
-                            "wk_uptodate": 1,
-                            "wk_name": wk.get("workers")[0].get("givenName"),
-                            "wk_version": wk.get("workers")[0].get("version"),
-                        }
-                    )
-                for wk in wks.get("srvs_outdated"):
-                    if len(wk.get("workers")) == 0:
-                        wk["workers"] = [{"givenName": "", "version": ""}]
-                    else:
-                        pass
-                    writer.writerow(
-                        {
-                            "wg_id": wk.get("groupId"),
-                            "wg_url": "https://app.isogeo.com/groups/{}/admin/isogeo-worker".format(
-                                wk.get("groupId")
-                            ),
-                            "wk_id": wk.get("_id"),
-                            "wk_count": len(wk.get("workers", "")),
-                            "wk_uptodate": 0,
-                            "wk_name": wk.get("workers")[0].get("givenName"),
-                            "wk_version": wk.get("workers")[0].get("version"),
-                        }
-                    )
-                for wk in wks.get("srvs_no_created"):
-                    writer.writerow(
-                        {
-                            "wg_id": wk.get("groupId"),
-                            "wg_url": "https://app.isogeo.com/groups/{}/admin/isogeo-worker".format(
-                                wk.get("groupId")
-                            ),
-                            "wk_id": wk.get("_id"),
-                            "wk_count": 0,
-                            "wk_uptodate": 0,
-                        }
-                    )
-            except Exception as e:
-                logger.error(e)
-                logger.error(
-                    "https://mlab.com/clusters/rs-ds053053/databases/scanfme-prod-cluster/collections/subscriptions?_id={}".format(
-                        wk.get("_id")
+                rows = Pipeline(throttle=self.throttle).run(
+                    (
+                        (wk, uptodate)
+                        for name, uptodate in sections
+                        for wk in wks.get(name) or ()
+                    ),
+                    lambda batch: writer.writerows(
+                        [self._wk_row(wk, uptodate) for wk, uptodate in batch]
                     ),
-                    wk.get("workers"),
                 )
+                documents(self.profiler, rows)
+            except ExecutionTimeout as e:
+                logger.error(e)
+                if self.budget is not None:
+                    self.budget.mark("workers")
+                else:
+                    pass
+            except Exception as e:
+                logger.error("Workers report interrupted: {}".format(e))
 
         # end method
-        return csvfile
-
-
-# #############################################################################
-# ####### Command-line ############
-# #################################
-
-
-@click.command()
-@click.option("--settings", default="settings.ini", help="Settings file.")
-@click.option(
-    "--platform",
-    default="prod",
-    help="Database platform to read. Available values: 'prod' | 'qa'.",
-)
-@click.option(
-    "--platform",
-    default="prod",
-    help="Database platform to read. Available values: 'prod' | 'qa'.",
-)
-def cli_scanfme_reporting(settings, platform):
-    """Command-line checking settings and executing required operations.
-
-    :param str settings: path to a settings file containing credentials to read database
-    :param str platform: deployed database to read (production or quality assurance)
-    """
-    # check settings file
-    settings_file = Path(settings)
-    if not settings_file.exists():
-        raise IOError("settings file doesn't exist: {}".format(settings))
-    settings_file = Path(settings).resolve()
-    logger.info("Settings file used: {}".format(settings))
-
-    # check platform value
-    if platform not in ["prod", "qa"]:
-        raise ValueError("Platform option must be one of: prod | qa")
-
-    # load settings
-    config = configparser.ConfigParser()
-    config.read(settings_file)
-    access = {
-        "username": config.get(platform, "username"),
-        "password": config.get(platform, "password"),
-        "server": config.get(platform, "server"),
-        "port": config.get(platform, "port"),
-        "db_name": config.get(platform, "db_name"),
-        "replicaSet": config.get(platform, "replicaSet"),
-    }
-    logger.info("Settings loaded. Database: {}".format(access.get("db_name")))
-
-    # Start
-    app = IsogeoScanUtils(
-        access=access,
-        def_wg=config.get(platform, "wg"),
-        platform=platform,
-        wk_v=config.get(platform, "srv_version"),
-    )
-    cli = app.connect()
-    print(cli)
-
-    # # collections overview
-    # print(app.colls_stats())  # per workgroup
-    # print(app.colls_stats(0))  # whole DB
-
-    # # datasets overview
-    # print(app.ds_diagnosis())  # per workgroup
-    # print(app.ds_diagnosis(0))  # whole DB
-
-    # # requests overview
-    # print(app.rq_diagnosis())  # per workgroup
-    # print(app.rq_diagnosis(0))  # whole DB
-
-    # # srv info
-    # print(app.wk_diagnosis())  # per workgroup
-    # wks = app.wk_diagnosis(0)  # whole DB
-    # print(wks.get("srvs_outdated")[1].keys())
-
-    # app.csv_report("test.csv")
-    # app.csv_report("test.csv", wg=0)
-
-    # app.workers_report("test.csv")
+        return rows
 
+    @profiled
+    def _workers_export(
+        self, csv_out: str, fieldnames: tuple, every: int, since=None, until=None
+    ) -> int:
+        """
+            Write the workers report section by section, subscriptions sorted
+             by _id, resuming from the checkpoint of an interrupted run.
+             Errors are raised once progress is saved. The window bounds are
+             resolved once and kept by checkpoints.
+
+            :param str csv_out: path to the CSV file
+            :param tuple fieldnames: CSV columns
+            :param int every: rows written between two checkpoints
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+        """
+        bounds = window_key(since, until)
+        with CheckpointedWriter(
+            csv_out,
+            fieldnames,
+            every=every,
+            key="workers {}".format(self.wk_vers)
+            + (" " + json_util.dumps(bounds, sort_keys=True) if bounds else ""),
+            buffering=WRITE_BUFFER,
+        ) as writer:
+            # window resolved by the first run, kept by its checkpoints
+            position = writer.position or {
+                "section": None,
+                "_id": None,
+                "window": id_window(since, until),
+            }
+            window = position.get("window") or {}
+            sections = [
+                (name, dict(query, **window)) for name, query in self._wk_queries(0)[:3]
+            ]
+            names = [name for name, query in sections]
+            pipeline = Pipeline(throttle=self.throttle)
+            start = names.index(position.get("section") or names[0])
+            for name, query in sections[start:]:
+                if name == position.get("section") and position.get("_id") is not None:
+                    query = dict(
+                        query,
+                        _id=dict(query.get("_id", {}), **{"$gt": position.get("_id")}),
+                    )
+                else:
+                    pass
+                allowed, max_time_ms = self._time_slice("workers")
+                if not allowed:
+                    raise ExecutionTimeout("Time budget exhausted.")
+                else:
+                    pass
+                cursor = self.backend.find(
+                    "subscriptions",
+                    query,
+                    sort=[("_id", ASCENDING)],
+                    max_time_ms=max_time_ms,
+                )
+                uptodate = name == "srvs_uptodate"
+                pipeline.run(
+                    cursor,
+                    lambda batch: writer.writerows(
+                        [self._wk_row(wk, uptodate) for wk in batch],
+                        {
+                            "section": name,
+                            "_id": batch[-1].get("_id"),
+                            "window": window,
+                        },
+                    ),
+                )
+            documents(self.profiler, pipeline.write.items)
+            return writer.commit()
+
+    @profiled
+    def errors_report(
+        self,
+        csv_name: str,
+        wg: bool = 1,
+        folder: str = "./reports",
+        processes: int = None,
+        since=None,
+        until=None,
+    ) -> int:
+        """
+            Count error signatures of broken and killed requests, by workgroup
+             and globally. Returns the number of written rows.
 
-# #############################################################################
-# ##### Stand alone program ########
-# ##################################
+            :param str csv_name: CSV filename (extension required)
+            :param bool wg: filter on the default workgroup
+            :param str folder: parent folder where to write the CSV file
+            :param int processes: pool size normalizing errors, defaults to
+                                  the number of cores
+            :param since: requests created from, datetime or timedelta back
+                          from now
+            :param until: requests created before, datetime or timedelta back
+                          from now
+        """
+        failed = {"state": {"$in": list(FAILED_STATES)}, **id_window(since, until)}
+        if wg == 1:
+            query = dict(failed, groupId=self.def_wg)
+            scope = self.def_wg
+        elif wg == 0:
+            query = failed
+            scope = "DB"
+        else:
+            raise ValueError("A boolean value is required.")
 
-if __name__ == "__main__":
-    """Standalone execution."""
-    pass
+        docs = self.backend.find(
+            "requests", query, projection={"groupId": 1, "state": 1, "err": 1}
+        )
+        signatures = ErrorScan(processes=processes).run(docs)
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        csv_out = path.normpath(
+            path.join(
+                folder,
+                "ScanFME_Report_Errors_{}_{}_{}".format(self.platform, scope, csv_name),
+            )
+        )
+        return signatures.write(csv_out)
@@ -0,0 +1,331 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Approximate distinct counts: key fields are streamed into HyperLogLog
+     sketches, one per workgroup and day of creation. Sketches are kept in a
+     local store with the last _id read, so that the next update only reads
+     new documents, and estimates over any workgroups and days merge
+     registers instead of scanning history again. Documents come by _id, so
+     sketches of a day are saved as soon as the next day starts.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from hashlib import sha1
+import logging
+import math
+import shelve
+import zlib
+
+# 3rd party library
+from bson import ObjectId
+
+# modules
+from .pipeline import Pipeline
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.sketches")
+
+# distinct counts: (collection, field counted, estimates grouped by wg or day)
+SKETCHES = {
+    "featuretypes": ("datasets", "featureType", "wg"),
+    "rescanned": ("procdatasets", "featureType", "wg"),
+    "active_wgs": ("requests", "groupId", "day"),
+}
+
+# key of the last _id read by metric, in the store
+LAST = "{}||last"
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def precision(error: float) -> int:
+    """
+        Registers bits giving a standard error, between 4 and 16.
+
+        :param float error: relative standard error, e.g. 0.01
+    """
+    return min(16, max(4, math.ceil(math.log2((1.04 / error) ** 2))))
+
+
+def update_sketches(
+    backend, store: "SketchStore", sketches: dict = None, error=0.01, throttle=None
+) -> dict:
+    """
+        Stream documents created since the last update into the sketches of
+         their workgroup and day. Returns the number of documents read by
+         metric.
+
+        :param Backend backend: storage backend
+        :param SketchStore store: sketches store
+        :param dict sketches: metrics definitions, defaults to SKETCHES
+        :param float error: relative standard error of new sketches
+        :param AdaptiveThrottle throttle: paces fetched batches
+    """
+    counts = {}
+    for metric, (coll, field, by) in sorted((sketches or SKETCHES).items()):
+        last = store.last(metric)
+        touched, read = {}, {"last": last, "day": None, "sketches": 0}
+
+        def add(batch):
+            for doc in batch:
+                if isinstance(doc.get("_id"), ObjectId) and doc.get(field) is not None:
+                    day = doc["_id"].generation_time.date().isoformat()
+                    # previous days are complete: their sketches are saved
+                    if day != read.get("day") and touched:
+                        store.put(metric, touched, read.get("last"))
+                        read["sketches"] += len(touched)
+                        touched.clear()
+                    else:
+                        pass
+                    read["day"] = day
+                    key = (doc.get("groupId"), day)
+                    if key not in touched:
+                        touched[key] = store.get(metric, *key) or HyperLogLog(
+                            error=error
+                        )
+                    else:
+                        pass
+                    touched[key].add(doc.get(field))
+                else:
+                    pass
+                read["last"] = doc.get("_id")
+
+        docs = backend.find(
+            coll,
+            {"_id": {"$gt": last}} if last is not None else {},
+            projection={"groupId": 1, field: 1},
+            sort=[("_id", 1)],
+        )
+        counts[metric] = Pipeline(throttle=throttle).run(docs, add)
+        store.put(metric, touched, read.get("last"))
+        logger.info(
+            "{}: {} documents read, {} sketches updated.".format(
+                metric, counts[metric], read.get("sketches") + len(touched)
+            )
+        )
+    return counts
+
+
+def distinct_report(store: "SketchStore", sketches: dict = None) -> dict:
+    """
+        Estimates of every metric, overall and by workgroup or by day.
+
+        :param SketchStore store: sketches store
+        :param dict sketches: metrics definitions, defaults to SKETCHES
+    """
+    report = {}
+    for metric, (coll, field, by) in sorted((sketches or SKETCHES).items()):
+        report[metric] = {
+            "total": store.estimate(metric),
+            "by_" + by: store.estimates(metric, by),
+        }
+    return report
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class HyperLogLog(object):
+    """Mergeable distinct count sketch (HyperLogLog, 64 bits hashes)."""
+
+    __slots__ = ("p", "registers")
+
+    def __init__(self, p: int = None, error: float = 0.01, registers=None):
+        """
+            :param int p: registers bits, computed from error if None
+            :param float error: relative standard error
+            :param bytes registers: registers of a saved sketch
+        """
+        self.p = p or precision(error)
+        self.registers = bytearray(registers or 1 << self.p)
+
+    def add(self, value):
+        """
+            Account a value, compared by its string representation.
+
+            :param value: value to count
+        """
+        digest = sha1(str(value).encode("utf-8")).digest()
+        hashed = int.from_bytes(digest[:8], "big")
+        index = hashed >> (64 - self.p)
+        rest = hashed & ((1 << (64 - self.p)) - 1)
+        rank = 64 - self.p - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+        else:
+            pass
+
+    def fold(self, p: int) -> "HyperLogLog":
+        """
+            Same sketch with fewer registers bits, as if values had been
+             added to it: index bits dropped become leading bits of ranks.
+
+            :param int p: registers bits, at most the current ones
+        """
+        if p > self.p:
+            raise ValueError("Sketches can't be unfolded: {} to {}.".format(self.p, p))
+        else:
+            pass
+        shift = self.p - p
+        folded = HyperLogLog(p=p)
+        for index, register in enumerate(self.registers):
+            if not register:
+                continue
+            else:
+                pass
+            low = index & ((1 << shift) - 1)
+            rank = shift - low.bit_length() + 1 if low else shift + register
+            if rank > folded.registers[index >> shift]:
+                folded.registers[index >> shift] = rank
+            else:
+                pass
+        return folded
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """
+            Union with another sketch, in place. Sketches of different
+             precisions are folded to the lowest one.
+
+            :param HyperLogLog other: sketch to merge
+        """
+        if other.p > self.p:
+            other = other.fold(self.p)
+        elif other.p < self.p:
+            self.p, self.registers = other.p, self.fold(other.p).registers
+        else:
+            pass
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        """Estimated number of distinct values."""
+        m = len(self.registers)
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # small cardinalities: linear counting
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        else:
+            pass
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Compressed sketch: sparse registers compress well."""
+        return bytes([self.p]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        """
+            Load a sketch saved by to_bytes.
+
+            :param bytes data: saved sketch
+        """
+        return cls(p=data[0], registers=zlib.decompress(data[1:]))
+
+
+class SketchStore(object):
+    """Sketches by metric, workgroup and day, kept in a shelve file."""
+
+    def __init__(self, filepath: str):
+        """:param str filepath: path to the shelve file"""
+        self.filepath = filepath
+
+    def last(self, metric: str):
+        """Last _id read for a metric, None before the first update."""
+        with shelve.open(self.filepath) as store:
+            return store.get(LAST.format(metric))
+
+    def get(self, metric: str, wg: str, day: str) -> HyperLogLog:
+        """Sketch of a workgroup and day, None if missing."""
+        with shelve.open(self.filepath) as store:
+            data = store.get("{}|{}|{}".format(metric, wg, day))
+        return HyperLogLog.from_bytes(data) if data is not None else None
+
+    def put(self, metric: str, sketches: dict, last):
+        """
+            Save updated sketches with the last _id read.
+
+            :param str metric: metric name
+            :param dict sketches: sketches by (workgroup, day)
+            :param last: last _id read
+        """
+        with shelve.open(self.filepath) as store:
+            for (wg, day), sketch in sketches.items():
+                store["{}|{}|{}".format(metric, wg, day)] = sketch.to_bytes()
+            store[LAST.format(metric)] = last
+
+    def sketches(
+        self, metric: str, wg: str = None, since: str = None, until: str = None
+    ):
+        """
+            Iterate over sketches of a metric, as (workgroup, day, sketch).
+
+            :param str metric: metric name
+            :param str wg: workgroup UUID, None for every workgroup
+            :param str since: first day included, ISO format
+            :param str until: first day excluded, ISO format
+        """
+        prefix = metric + "|"
+        with shelve.open(self.filepath) as store:
+            for key in store.keys():
+                if not key.startswith(prefix) or key == LAST.format(metric):
+                    continue
+                else:
+                    pass
+                key_wg, day = key[len(prefix) :].rsplit("|", 1)
+                if (
+                    (wg is None or key_wg == wg)
+                    and (since is None or day >= since)
+                    and (until is None or day < until)
+                ):
+                    yield key_wg, day, HyperLogLog.from_bytes(store[key])
+                else:
+                    pass
+
+    def estimate(self, metric: str, wg: str = None, since=None, until=None) -> int:
+        """
+            Distinct count over workgroups and days, merging their sketches.
+
+            :param str metric: metric name
+            :param str wg: workgroup UUID, None for every workgroup
+            :param str since: first day included, ISO format
+            :param str until: first day excluded, ISO format
+        """
+        merged = None
+        for key_wg, day, sketch in self.sketches(metric, wg, since, until):
+            merged = sketch if merged is None else merged.merge(sketch)
+        return merged.count() if merged is not None else 0
+
+    def estimates(self, metric: str, by: str = "wg") -> dict:
+        """
+            Distinct counts by workgroup (all days) or by day (all workgroups).
+
+            :param str metric: metric name
+            :param str by: "wg" or "day"
+        """
+        merged = {}
+        for key_wg, day, sketch in self.sketches(metric):
+            key = key_wg if by == "wg" else day
+            merged[key] = sketch if key not in merged else merged[key].merge(sketch)
+        return {key: sketch.count() for key, sketch in sorted(merged.items())}
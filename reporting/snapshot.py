@@ -0,0 +1,529 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Offline analysis: key fields of the Scan FME collections are exported
+     once into local columnar files (dictionary encoded codes stored as
+     NumPy arrays + compressed vocabularies), then diagnosis and reports run
+     against memory-mapped arrays without any live cluster. Identifiers,
+     all distinct, are stored as raw ObjectId bytes instead.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from array import array
+from datetime import datetime, timezone
+import gzip
+import json
+import logging
+from pathlib import Path
+
+# 3rd party library
+from bson import ObjectId, json_util
+import numpy as np
+
+# modules
+from .backlog import ACTIVE_STATES, age_group, summarize
+from .profiling import profiled
+from .report_global import IsogeoScanUtils, d_colls
+from .window import id_window
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.snapshot")
+
+# key fields exported by collection
+SNAPSHOT_FIELDS = {
+    "datasets": ("_id", "groupId", "featureType", "name", "isogeo_id"),
+    "entrypoints": ("_id", "groupId"),
+    "geodatabases": ("_id", "groupId"),
+    "procdatasets": ("_id", "groupId"),
+    "requests": ("_id", "groupId", "state", "err"),
+    "sessions": ("_id", "groupId"),
+    "subscriptions": ("_id", "groupId", "workers"),
+}
+
+# code of a field missing from a document
+MISSING = -1
+ABSENT = object()
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def _codes_dtype(size: int):
+    """Smallest signed integer type able to store codes of a vocabulary."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def export_snapshot(app: IsogeoScanUtils, folder: str, fields: dict = None) -> dict:
+    """
+        Export key fields of every collection into a snapshot folder. Returns
+         the number of documents exported by collection.
+
+        :param IsogeoScanUtils app: connected utils instance (any backend)
+        :param str folder: snapshot folder to write
+        :param dict fields: fields by collection, defaults to SNAPSHOT_FIELDS
+    """
+    fields = fields or SNAPSHOT_FIELDS
+    root = Path(folder)
+    root.mkdir(parents=True, exist_ok=True)
+    counts, exported = {}, {}
+    for coll in d_colls:
+        coll_fields = exported[coll] = fields.get(coll, ("_id", "groupId"))
+        coll_folder = root / coll
+        coll_folder.mkdir(exist_ok=True)
+        columns = {
+            field: IdColumnWriter() if field == "_id" else ColumnWriter()
+            for field in coll_fields
+        }
+        projection = {field: 1 for field in coll_fields}
+        for doc in app.backend.find(coll, {}, projection=projection):
+            for field in coll_fields:
+                columns[field].append(doc.get(field, ABSENT))
+        for field, column in columns.items():
+            column.save(coll_folder, field)
+        counts[coll] = len(columns.get("_id"))
+        logger.info("{} documents of {} exported.".format(counts[coll], coll))
+
+    with open(str(root / "manifest.json"), "w") as manifest:
+        json.dump(
+            {
+                "platform": app.platform,
+                "created": datetime.utcnow().isoformat(),
+                "fields": {coll: list(exported.get(coll)) for coll in d_colls},
+                "counts": counts,
+            },
+            manifest,
+            indent=2,
+        )
+    return counts
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class ColumnWriter(object):
+    """Dictionary encode values of a field while documents are streamed."""
+
+    def __init__(self):
+        self.vocab = []
+        self.index = {}
+        self.codes = array("q")
+
+    def append(self, value):
+        """
+            Encode a value. ABSENT marks a field missing from the document,
+             distinct from a null value.
+
+            :param value: field value
+        """
+        if value is ABSENT:
+            self.codes.append(MISSING)
+            return
+        else:
+            pass
+        key = json_util.dumps(value, sort_keys=True)
+        if key not in self.index:
+            self.index[key] = len(self.vocab)
+            self.vocab.append(key)
+        else:
+            pass
+        self.codes.append(self.index[key])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def save(self, folder: Path, field: str):
+        """
+            Write codes and compressed vocabulary.
+
+            :param Path folder: collection folder
+            :param str field: field name
+        """
+        codes = np.frombuffer(self.codes, dtype=np.int64)
+        np.save(
+            str(folder / "{}.codes.npy".format(field)),
+            codes.astype(_codes_dtype(len(self.vocab))),
+        )
+        with gzip.open(str(folder / "{}.vocab.json.gz".format(field)), "wt") as vocab:
+            vocab.write("[{}]".format(",".join(self.vocab)))
+
+
+class IdColumnWriter(object):
+    """
+        Store identifiers as raw ObjectId bytes while documents are streamed.
+         Identifiers of other types, unusual, are kept aside by position.
+    """
+
+    def __init__(self):
+        self.oids = bytearray()
+        self.others = []
+
+    def __len__(self):
+        return len(self.oids) // 12
+
+    def append(self, value):
+        """
+            Store an identifier.
+
+            :param value: identifier value
+        """
+        if isinstance(value, ObjectId):
+            self.oids += value.binary
+        else:
+            self.others.append((len(self), None if value is ABSENT else value))
+            self.oids += bytes(12)
+
+    def save(self, folder: Path, field: str):
+        """
+            Write identifiers bytes and compressed other identifiers.
+
+            :param Path folder: collection folder
+            :param str field: field name
+        """
+        np.save(
+            str(folder / "{}.oids.npy".format(field)),
+            np.frombuffer(bytes(self.oids), dtype="S12"),
+        )
+        with gzip.open(str(folder / "{}.others.json.gz".format(field)), "wt") as others:
+            others.write(json_util.dumps(self.others))
+
+
+class IdColumn(object):
+    """Memory-mapped identifiers column, compared without decoding."""
+
+    def __init__(self, folder: Path, field: str):
+        """
+            Map a column.
+
+            :param Path folder: collection folder
+            :param str field: field name
+        """
+        self.oids = np.load(str(folder / "{}.oids.npy".format(field)), mmap_mode="r")
+        with gzip.open(str(folder / "{}.others.json.gz".format(field)), "rt") as others:
+            self.others = dict(json_util.loads(others.read()))
+        self.is_oid = np.ones(len(self.oids), dtype=bool)
+        self.is_oid[list(self.others)] = False
+
+    def __len__(self):
+        return len(self.oids)
+
+    def exists(self) -> np.ndarray:
+        """Mask of documents where the field exists."""
+        return np.ones(len(self.oids), dtype=bool)
+
+    def window(self, lower: ObjectId = None, upper: ObjectId = None) -> np.ndarray:
+        """
+            Mask of documents whose ObjectId is within bounds. Like MongoDB,
+             other types never match ObjectId bounds.
+
+            :param ObjectId lower: included lower bound, if any
+            :param ObjectId upper: excluded upper bound, if any
+        """
+        # fixed size bytes compare like ObjectIds
+        mask = self.is_oid.copy()
+        if lower is not None:
+            mask &= self.oids >= np.bytes_(lower.binary)
+        else:
+            pass
+        if upper is not None:
+            mask &= self.oids < np.bytes_(upper.binary)
+        else:
+            pass
+        return mask
+
+    def value(self, position: int):
+        """Identifier of a document."""
+        position = int(position)
+        if self.is_oid[position]:
+            # trailing null bytes are stripped by NumPy
+            return ObjectId(self.oids[position].ljust(12, b"\0"))
+        else:
+            return self.others.get(position)
+
+
+class Column(object):
+    """Memory-mapped dictionary encoded column."""
+
+    def __init__(self, folder: Path, field: str):
+        """
+            Map a column.
+
+            :param Path folder: collection folder
+            :param str field: field name
+        """
+        self.codes = np.load(str(folder / "{}.codes.npy".format(field)), mmap_mode="r")
+        with gzip.open(str(folder / "{}.vocab.json.gz".format(field)), "rt") as vocab:
+            self.vocab = json_util.loads(vocab.read())
+        self.keys = {
+            json_util.dumps(value, sort_keys=True): code
+            for code, value in enumerate(self.vocab)
+        }
+
+    def __len__(self):
+        return len(self.codes)
+
+    def exists(self) -> np.ndarray:
+        """Mask of documents where the field exists."""
+        return self.codes != MISSING
+
+    def eq(self, value) -> np.ndarray:
+        """Mask of documents where the field equals a value."""
+        code = self.keys.get(json_util.dumps(value, sort_keys=True))
+        if code is None:
+            return np.zeros(len(self.codes), dtype=bool)
+        else:
+            return self.codes == code
+
+    def where(self, predicate) -> np.ndarray:
+        """
+            Mask of documents where the field value matches a predicate,
+             evaluated once by distinct value.
+
+            :param predicate: callable taking a value and returning a bool
+        """
+        matches = np.array([bool(predicate(v)) for v in self.vocab] + [False])
+        # missing values (-1) point to the last, always False, item
+        return matches[self.codes]
+
+    def value(self, position: int):
+        """Value of a document, None if missing."""
+        code = self.codes[position]
+        return None if code == MISSING else self.vocab[code]
+
+
+class OfflineScanUtils(IsogeoScanUtils):
+    """IsogeoScanUtils running diagnosis against a local snapshot."""
+
+    def __init__(
+        self, folder: str, def_wg: str = None, platform="qa", wk_v: str = "2.1.0"
+    ):
+        """
+            Check parameters without requiring database credentials.
+
+            :param str folder: snapshot folder
+            :param str def_wg: default workgroup UUID to use
+            :param str platform: cluster the snapshot comes from, qa or prod
+            :param str wk_v: service Isogeo worker reference version
+        """
+        access = dict.fromkeys(
+            ("username", "password", "server", "port", "db_name", "replicaSet")
+        )
+        super().__init__(access, def_wg=def_wg, platform=platform, wk_v=wk_v)
+        self.folder = Path(folder)
+        self.columns = {}
+
+    def connect(self) -> dict:
+        """Map snapshot columns and returns the snapshot manifest."""
+        with open(str(self.folder / "manifest.json")) as manifest:
+            self.manifest = json.load(manifest)
+        for coll, fields in self.manifest.get("fields").items():
+            self.columns[coll] = {
+                field: (IdColumn if field == "_id" else Column)(
+                    self.folder / coll, field
+                )
+                for field in fields
+            }
+        return self.manifest
+
+    def _mask(
+        self, coll: str, wg: bool, since=None, until=None, **criteria
+    ) -> np.ndarray:
+        """
+            Mask of documents matching equality criteria, optionally by
+             workgroup and creation time window.
+        """
+        columns = self.columns.get(coll)
+        mask = np.ones(len(columns.get("_id")), dtype=bool)
+        id_range = id_window(since, until).get("_id")
+        if id_range:
+            mask &= columns.get("_id").window(id_range.get("$gte"), id_range.get("$lt"))
+        else:
+            pass
+        if wg == 1:
+            mask &= columns.get("groupId").eq(self.def_wg)
+        elif wg == 0:
+            pass
+        else:
+            raise ValueError("A boolean value is required.")
+        for field, value in criteria.items():
+            mask &= columns.get(field).eq(value)
+        return mask
+
+    def _first_value(self, coll: str, mask: np.ndarray, field: str):
+        """Field of the first matching document, in natural order."""
+        position = int(np.argmax(mask))
+        return (self.columns.get(coll).get(field).value(position),)
+
+    def _docs(self, mask: np.ndarray, sort: bool) -> list:
+        """Rebuild subscriptions documents matching a mask."""
+        columns = self.columns.get("subscriptions")
+        positions = np.flatnonzero(mask)
+        docs = []
+        for position in positions:
+            doc = {"_id": columns.get("_id").value(position)}
+            for field in ("groupId", "workers"):
+                if columns.get(field).codes[position] != MISSING:
+                    doc[field] = columns.get(field).value(position)
+                else:
+                    pass
+            docs.append(doc)
+        if sort:
+            docs.sort(key=lambda doc: doc.get("groupId") or "")
+        else:
+            pass
+        return docs
+
+    # -- METRICS -----------------------------------------------------------
+
+    @profiled
+    def colls_stats(
+        self, wg: bool = 1, since=None, until=None, only: set = None
+    ) -> dict:
+        """
+            Perform basic calculation about snapshot.
+
+            :param bool wg: option to filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: collections to count, all by default
+        """
+        return {
+            coll: int(self._mask(coll, wg, since, until).sum())
+            for coll in d_colls
+            if only is None or coll in only
+        }
+
+    @profiled
+    def ds_diagnosis(
+        self, wg: bool = 1, since=None, until=None, only: set = None
+    ) -> dict:
+        """
+            Some diagnosis on datasets collection.
+
+            :param bool wg: option to filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: metrics to compute, all by default
+        """
+        if only is not None and "no_isogeo_id" not in only:
+            return {}
+        else:
+            pass
+        mask = self._mask("datasets", wg, since, until)
+        mask &= ~self.columns.get("datasets").get("isogeo_id").exists()
+        return {"no_isogeo_id": int(mask.sum())}
+
+    @profiled
+    def rq_diagnosis(
+        self, wg: bool = 1, since=None, until=None, only: set = None
+    ) -> dict:
+        """
+            Inform about requests.
+
+            :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: metrics to compute, all by default
+        """
+        rq_report = {}
+        for state, name, field in (
+            ("finished", "rq_finish", "_id"),
+            ("broken", "rq_broken", "err"),
+            ("killed", "rq_killed", "err"),
+        ):
+            if only is not None and name not in only and name + "_last" not in only:
+                continue
+            else:
+                pass
+            mask = self._mask("requests", wg, since, until, state=state)
+            count = int(mask.sum())
+            rq_report[name] = count
+            if count:
+                rq_report[name + "_last"] = self._first_value("requests", mask, field)
+            else:
+                rq_report[name + "_last"] = None
+        return rq_report
+
+    @profiled
+    def rq_backlog(self, wg: bool = 1, since=None, until=None) -> dict:
+        """
+            Requests backlog when the snapshot was taken.
+
+            :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+        """
+        columns = self.columns.get("requests")
+        mask = self._mask("requests", wg, since, until)
+        mask &= columns.get("state").where(lambda state: state in ACTIVE_STATES)
+        groups = {}
+        for position in np.flatnonzero(mask):
+            key = (
+                columns.get("groupId").value(position),
+                columns.get("state").value(position),
+            )
+            groups.setdefault(key, []).append(columns.get("_id").value(position))
+        created = self.manifest.get("created")
+        created = datetime.strptime(
+            created, "%Y-%m-%dT%H:%M:%S.%f" if "." in created else "%Y-%m-%dT%H:%M:%S"
+        )
+        now = created.replace(tzinfo=timezone.utc)
+        return summarize(
+            [
+                age_group({"groupId": wg_id, "state": state}, ids, now)
+                for (wg_id, state), ids in groups.items()
+            ],
+            now=now,
+        )
+
+    @profiled
+    def wk_diagnosis(
+        self, wg: bool = 1, since=None, until=None, only: set = None
+    ) -> dict:
+        """
+            Inform about installed services.
+
+            :param bool wg: filter on the default workgroup
+            :param since: created from, datetime or timedelta back from now
+            :param until: created before, datetime or timedelta back from now
+            :param set only: metrics to compute, all by default
+        """
+        base = self._mask("subscriptions", wg, since, until)
+        workers = self.columns.get("subscriptions").get("workers")
+
+        def versions(value):
+            items = value if isinstance(value, list) else [value]
+            return [item.get("version") for item in items if isinstance(item, dict)]
+
+        uptodate = workers.where(lambda value: self.wk_vers in versions(value))
+        exists = workers.exists()
+        masks = {
+            "srvs_uptodate": lambda: base & uptodate,
+            "srvs_outdated": lambda: base & exists & ~uptodate,
+            "srvs_no_created": lambda: base & ~exists,
+        }
+        if wg == 0:
+            masks["srvs_no_install"] = lambda: base & workers.where(
+                lambda value: value == []
+            )
+        else:
+            pass
+        return {
+            name: self._docs(mask(), sort=wg == 0)
+            for name, mask in masks.items()
+            if only is None or name in only
+        }
@@ -0,0 +1,165 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Materialized summary: aggregation pipelines count documents by workgroup
+     in each collection and merge their output into one document per
+     workgroup. Diagnosis in summary mode read O(workgroups) documents
+     instead of counting O(documents) ones.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import logging
+from time import perf_counter
+
+# modules
+from .throttle import throttled
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.summary")
+
+# collection holding one document per workgroup, _id being the workgroup UUID
+SUMMARY = "scanfme_summary"
+
+# request states summarized: (state, metric, field of the first request)
+RQ_STATES = (
+    ("finished", "rq_finish", "_id"),
+    ("broken", "rq_broken", "err"),
+    ("killed", "rq_killed", "err"),
+)
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def count_by_wg(metric: str, query: dict = None, first: tuple = None) -> list:
+    """
+        Pipeline counting documents by workgroup.
+
+        :param str metric: field receiving the count
+        :param dict query: filter applied first
+        :param tuple first: (metric, field) to keep a field of the first
+                            matching document, in natural order
+    """
+    group = {"_id": "$groupId", metric: {"$sum": 1}}
+    if first is not None:
+        group[first[0]] = {"$first": "$" + first[1]}
+    else:
+        pass
+    return ([{"$match": query}] if query else []) + [{"$group": group}]
+
+
+def summary_pipelines(collections: tuple, wk_queries: list) -> list:
+    """
+        Pipelines building the summary, as (collection, pipeline).
+
+        :param tuple collections: collections counted by workgroup
+        :param list wk_queries: workers diagnosis queries, as (metric, query)
+    """
+    pipelines = [(coll, count_by_wg(coll)) for coll in collections]
+    pipelines.append(
+        ("datasets", count_by_wg("no_isogeo_id", {"isogeo_id": {"$exists": False}}))
+    )
+    for state, metric, field in RQ_STATES:
+        pipelines.append(
+            (
+                "requests",
+                count_by_wg(metric, {"state": state}, (metric + "_last", field)),
+            )
+        )
+    for metric, query in wk_queries:
+        pipelines.append(("subscriptions", count_by_wg(metric, query)))
+    pipelines.append(
+        (
+            "subscriptions",
+            [
+                {"$unwind": "$workers"},
+                {
+                    "$group": {
+                        "_id": "$groupId",
+                        "wk_versions": {"$addToSet": "$workers.version"},
+                    }
+                },
+            ],
+        )
+    )
+    return pipelines
+
+
+def refresh(backend, pipelines: list, into: str = SUMMARY, throttle=None) -> int:
+    """
+        Rebuild the summary: pipelines are merged into a staging collection,
+         which then replaces the summary. Readers never see a partial
+         summary, and workgroups without documents anymore are dropped.
+         Returns the number of workgroups.
+
+        :param Backend backend: storage backend
+        :param list pipelines: (collection, pipeline), see summary_pipelines()
+        :param str into: summary collection
+        :param AdaptiveThrottle throttle: limits pipelines run at once
+    """
+    start = perf_counter()
+    staging = into + "_staging"
+    backend.drop(staging)
+    for coll, pipeline in pipelines:
+        with throttled(throttle):
+            backend.aggregate(
+                coll,
+                pipeline
+                + [
+                    {
+                        "$merge": {
+                            "into": staging,
+                            "on": "_id",
+                            "whenMatched": "merge",
+                            "whenNotMatched": "insert",
+                        }
+                    }
+                ],
+            )
+    # $merge creates nothing without documents: the summary is emptied
+    if backend.first(staging, {}) is None:
+        backend.drop(into)
+    else:
+        backend.rename(staging, into)
+    count = backend.count(into, {})
+    logger.info(
+        "Summary of {} workgroups refreshed in {:.1f}s.".format(
+            count, perf_counter() - start
+        )
+    )
+    return count
+
+
+def totals(docs) -> dict:
+    """
+        Sum summary documents into whole database metrics. Counts are added,
+         lists are merged and other fields are taken from the first document
+         having them.
+
+        :param docs: iterable of summary documents
+    """
+    merged = {}
+    for doc in docs:
+        for field, value in doc.items():
+            if field == "_id":
+                continue
+            elif isinstance(value, int) and not isinstance(value, bool):
+                merged[field] = merged.get(field, 0) + value
+            elif isinstance(value, list):
+                items = merged.setdefault(field, [])
+                items.extend(item for item in value if item not in items)
+            elif merged.get(field) is None:
+                merged[field] = value
+            else:
+                pass
+    return merged
@@ -0,0 +1,227 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Load-aware throttling: the latency of our own queries and the server
+     status (queued operations, read tickets) drive how many queries run at
+     once and the pause between fetched batches. Pressure halves the
+     concurrency and doubles the pause; calm raises the concurrency by one
+     and halves the pause (additive increase, multiplicative decrease).
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+logger = logging.getLogger("isogeo_scanfme_utils.throttle")
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def server_pressure(
+    status: dict, max_queued: int = 10, min_tickets_ratio: float = 0.1
+) -> bool:
+    """
+        Says if a serverStatus output shows a cluster under pressure:
+         operations queued on locks, or read tickets almost exhausted.
+
+        :param dict status: output of the serverStatus command
+        :param int max_queued: queued operations from which the server is busy
+        :param float min_tickets_ratio: available read tickets ratio under
+                                        which the server is busy
+    """
+    queued = status.get("globalLock", {}).get("currentQueue", {}).get("total", 0)
+    tickets = (
+        status.get("wiredTiger", {}).get("concurrentTransactions", {}).get("read", {})
+    )
+    available, total = tickets.get("available"), tickets.get("totalTickets")
+    if queued >= max_queued:
+        return True
+    elif available is not None and total:
+        return available / total < min_tickets_ratio
+    else:
+        return False
+
+
+@contextmanager
+def throttled(throttle: "AdaptiveThrottle" = None):
+    """Run a block in a throttle slot, if a throttle is given."""
+    if throttle is None:
+        yield
+    else:
+        with throttle.slot():
+            yield
+
+
+# #############################################################################
+# ########## Classes ###############
+# ##################################
+
+
+class AdaptiveThrottle(object):
+    """
+        Concurrency limit and batch pause adapted to the cluster load. Slots
+         are waited for on a threading condition: greenlets (planner) need
+         threading to be monkey patched, as done by the command-lines.
+    """
+
+    def __init__(
+        self,
+        target_latency: float = 0.5,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        max_delay: float = 5.0,
+        status=None,
+        status_interval: float = 10.0,
+        smoothing: float = 0.3,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        """
+            :param float target_latency: query latency (seconds, smoothed)
+                                         above which the cluster is busy
+            :param int min_limit: minimal number of queries run at once
+            :param int max_limit: maximal number of queries run at once
+            :param float max_delay: maximal pause between fetched batches
+            :param status: callable returning the serverStatus output. None
+                           to only watch queries latency.
+            :param float status_interval: seconds between two server checks
+            :param float smoothing: weight of a new latency in the average
+            :param clock: monotonic clock (for tests)
+            :param sleep: sleep function (for tests)
+        """
+        self.target_latency = target_latency
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_delay = max_delay
+        self.status = status
+        self.status_interval = status_interval
+        self.smoothing = smoothing
+        self.clock = clock
+        self.sleep = sleep
+        # slow start from the middle of the range
+        self.limit = max(min_limit, max_limit // 2)
+        self.delay = 0.0
+        self.latency = None
+        self.in_flight = 0
+        self.decreases = 0
+        self.increases = 0
+        self._calm = 0
+        self._decreased_at = None
+        self._checked_at = None
+        self._cond = threading.Condition()
+
+    # -- signals --
+
+    def observe(self, latency: float):
+        """
+            Account the latency of a query.
+
+            :param float latency: seconds
+        """
+        with self._cond:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+            if self.latency > self.target_latency:
+                self._decrease("latency {:.3f}s".format(self.latency))
+            else:
+                self._calm += 1
+                # one more slot once a whole window of queries went fine
+                if self._calm >= self.limit:
+                    self._increase()
+                else:
+                    pass
+
+    def check_server(self):
+        """Sample the server status, at most once by status_interval."""
+        now = self.clock()
+        if self.status is None or (
+            self._checked_at is not None
+            and now - self._checked_at < self.status_interval
+        ):
+            return
+        else:
+            self._checked_at = now
+        try:
+            status = self.status()
+        except Exception as e:
+            # serverStatus requires the clusterMonitor role
+            logger.warning("Server status unavailable, latency only: {}".format(e))
+            self.status = None
+            return
+        if server_pressure(status):
+            with self._cond:
+                self._decrease("server busy")
+        else:
+            pass
+
+    # -- adjustments --
+
+    def _decrease(self, reason: str):
+        """Halve concurrency and double the pause, at most once by latency."""
+        now = self.clock()
+        if self._decreased_at is not None and now - self._decreased_at < (
+            self.latency or self.target_latency
+        ):
+            return
+        else:
+            self._decreased_at = now
+        self.limit = max(self.min_limit, self.limit // 2)
+        self.delay = min(self.max_delay, max(self.delay * 2, 0.05))
+        self._calm = 0
+        self.decreases += 1
+        logger.info(
+            "Throttled ({}): {} queries at once, {:.2f}s between batches.".format(
+                reason, self.limit, self.delay
+            )
+        )
+
+    def _increase(self):
+        """One more query at once, half the pause."""
+        self.limit = min(self.max_limit, self.limit + 1)
+        self.delay = self.delay / 2 if self.delay > 0.01 else 0.0
+        self._calm = 0
+        self.increases += 1
+        self._cond.notify_all()
+
+    # -- usage --
+
+    @contextmanager
+    def slot(self):
+        """Run a query once a slot is free, and account its latency."""
+        self.check_server()
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+        start = self.clock()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+            self.observe(self.clock() - start)
+
+    def pace(self):
+        """Pause between two fetched batches, as long as the load requires."""
+        self.check_server()
+        if self.delay:
+            self.sleep(self.delay)
+        else:
+            pass
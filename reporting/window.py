@@ -0,0 +1,112 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Time windows: an ObjectId starts with its creation time, so documents
+     created between two dates are an _id range, read through the default
+     _id index instead of scanning whole collections.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from datetime import datetime, timedelta, timezone
+import re
+
+# 3rd party library
+from bson import ObjectId
+
+# #############################################################################
+# ########## Globals ###############
+# ##################################
+
+# durations back from now: 90m, 24h, 30d, 2w
+DURATION = re.compile(r"^\s*(\d+)\s*([mhdw])\s*$", re.I)
+UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+# #############################################################################
+# ########## Functions #############
+# ##################################
+
+
+def to_datetime(bound, now: datetime = None) -> datetime:
+    """
+        UTC datetime of a window bound.
+
+        :param bound: datetime (naive ones are UTC), or timedelta back from now
+        :param datetime now: reference of timedelta bounds, defaults to now
+    """
+    if bound is None:
+        return None
+    elif isinstance(bound, timedelta):
+        return (now or datetime.utcnow()) - bound
+    elif isinstance(bound, datetime):
+        if bound.tzinfo is not None:
+            return bound.astimezone(timezone.utc).replace(tzinfo=None)
+        else:
+            return bound
+    else:
+        raise TypeError("A datetime or a timedelta is required: {!r}".format(bound))
+
+
+def parse_bound(text: str):
+    """
+        Window bound from the command-line: ISO date or datetime, or duration
+         back from now (90m, 24h, 30d, 2w).
+
+        :param str text: bound to parse
+    """
+    if not text:
+        return None
+    else:
+        pass
+    duration = DURATION.match(text)
+    if duration:
+        return timedelta(
+            **{UNITS.get(duration.group(2).lower()): int(duration.group(1))}
+        )
+    else:
+        return datetime.strptime(
+            text, "%Y-%m-%dT%H:%M:%S" if "T" in text else "%Y-%m-%d"
+        )
+
+
+def window_key(since=None, until=None) -> dict:
+    """
+        Window bounds as given, to identify an export: durations stay
+         relative, so that resuming later matches the same export.
+
+        :param since: created from, see to_datetime
+        :param until: created before, see to_datetime
+    """
+    return {
+        name: "{}s".format(bound.total_seconds())
+        if isinstance(bound, timedelta)
+        else to_datetime(bound)
+        for name, bound in (("since", since), ("until", until))
+        if bound is not None
+    }
+
+
+def id_window(since=None, until=None) -> dict:
+    """
+        Filter on documents created within a time window, as an _id range.
+         Empty without bounds, to be merged into any query.
+
+        :param since: created from (included), see to_datetime
+        :param until: created before (excluded), see to_datetime
+    """
+    now = datetime.utcnow()
+    id_range = {}
+    if since is not None:
+        id_range["$gte"] = ObjectId.from_datetime(to_datetime(since, now))
+    else:
+        pass
+    if until is not None:
+        id_range["$lt"] = ObjectId.from_datetime(to_datetime(until, now))
+    else:
+        pass
+    return {"_id": id_range} if id_range else {}
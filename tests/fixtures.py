@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+"""
+    Sample Scan FME data shared by tests, served by the in-memory backend.
+"""
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.backends import MemoryBackend
+from reporting.report_global import IsogeoScanUtils, d_colls
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+WG = "a" * 32
+OTHER = "b" * 32
+IDS = [ObjectId() for i in range(6)]
+
+ACCESS = dict.fromkeys(
+    ("username", "password", "server", "port", "db_name", "replicaSet")
+)
+
+DOCS = {
+    "datasets": [
+        {"_id": IDS[0], "groupId": WG, "featureType": "roads", "isogeo_id": "x"},
+        {"_id": IDS[1], "groupId": WG, "featureType": "rivers"},
+        {"_id": IDS[2], "groupId": OTHER, "featureType": "roads", "isogeo_id": None},
+    ],
+    "requests": [
+        {"_id": IDS[3], "groupId": WG, "state": "finished"},
+        {"_id": IDS[4], "groupId": OTHER, "state": "broken", "err": {"msg": "oops"}},
+        {"_id": IDS[5], "groupId": WG, "state": "finished"},
+    ],
+    "subscriptions": [
+        {
+            "_id": "s1",
+            "groupId": WG,
+            "workers": [{"givenName": "a", "version": "2.1.0"}],
+        },
+        {
+            "_id": "s2",
+            "groupId": OTHER,
+            "workers": [{"givenName": "b", "version": "1"}],
+        },
+        {"_id": "s3", "groupId": OTHER, "workers": []},
+        {"_id": "s4", "groupId": WG},
+    ],
+}
+
+
+# #############################################################################
+# ######## Functions ###############
+# ##################################
+
+
+def memory_backend(docs: dict = None) -> MemoryBackend:
+    """In-memory backend filled with sample documents."""
+    docs = DOCS if docs is None else docs
+    return MemoryBackend(
+        {coll: docs.get(coll, [{"_id": 1, "groupId": WG}]) for coll in d_colls}
+    )
+
+
+def memory_utils(def_wg: str = WG, docs: dict = None, **kwargs) -> IsogeoScanUtils:
+    """Connected utils instance querying sample documents in memory."""
+    app = IsogeoScanUtils(
+        ACCESS, def_wg=def_wg, wk_v="2.1.0", backend=memory_backend(docs), **kwargs
+    )
+    app.connect()
+    return app
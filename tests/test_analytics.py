@@ -0,0 +1,86 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import unittest
+from unittest import mock
+
+# 3rd party
+import numpy as np
+
+# package
+from reporting.analytics import FleetStats, collect
+from reporting.report_global import IsogeoScanUtils
+from tests.fixtures import OTHER, WG, memory_utils
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Fleet(unittest.TestCase):
+    """Test fleet statistics."""
+
+    def setUp(self):
+        """Synthetic fleet: one workgroup failing much more than others."""
+        rows = {
+            "wg{:04d}".format(i): {
+                "datasets": 100,
+                "procdatasets": 100 + i % 7,
+                "no_isogeo_id": 0,
+                "rq_finish": 90 + i % 5,
+                "rq_broken": 10 - i % 5,
+                "rq_killed": 0,
+            }
+            for i in range(1000)
+        }
+        rows["wg0042"].update(rq_finish=10, rq_broken=80, no_isogeo_id=500)
+        rows["wg0043"].update(datasets=0, rq_finish=None)
+        self.fleet = FleetStats.from_rows(rows)
+
+    def test_ratios(self):
+        """Ratios are NaN where the denominator is missing or zero."""
+        failure = self.fleet.indicator("rq_failure_ratio")
+        self.assertAlmostEqual(failure[42], 80 / 90)
+        self.assertTrue(np.isnan(failure[43]))
+        self.assertTrue(np.isnan(self.fleet.indicator("pd_ds_ratio")[43]))
+        self.assertEqual(self.fleet.describe(failure).get("count"), 999)
+
+    def test_outliers(self):
+        """Abnormal workgroups are flagged, most abnormal first."""
+        flagged = self.fleet.outliers()
+        self.assertEqual(
+            {(row.get("wg_id"), row.get("indicator")) for row in flagged},
+            {("wg0042", "rq_failure_ratio"), ("wg0042", "no_isogeo_id")},
+        )
+        top = self.fleet.top(self.fleet.column("no_isogeo_id"), 2)
+        self.assertEqual(top[0], ("wg0042", 500.0))
+        self.assertEqual(len(self.fleet.top(self.fleet.column("rq_finish"), 5000)), 999)
+
+    def test_collect(self):
+        """Metrics are loaded from diagnosis outputs."""
+        rows = collect(memory_utils())
+        self.assertEqual(list(rows), [WG, OTHER])
+        self.assertEqual(rows.get(WG).get("rq_finish"), 2)
+        fleet = FleetStats.from_rows(rows)
+        self.assertEqual(fleet.column("datasets").tolist(), [2.0, 1.0])
+
+    def test_collect_only_metrics(self):
+        """Diagnosis outputs which aren't analysed aren't computed."""
+        with mock.patch.object(IsogeoScanUtils, "_first") as first:
+            rows = collect(memory_utils())
+        first.assert_not_called()
+        self.assertEqual(rows.get(WG).get("rq_finish"), 2)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from datetime import datetime
+from os import path
+import tempfile
+import unittest
+
+# package
+from reporting.archive import ReportArchive, compress, content_digest
+from reporting.planner import ReportPlan
+from tests.fixtures import WG, memory_utils
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+ROW = "{}|https://app.isogeo.com/groups/{}/admin/isogeo-worker|2.1.{}\n"
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Archive(unittest.TestCase):
+    """Test the content-addressed reports archive."""
+
+    def setUp(self):
+        """Executed before each test."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = ReportArchive(path.join(self.tmp.name, "archive"), samples=2)
+
+    def tearDown(self):
+        """Executed after each test."""
+        self.archive.close()
+        self.tmp.cleanup()
+
+    def write(self, content: str) -> str:
+        """Write a report file."""
+        filepath = path.join(self.tmp.name, "report.csv")
+        with open(filepath, "w") as report:
+            report.write(content)
+        return filepath
+
+    def test_unchanged(self):
+        """Unchanged reports are only checked, not stored again."""
+        first = self.write("wg_id|count\na|1\n")
+        self.assertTrue(self.archive.add(first, "qa", WG, "csv", datetime(2019, 6, 1)))
+        self.assertFalse(self.archive.add(first, "qa", WG, "csv", datetime(2019, 6, 2)))
+        self.write("wg_id|count\na|2\n")
+        self.assertTrue(self.archive.add(first, "qa", WG, "csv", datetime(2019, 6, 3)))
+        # same content as the first version: stored once
+        self.write("wg_id|count\na|1\n")
+        self.assertTrue(self.archive.add(first, "qa", WG, "csv", datetime(2019, 6, 4)))
+
+        history = self.archive.history("qa", WG, "csv")
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history[0].get("checked"), "2019-06-02T00:00:00")
+        self.assertEqual(self.archive.stats().get("objects"), 2)
+        self.assertEqual(
+            self.archive.get("qa", WG, "csv", at=datetime(2019, 6, 3, 12)),
+            b"wg_id|count\na|2\n",
+        )
+        self.assertIsNone(self.archive.get("qa", WG, "csv", at=datetime(2019, 5, 1)))
+        self.assertEqual(
+            len(self.archive.history(since=datetime(2019, 6, 2), platform="qa")), 2
+        )
+
+    def test_dictionary(self):
+        """Reports stored after the first ones share a dictionary."""
+        contents = [
+            "".join(ROW.format(i, "{:032d}".format(i), run) for i in range(40))
+            for run in range(4)
+        ]
+        for content in contents:
+            self.archive.add(self.write(content), "qa", "DB", "workers")
+        self.assertIsNotNone(self.archive.zdict)
+        self.assertEqual(self.archive.stats().get("objects"), 4)
+        data = contents[-1].encode("utf-8")
+        digest = content_digest(data)
+        obj = self.archive.db.execute(
+            "SELECT * FROM objects WHERE digest = ?", (digest,)
+        ).fetchone()
+        self.assertEqual(obj["zdict"], self.archive.zdict)
+        self.assertLess(obj["stored"], len(compress(data)) / 2)
+        self.assertEqual(self.archive.get("qa", "DB", "workers"), data)
+        self.assertTrue(
+            path.isfile(
+                path.join(self.tmp.name, "archive", "objects", digest[:2], digest[2:])
+            )
+        )
+        # a new dictionary leaves older objects readable
+        self.archive.build_dictionary()
+        self.assertEqual(self.archive.read(content_digest(data)), data)
+
+    def test_plan(self):
+        """Plan outputs are archived by scope and report."""
+        app = memory_utils()
+        plan = ReportPlan(["csv", "workers"])
+        folder = path.join(self.tmp.name, "reports")
+        outputs = plan.write(app, plan.execute(app), "latest", folder)
+        self.assertEqual(plan.archive(app, outputs, self.archive), outputs)
+        self.assertEqual(plan.archive(app, outputs, self.archive), [])
+        entries = self.archive.history(platform="qa")
+        self.assertEqual(
+            [(e.get("workgroup"), e.get("report")) for e in entries],
+            [(WG, "csv"), ("DB", "workers")],
+        )
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
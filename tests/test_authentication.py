@@ -10,7 +10,7 @@ from os import environ
 import unittest
 
 import pymongo
-from scanfme_db_utils import IsogeoScanUtils
+from reporting.report_global import IsogeoScanUtils
 
 
 # #############################################################################
@@ -31,8 +31,11 @@ access = {
 # ##################################
 
 
+@unittest.skipUnless(
+    environ.get("username") and environ.get("server"), "no database credentials"
+)
 class DbAuthentication(unittest.TestCase):
-    """Test authentication process."""
+    """Test authentication process against a live cluster."""
 
     # standard methods
     def setUp(self):
@@ -54,6 +57,9 @@ class DbAuthentication(unittest.TestCase):
         )
         cli = app.connect()
         self.assertIsInstance(cli, pymongo.mongo_client.MongoClient)
+        self.assertIsInstance(app.db, pymongo.database.Database)
+        self.assertIsInstance(app.colls.get("datasets"), pymongo.collection.Collection)
+        self.assertIsInstance(app.colls_stats(), dict)
 
 
 # #############################################################################
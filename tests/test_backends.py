@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import unittest
+
+# 3rd party
+from pymongo import DESCENDING
+
+# package
+from reporting.backends import MemoryBackend
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Memory(unittest.TestCase):
+    """Test the in-memory query subset."""
+
+    def setUp(self):
+        """Executed before each test."""
+        self.backend = MemoryBackend(
+            {
+                "coll": [
+                    {"_id": 1, "tags": ["a", "b"], "sub": [{"v": 1}, {"v": 2}]},
+                    {"_id": 2, "tags": [], "n": None},
+                    {"_id": 3, "n": 5, "sub": {"v": 3}},
+                ]
+            }
+        )
+
+    def ids(self, query: dict) -> list:
+        return [doc.get("_id") for doc in self.backend.find("coll", query)]
+
+    def test_equality(self):
+        """Arrays, dotted paths and nulls."""
+        self.assertEqual(self.ids({"tags": "a"}), [1])
+        self.assertEqual(self.ids({"sub.v": 2}), [1])
+        self.assertEqual(self.ids({"sub.v": 3}), [3])
+        self.assertEqual(self.ids({"n": None}), [1, 2])
+
+    def test_operators(self):
+        """Supported operators."""
+        self.assertEqual(self.ids({"n": {"$exists": True}}), [2, 3])
+        self.assertEqual(self.ids({"sub.v": {"$ne": 2}}), [2, 3])
+        self.assertEqual(self.ids({"tags": {"$size": 0}}), [2])
+        self.assertEqual(self.ids({"_id": {"$in": [1, 3]}}), [1, 3])
+        self.assertEqual(self.ids({"_id": {"$nin": [1, 3]}}), [2])
+        self.assertEqual(self.ids({"_id": {"$gt": 1, "$lte": 3}}), [2, 3])
+        self.assertEqual(self.ids({"$or": [{"_id": 1}, {"n": 5}]}), [1, 3])
+        with self.assertRaises(NotImplementedError):
+            self.ids({"n": {"$regex": "x"}})
+
+    def test_aggregate(self):
+        """Grouping stages merged into another collection."""
+        self.backend.aggregate(
+            "coll",
+            [
+                {"$unwind": "$tags"},
+                {"$group": {"_id": "$tags", "n": {"$sum": 1}, "max": {"$max": "$_id"}}},
+                {"$merge": {"into": "out", "on": "_id"}},
+            ],
+        )
+        self.backend.aggregate(
+            "coll",
+            [
+                {"$match": {"n": {"$exists": True}}},
+                {"$group": {"_id": "a", "first": {"$first": "$n"}}},
+                {"$merge": {"into": "out", "on": "_id"}},
+            ],
+        )
+        self.assertEqual(
+            self.backend.find("out", {}, sort=[("_id", 1)]),
+            [
+                {"_id": "a", "n": 1, "max": 1, "first": None},
+                {"_id": "b", "n": 1, "max": 1},
+            ],
+        )
+        self.backend.rename("out", "coll")
+        self.assertEqual(self.backend.count("coll", {}), 2)
+        self.backend.drop("coll")
+        self.assertEqual(self.backend.count("coll", {}), 0)
+
+    def test_shapes(self):
+        """Count, first, sort, projection and distinct."""
+        self.assertEqual(self.backend.count("coll", {"tags": {"$exists": 1}}), 2)
+        self.assertEqual(self.backend.count("missing", {}), 0)
+        self.assertEqual(self.backend.first("coll", {"n": 5}).get("_id"), 3)
+        self.assertIsNone(self.backend.first("coll", {"n": 6}))
+        docs = self.backend.find("coll", {}, {"n": 1}, sort=[("_id", DESCENDING)])
+        self.assertEqual(docs, [{"_id": 3, "n": 5}, {"_id": 2, "n": None}, {"_id": 1}])
+        self.assertEqual(self.backend.distinct("coll", "tags"), ["a", "b"])
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
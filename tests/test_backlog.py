@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from datetime import datetime, timedelta, timezone
+import tempfile
+import unittest
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.backlog import BacklogMonitor, age_group, age_stats, percentile
+from reporting.snapshot import OfflineScanUtils, export_snapshot
+from tests.fixtures import DOCS, OTHER, WG, memory_utils
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+
+def created(minutes: int) -> ObjectId:
+    """ObjectId of a document created some minutes ago."""
+    return ObjectId.from_datetime(datetime.utcnow() - timedelta(minutes=minutes))
+
+
+BACKLOG = dict(
+    DOCS,
+    requests=DOCS.get("requests")
+    + [
+        {"_id": created(60), "groupId": WG, "state": "pending"},
+        {"_id": created(10), "groupId": WG, "state": "pending"},
+        {"_id": created(5), "groupId": WG, "state": "running"},
+        {"_id": created(30), "groupId": OTHER, "state": "pending"},
+    ],
+)
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Backlog(unittest.TestCase):
+    """Test the requests backlog monitor."""
+
+    def test_percentiles(self):
+        """Nearest-rank percentiles, rounded up to age buckets."""
+        now = datetime.now(timezone.utc)
+        ids = [ObjectId.from_datetime(now - timedelta(minutes=m)) for m in range(100)]
+        stats = age_group({}, ids, now)
+        stats["oldest"] = 99 * 60
+        self.assertIsNone(percentile({"count": 0}, 50))
+        self.assertGreaterEqual(percentile(stats, 90), 89 * 60)
+        self.assertLessEqual(percentile(stats, 90), 89 * 60 * 1.2)
+        self.assertEqual(percentile(stats, 100), 99 * 60)
+        self.assertEqual(
+            age_stats({"count": 1, "oldest": 7, "age_60": 1}, (50,)),
+            {"count": 1, "oldest": 7, "p50": 7},
+        )
+
+    def test_report(self):
+        """Counts and ages by state, per workgroup and overall."""
+        live = memory_utils(docs=BACKLOG)
+        with tempfile.TemporaryDirectory() as folder:
+            export_snapshot(live, folder)
+            offline = OfflineScanUtils(folder, def_wg=WG)
+            offline.connect()
+            for app in (live, offline):
+                report = app.rq_backlog(0)
+                pending = report.get("overall").get("pending")
+                self.assertEqual(pending.get("count"), 3)
+                self.assertAlmostEqual(pending.get("oldest"), 3600, delta=60)
+                self.assertGreaterEqual(pending.get("p50"), 1800)
+                self.assertLessEqual(pending.get("p50"), 1800 * 1.2)
+                self.assertEqual(report.get("overall").get("running").get("count"), 1)
+                self.assertEqual(
+                    report.get("workgroups").get(OTHER).get("pending").get("count"), 1
+                )
+                # terminal states are not in the backlog
+                self.assertNotIn("finished", report.get("overall"))
+
+                report = app.rq_backlog(since=timedelta(minutes=20))
+                self.assertEqual(list(report.get("workgroups")), [WG])
+                self.assertEqual(report.get("overall").get("pending").get("count"), 1)
+
+    def test_monitor(self):
+        """Alerts on old requests and growing ages."""
+        monitor = BacklogMonitor(max_age=600, growth=2)
+        report = {"overall": {"pending": {"oldest": 60, "p90": 30}}}
+        self.assertEqual(monitor.check(report), [])
+        report = {"overall": {"pending": {"oldest": 900, "p90": 40}}}
+        self.assertEqual(len(monitor.check(report)), 1)
+        report = {"overall": {"pending": {"oldest": 60, "p90": 50}}}
+        alerts = monitor.check(report)
+        self.assertEqual(len(alerts), 1)
+        self.assertIn("grew 2 times", alerts[0])
+        self.assertEqual(monitor.check({"overall": {}}), [])
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
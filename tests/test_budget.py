@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from time import sleep
+import unittest
+
+# package
+from reporting.budget import TimeBudget
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class TimeBudgetSharing(unittest.TestCase):
+    """Test time budget split across queries."""
+
+    # tests
+    def test_bad_values(self):
+        """Budget requires positive time and at least one query."""
+        with self.assertRaises(ValueError):
+            TimeBudget(0)
+        with self.assertRaises(ValueError):
+            TimeBudget(1, queries=0)
+
+    def test_slices(self):
+        """Remaining time is evenly split among the queries left."""
+        budget = TimeBudget(10, queries=4)
+        first = budget.slice_ms()
+        self.assertLessEqual(first, 2500)
+        self.assertGreater(first, 2400)
+        self.assertEqual(budget.queries_left, 3)
+        # last queries share what's left
+        budget.slice_ms()
+        budget.slice_ms()
+        self.assertGreater(budget.slice_ms(), 9000)
+        # beyond the expected count, remaining time is given to each one
+        self.assertGreater(budget.slice_ms(), 9000)
+
+    def test_expired(self):
+        """No time is allowed once the deadline is reached."""
+        budget = TimeBudget(0.01, queries=2)
+        sleep(0.02)
+        self.assertTrue(budget.expired())
+        self.assertEqual(budget.slice_ms(), 0)
+        self.assertFalse(budget.partial)
+        budget.mark("datasets")
+        self.assertTrue(budget.partial)
+        self.assertEqual(budget.timed_out, ["datasets"])
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+from os import listdir, path
+import tempfile
+import unittest
+
+# 3rd party
+from pymongo.errors import AutoReconnect
+
+# package
+from reporting.checkpoint import CheckpointedWriter
+from reporting.formats import register_dialects
+from tests.fixtures import memory_utils
+
+
+# #############################################################################
+# ######## Functions ###############
+# ##################################
+
+
+def read_rows(csv_out: str) -> list:
+    """Rows of a pipe CSV file."""
+    register_dialects()
+    with open(csv_out, newline="") as csvfile:
+        return list(csv.DictReader(csvfile, dialect="pipe"))
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class FlakyFind(object):
+    """Backend find() losing the connection after a number of documents."""
+
+    def __init__(self, find, after: int):
+        self.find = find
+        self.after = after
+
+    def __call__(self, *args, **kwargs):
+        for doc in self.find(*args, **kwargs):
+            if not self.after:
+                raise AutoReconnect("connection lost")
+            else:
+                self.after -= 1
+            yield doc
+
+
+class Writer(unittest.TestCase):
+    """Test checkpointed CSV writer."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.csv_out = path.join(self.folder.name, "out.csv")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def write(self, ids, fail: bool = False, key: str = None):
+        with CheckpointedWriter(self.csv_out, ("id",), every=2, key=key) as writer:
+            start = writer.position or 0
+            for i in ids:
+                if i > start:
+                    writer.writerow({"id": i}, i)
+                else:
+                    pass
+            if fail:
+                raise RuntimeError("export interrupted")
+            else:
+                return writer.commit()
+
+    def test_resume_after_error(self):
+        """Progress is saved on errors, the target appears once complete."""
+        with self.assertRaises(RuntimeError):
+            self.write(range(1, 4), fail=True)
+        self.assertFalse(path.exists(self.csv_out))
+        self.assertEqual(self.write(range(1, 6)), 5)
+        self.assertEqual(
+            [int(row.get("id")) for row in read_rows(self.csv_out)], [1, 2, 3, 4, 5]
+        )
+        self.assertEqual(listdir(self.folder.name), ["out.csv"])
+
+    def test_resume_after_kill(self):
+        """Rows written after the last checkpoint are dropped."""
+        writer = CheckpointedWriter(self.csv_out, ("id",), every=2)
+        writer.open()
+        for i in range(1, 4):
+            writer.writerow({"id": i}, i)
+        writer.file.close()
+        self.assertEqual(self.write(range(1, 6)), 5)
+        self.assertEqual(
+            [int(row.get("id")) for row in read_rows(self.csv_out)], [1, 2, 3, 4, 5]
+        )
+
+    def test_key(self):
+        """Checkpoints of other parameters are ignored."""
+        with self.assertRaises(RuntimeError):
+            self.write(range(1, 4), fail=True, key="a")
+        self.assertEqual(self.write(range(1, 3), key="b"), 2)
+
+
+class WorkersExport(unittest.TestCase):
+    """Test resumable workers report."""
+
+    def test_resume(self):
+        """An interrupted report resumes without duplicates nor gaps."""
+        with tempfile.TemporaryDirectory() as folder:
+            app = memory_utils()
+            app.workers_report("full.csv", folder=folder, checkpoint=1)
+            expected = read_rows(
+                path.join(folder, "ScanFME_Report_Workers_qa_full.csv")
+            )
+
+            find = app.backend.find
+            app.backend.find = FlakyFind(find, after=2)
+            with self.assertRaises(AutoReconnect):
+                app.workers_report("resumed.csv", folder=folder, checkpoint=1)
+            csv_out = path.join(folder, "ScanFME_Report_Workers_qa_resumed.csv")
+            self.assertFalse(path.exists(csv_out))
+
+            app.backend.find = find
+            self.assertEqual(
+                app.workers_report("resumed.csv", folder=folder, checkpoint=1), 4
+            )
+            self.assertEqual(read_rows(csv_out), expected)
+        self.assertEqual(
+            [row.get("wk_id") for row in expected], ["s1", "s2", "s3", "s4"]
+        )
+        self.assertEqual(expected[2].get("wk_count"), "0")
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
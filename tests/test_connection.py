@@ -0,0 +1,207 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from os import environ
+import random
+import subprocess
+import unittest
+
+# 3rd party
+from pymongo.errors import AutoReconnect, OperationFailure
+
+# package
+from reporting.backends import MongoBackend
+from reporting.connection import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ConnectionManager,
+    RetryPolicy,
+)
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class FakeClock(object):
+    """Manually driven clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyCursor(object):
+    """pymongo cursor losing the connection once, after a few documents."""
+
+    def __init__(self, docs: list, lost: list):
+        self.docs = docs
+        self.lost = lost
+
+    def sort(self, sort):
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    def skip(self, count):
+        self.docs = self.docs[count:]
+        return self
+
+    def __next__(self):
+        if self.lost and len(self.docs) == self.lost[0]:
+            self.lost.pop()
+            raise AutoReconnect("failover")
+        elif not self.docs:
+            raise StopIteration
+        else:
+            return self.docs.pop(0)
+
+
+class FakeDatabase(object):
+    """pymongo database of a single collection."""
+
+    def __init__(self, docs: list, lost: int):
+        self.docs = docs
+        self.lost = [lost]
+
+    def get_collection(self, coll):
+        return self
+
+    def find(self, query, projection=None):
+        return FlakyCursor(list(self.docs), self.lost)
+
+
+class Backoff(unittest.TestCase):
+    """Test retry delays."""
+
+    def test_delays(self):
+        """Delays are bounded by exponential growth and cap."""
+        policy = RetryPolicy(attempts=6, base=1, cap=5, rand=random.Random(42))
+        delays = list(policy.delays())
+        self.assertEqual(len(delays), 5)
+        for attempt, delay in enumerate(delays):
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(5, 2 ** attempt))
+
+
+class Breaker(unittest.TestCase):
+    """Test circuit breaker states."""
+
+    def test_states(self):
+        """Open after threshold, half-open after timeout, closed on success."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.allow())
+        clock.now = 10
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        # failed trial opens again
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        clock.now = 20
+        breaker.record_success()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    def test_single_trial(self):
+        """Once half-open, a single trial goes through."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+
+class ManagedReads(unittest.TestCase):
+    """Test reads retried by the connection manager."""
+
+    def setUp(self):
+        """Executed before each test."""
+        self.waits = []
+        self.conn = ConnectionManager(
+            "mongodb://localhost:27017/test",
+            policy=RetryPolicy(attempts=3, base=0.1),
+            breaker=CircuitBreaker(threshold=3),
+            wait=self.waits.append,
+        )
+
+    def failing(self, failures: int, error=AutoReconnect):
+        """Build a read failing a given number of times."""
+        calls = []
+
+        def read():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise error("failover")
+            return len(calls)
+
+        return read
+
+    def test_failover(self):
+        """Network errors are retried transparently."""
+        self.assertEqual(self.conn.call(self.failing(2)), 3)
+        self.assertEqual(len(self.waits), 2)
+
+    def test_exhausted(self):
+        """Last network error is raised once retries are exhausted."""
+        with self.assertRaises(AutoReconnect):
+            self.conn.call(self.failing(5))
+        # circuit is now open: cluster is not queried anymore
+        with self.assertRaises(CircuitOpenError):
+            self.conn.call(self.failing(0))
+
+    def test_cursor(self):
+        """Cursors lost on failover are sent again, without duplicates."""
+        backend = MongoBackend(FakeDatabase(list(range(10)), lost=6), self.conn)
+        docs = backend.find("coll", {}, sort=[("_id", 1)])
+        self.assertEqual(list(docs), list(range(10)))
+        self.assertEqual(len(self.waits), 1)
+
+    def test_server_errors(self):
+        """Server-side errors are not retried."""
+        with self.assertRaises(OperationFailure):
+            self.conn.call(self.failing(1, OperationFailure))
+        self.assertEqual(self.waits, [])
+
+
+@unittest.skipUnless(
+    environ.get("mongo_test_uri") and environ.get("mongod_restart"),
+    "requires a local mongod and a command restarting it",
+)
+class LocalFailover(unittest.TestCase):
+    """Reads survive a restart of a local mongod."""
+
+    def test_restart(self):
+        """Stop and restart mongod while reading."""
+        conn = ConnectionManager(
+            environ.get("mongo_test_uri"),
+            policy=RetryPolicy(attempts=8, base=0.5, cap=5),
+        )
+        client = conn.connect()
+        subprocess.Popen(environ.get("mongod_restart"), shell=True)
+        for _ in range(20):
+            result = conn.call(client.admin.command, "ping")
+            self.assertEqual(result.get("ok"), 1)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
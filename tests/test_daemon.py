@@ -0,0 +1,153 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from contextlib import contextmanager
+from os import path
+import random
+import tempfile
+import unittest
+
+# 3rd party
+import gevent
+
+# package
+from reporting.backlog import BacklogMonitor
+from reporting.budget import TimeBudget
+from reporting.daemon import ReportDaemon
+from tests.fixtures import memory_utils
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class FakeUtils(object):
+    """Record refreshes by workgroup."""
+
+    def __init__(self, wg=None, calls=None):
+        self.def_wg = wg
+        self.platform = "qa"
+        self.calls = [] if calls is None else calls
+
+    def copy(self):
+        return FakeUtils(self.def_wg, self.calls)
+
+    def workgroup(self, wg_id):
+        return FakeUtils(wg_id, self.calls)
+
+    @contextmanager
+    def time_budget(self, seconds, queries=1):
+        yield TimeBudget(seconds, queries)
+
+    def refresh_summary(self):
+        self.calls.append("summary")
+        return 1
+
+    def colls_stats(self, wg):
+        if self.def_wg == "b" * 32:
+            raise RuntimeError("broken workgroup")
+        self.calls.append(self.def_wg)
+        return {"datasets": 1}
+
+    def rq_backlog(self, wg):
+        self.calls.append("backlog")
+        return {"overall": {"pending": {"count": 1, "oldest": 900, "p90": 900}}}
+
+
+class Scheduling(unittest.TestCase):
+    """Test daemon jobs scheduling."""
+
+    def test_stagger(self):
+        """First runs are spread across the interval."""
+        wgs = ["{}".format(i) * 32 for i in range(4)]
+        daemon = ReportDaemon(
+            FakeUtils(), wgs, {"colls": 100, "workers": 50}, rand=random.Random(1)
+        )
+        colls = [job for job in daemon.jobs if job.report == "colls"]
+        self.assertEqual(len(colls), 4)
+        offsets = [job.offset for job in colls]
+        for i, offset in enumerate(offsets):
+            self.assertGreaterEqual(offset, 25 * i)
+            self.assertLess(offset, 25 * i + 10)
+        # whole database reports are not run by workgroup
+        workers = [job for job in daemon.jobs if job.report == "workers"]
+        self.assertEqual([job.wg for job in workers], [None])
+
+    def test_isolation(self):
+        """A failing refresh doesn't stop the others."""
+        app = FakeUtils()
+        with tempfile.TemporaryDirectory() as folder:
+            daemon = ReportDaemon(
+                app, ["a" * 32, "b" * 32], {"colls": 0.05}, folder=folder, jitter=0
+            )
+            runner = gevent.spawn(daemon.run)
+            gevent.sleep(0.18)
+            daemon.stop()
+            runner.join(timeout=1)
+        good, broken = daemon.jobs
+        self.assertGreaterEqual(good.runs, 2)
+        self.assertEqual(broken.runs, 0)
+        self.assertGreaterEqual(broken.failures, 2)
+        self.assertEqual(set(app.calls), {"a" * 32})
+
+    def test_summary(self):
+        """The summary is rebuilt once for the whole database."""
+        app = FakeUtils()
+        daemon = ReportDaemon(app, ["a" * 32, "c" * 32], {"summary": 60})
+        self.assertEqual([job.wg for job in daemon.jobs], [None])
+        daemon.refresh(daemon.jobs[0])
+        self.assertEqual(app.calls, ["summary"])
+        self.assertEqual(daemon.jobs[0].runs, 1)
+
+    def test_backlog(self):
+        """The backlog is polled once for the whole database, and checked."""
+        app, monitor = FakeUtils(), BacklogMonitor(max_age=600)
+        with tempfile.TemporaryDirectory() as folder:
+            daemon = ReportDaemon(
+                app,
+                ["a" * 32, "c" * 32],
+                {"backlog": 5},
+                folder=folder,
+                monitor=monitor,
+            )
+            self.assertEqual([job.wg for job in daemon.jobs], [None])
+            daemon.refresh(daemon.jobs[0])
+        self.assertEqual(app.calls, ["backlog"])
+        self.assertEqual(daemon.jobs[0].failures, 0)
+        self.assertEqual(list(monitor.history), [900])
+
+    def test_budgets(self):
+        """Whole database jobs run with their own budget."""
+        app = memory_utils()
+        with tempfile.TemporaryDirectory() as folder:
+            daemon = ReportDaemon(app, [], {"workers": 60}, folder=folder)
+            with app.time_budget(30) as budget:
+                daemon.refresh(daemon.jobs[0])
+                self.assertIs(app.budget, budget)
+        self.assertEqual(daemon.jobs[0].failures, 0)
+
+    def test_distinct(self):
+        """Distinct counts sketches are updated and reported in the folder."""
+        with tempfile.TemporaryDirectory() as folder:
+            daemon = ReportDaemon(memory_utils(), [], {"distinct": 60}, folder=folder)
+            daemon.refresh(daemon.jobs[0])
+            self.assertEqual(daemon.jobs[0].failures, 0)
+            self.assertTrue(
+                path.exists(
+                    path.join(folder, "ScanFME_Report_QA_DB_distinct_latest.json")
+                )
+            )
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
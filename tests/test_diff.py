@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+from os import path
+import tempfile
+import unittest
+
+# package
+from reporting.diff import REPORT_KEYS, diff_reports, sort_csv, write_diff
+from reporting.formats import register_dialects
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class ReportDiff(unittest.TestCase):
+    """Test diff between two report runs."""
+
+    def setUp(self):
+        """Executed before each test."""
+        register_dialects()
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Executed after each test."""
+        self.folder.cleanup()
+
+    def write(self, name: str, rows: list) -> str:
+        """Write a workers report."""
+        csv_path = path.join(self.folder.name, name)
+        with open(csv_path, "w", newline="") as csvfile:
+            writer = csv.DictWriter(
+                csvfile, dialect="pipe", fieldnames=("wg_id", "wk_id", "wk_count")
+            )
+            writer.writeheader()
+            for wg, wk, count in rows:
+                writer.writerow({"wg_id": wg, "wk_id": wk, "wk_count": count})
+        return csv_path
+
+    def test_sort(self):
+        """External sort with several runs."""
+        rows = [("wg{}".format(i % 7), "wk{:02d}".format(i), i) for i in range(30)]
+        src = self.write("src.csv", rows)
+        dst = sort_csv(src, ("wg_id", "wk_id"), src + ".sorted", chunk_rows=4)
+        with open(dst, newline="") as csvfile:
+            keys = [
+                (row.get("wg_id"), row.get("wk_id"))
+                for row in csv.DictReader(csvfile, dialect="pipe")
+            ]
+        self.assertEqual(keys, sorted((wg, wk) for wg, wk, count in rows))
+
+    def test_diff(self):
+        """Added, removed and changed rows with deltas."""
+        old = self.write("old.csv", [("b", "1", 2), ("a", "1", 1), ("c", "1", 5)])
+        new = self.write("new.csv", [("d", "1", 0), ("a", "1", 3), ("b", "1", 2)])
+        diffs = list(diff_reports(old, new, REPORT_KEYS.get("workers"), chunk_rows=2))
+        self.assertEqual(
+            [(d.change, d.key) for d in diffs],
+            [("changed", ("a", "1")), ("removed", ("c", "1")), ("added", ("d", "1"))],
+        )
+        self.assertEqual(diffs[0].deltas, {"wk_count": ("1", "3", 2)})
+
+        summary = write_diff(
+            old, new, path.join(self.folder.name, "diff.csv"), ("wg_id", "wk_id")
+        )
+        self.assertEqual(summary, {"changed": 1, "removed": 1, "added": 1})
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+from datetime import datetime, timezone
+from os import path
+import tempfile
+import unittest
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.errors import OTHER, ErrorScan, err_text, normalize
+from tests.fixtures import DOCS, OTHER as OTHER_WG, WG, memory_utils
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+
+def oid(day: int) -> ObjectId:
+    return ObjectId.from_datetime(datetime(2019, 5, day, tzinfo=timezone.utc))
+
+
+FAILED = [
+    {
+        "_id": oid(3),
+        "groupId": WG,
+        "state": "broken",
+        "err": r"Can't open C:\data\wg_1\roads.shp (error 32)",
+    },
+    {
+        "_id": oid(1),
+        "groupId": WG,
+        "state": "broken",
+        "err": {"msg": "Can't open /mnt/data/rivers.tab (error 2)"},
+    },
+    {
+        "_id": oid(2),
+        "groupId": OTHER_WG,
+        "state": "killed",
+        "err": "Timeout after 3600.5 s on 5cd3f9a0e4b0a1b2c3d4e5f6",
+    },
+]
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Signatures(unittest.TestCase):
+    """Test error signatures."""
+
+    def test_normalize(self):
+        """Paths, ids, numbers and quoted values are stripped."""
+        self.assertEqual(
+            normalize(err_text(FAILED[0].get("err"))),
+            normalize(err_text(FAILED[1].get("err"))),
+        )
+        self.assertEqual(
+            normalize("Can't find table 'roads' in https://x.io/a?b=1"),
+            "Can't find table <str> in <url>",
+        )
+        self.assertEqual(normalize(err_text(None)), "<empty>")
+
+    def test_scan(self):
+        """Signatures are counted by workgroup and globally, with dates."""
+        signatures = ErrorScan(processes=1, chunk_size=2).run(FAILED)
+        self.assertEqual(signatures.errors, 3)
+        self.assertEqual(len(signatures.overall), 2)
+        stats = [
+            s for (state, sig), s in signatures.overall.items() if state == "broken"
+        ]
+        self.assertEqual(stats[0].count, 2)
+        self.assertEqual(stats[0].first_seen.day, 1)
+        self.assertEqual(stats[0].last_seen.day, 3)
+
+    def test_bounded(self):
+        """Signatures beyond the limit are counted as OTHER."""
+        docs = [{"state": "broken", "err": "error {}".format(c)} for c in "abcde"]
+        signatures = ErrorScan(processes=1, max_signatures=2).run(docs)
+        self.assertEqual(len(signatures.overall), 3)
+        self.assertEqual(signatures.overall.get(("broken", OTHER)).count, 3)
+
+    def test_pool(self):
+        """Process pool gives the same counts as the current process."""
+        docs = FAILED * 50
+        inline = ErrorScan(processes=1, chunk_size=7).run(docs)
+        pooled = ErrorScan(processes=2, chunk_size=7).run(docs)
+        self.assertEqual(
+            {k: v.count for k, v in inline.by_wg.items()},
+            {k: v.count for k, v in pooled.by_wg.items()},
+        )
+
+    def test_report(self):
+        """Report written from the backend."""
+        app = memory_utils(docs=dict(DOCS, requests=DOCS.get("requests") + FAILED))
+        with tempfile.TemporaryDirectory() as folder:
+            rows = app.errors_report("t.csv", wg=0, folder=folder, processes=1)
+            with open(path.join(folder, "ScanFME_Report_Errors_qa_DB_t.csv")) as f:
+                lines = list(csv.DictReader(f, dialect="pipe"))
+        # 3 global signatures (oops, open, timeout) + 3 by workgroup
+        self.assertEqual(rows, 6)
+        self.assertEqual(lines[0].get("scope"), "*")
+        self.assertEqual(lines[0].get("count"), "2")
+
+        # requests created in a window only
+        with tempfile.TemporaryDirectory() as folder:
+            rows = app.errors_report(
+                "t.csv",
+                wg=0,
+                folder=folder,
+                processes=1,
+                since=datetime(2019, 5, 2),
+                until=datetime(2019, 5, 3),
+            )
+        self.assertEqual(rows, 2)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
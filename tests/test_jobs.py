@@ -0,0 +1,117 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import json
+import tempfile
+import unittest
+
+# package
+from reporting.jobs import (
+    InProcessBroker,
+    JOBS_QUEUE,
+    JobWorker,
+    Message,
+    RESULTS_QUEUE,
+    publish_jobs,
+)
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class FakeUtils(object):
+    """Minimal utils instance."""
+
+    def __init__(self, wg=None):
+        self.def_wg = wg
+        self.platform = "qa"
+
+    def workgroup(self, wg_id):
+        return FakeUtils(wg_id)
+
+    def colls_stats(self, wg):
+        if self.def_wg == "b" * 32:
+            raise RuntimeError("broken workgroup")
+        return {"datasets": 1}
+
+
+class Distribution(unittest.TestCase):
+    """Test jobs publishing and consumption with an in-process broker."""
+
+    def setUp(self):
+        """Executed before each test."""
+        self.broker = InProcessBroker()
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Executed after each test."""
+        self.folder.cleanup()
+
+    def test_publish(self):
+        """One job per workgroup."""
+        count = publish_jobs(
+            self.broker, ["a" * 32, "c" * 32], ["colls"], message_cls=Message
+        )
+        self.assertEqual(count, 2)
+        self.assertEqual(len(self.broker.queues.get(JOBS_QUEUE)), 2)
+        with self.assertRaises(ValueError):
+            publish_jobs(self.broker, ["a" * 32], ["nope"], message_cls=Message)
+        # whole database reports are not run by workgroup
+        with self.assertRaises(ValueError):
+            publish_jobs(self.broker, ["a" * 32], ["workers"], message_cls=Message)
+
+    def test_consume(self):
+        """Jobs are run, results published and everything acknowledged."""
+        publish_jobs(
+            self.broker,
+            ["a" * 32, "b" * 32, "c" * 32],
+            ["colls"],
+            folder=self.folder.name,
+            message_cls=Message,
+        )
+        worker = JobWorker(
+            self.broker, self.broker, FakeUtils(), prefetch=2, message_cls=Message
+        )
+        self.assertEqual(worker.run(idle_timeout=0), 2)
+        results = [json.loads(m.body) for m, r in self.broker.queues[RESULTS_QUEUE]]
+        self.assertEqual(len(results), 3)
+        errors = [r.get("wg") for r in results if r.get("error")]
+        self.assertEqual(errors, ["b" * 32])
+        self.assertEqual(len(results[0].get("outputs")), 1)
+        # broken job was requeued once, then rejected: a single failure
+        self.assertEqual(worker.failed, 1)
+        self.assertEqual(self.broker.unacked, {})
+        self.assertEqual(len(self.broker.queues.get(JOBS_QUEUE)), 0)
+
+    def test_malformed(self):
+        """Malformed messages are rejected, never requeued."""
+        for body in ("{not json", "[]"):
+            self.broker.basic_publish(Message(body), routing_key=JOBS_QUEUE)
+        publish_jobs(
+            self.broker,
+            ["a" * 32],
+            ["colls"],
+            folder=self.folder.name,
+            message_cls=Message,
+        )
+        worker = JobWorker(self.broker, self.broker, FakeUtils(), message_cls=Message)
+        self.assertEqual(worker.run(idle_timeout=0), 1)
+        self.assertEqual(worker.failed, 2)
+        self.assertEqual(len(self.broker.queues.get(RESULTS_QUEUE)), 1)
+        self.assertEqual(self.broker.unacked, {})
+        self.assertEqual(len(self.broker.queues.get(JOBS_QUEUE)), 0)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+from os import listdir, path
+import tempfile
+import unittest
+
+# package
+from reporting.formats import register_dialects
+from reporting import partition
+from reporting.partition import (
+    CountBy,
+    CsvExport,
+    MongoOpener,
+    PartitionedScan,
+    id_ranges,
+    range_query,
+    split_points,
+)
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+DOCS = [
+    {"_id": i, "groupId": "wg{}".format(i % 3), "name": "ds{}".format(i)}
+    for i in range(100)
+]
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda doc: doc.get(key)))
+
+
+class FakeCollection(object):
+    """Subset of a pymongo collection, reading DOCS."""
+
+    def __init__(self):
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return [{"_id": doc.get("_id")} for doc in DOCS[::3]]
+
+    def find(self, query, projection=None):
+        bounds = query.get("_id", {})
+        return FakeCursor(
+            doc
+            for doc in DOCS
+            if doc.get("_id") >= bounds.get("$gte", -1)
+            and doc.get("_id") > bounds.get("$gt", -1)
+            and doc.get("_id") < bounds.get("$lt", 1000)
+        )
+
+
+class FailingCollection(FakeCollection):
+    def find(self, query, projection=None):
+        if query.get("_id", {}).get("$gte") == 50:
+            raise RuntimeError("partition lost")
+        return super().find(query, projection)
+
+
+class BrokenCursorCollection(FakeCollection):
+    """Connection lost in the middle of the second partition."""
+
+    def find(self, query, projection=None):
+        cursor = super().find(query, projection)
+        if query.get("_id", {}).get("$gte") == 25:
+            return BrokenCursor(cursor)
+        return cursor
+
+
+class BrokenCursor(FakeCursor):
+    def sort(self, key, direction):
+        for doc in FakeCursor.sort(self, key, direction):
+            if doc.get("_id") == 40:
+                raise RuntimeError("connection lost")
+            yield doc
+
+
+def opener():
+    return FakeCollection()
+
+
+def failing_opener():
+    return FailingCollection()
+
+
+def broken_opener():
+    return BrokenCursorCollection()
+
+
+class Partitioning(unittest.TestCase):
+    """Test range partitioning."""
+
+    def test_ranges(self):
+        """Split points cover the whole collection."""
+        points = split_points(FakeCollection(), 4)
+        self.assertEqual(len(points), 3)
+        ranges = id_ranges(points)
+        self.assertEqual(ranges[0][0], None)
+        self.assertEqual(ranges[-1][1], None)
+        self.assertEqual(
+            range_query((10, 20), {"groupId": "wg1"}),
+            {"groupId": "wg1", "_id": {"$gte": 10, "$lt": 20}},
+        )
+        self.assertEqual(range_query((None, None)), {})
+
+    def test_sample_query(self):
+        """Only documents of the scan are sampled."""
+        collection = FakeCollection()
+        scan = PartitionedScan(opener, query={"groupId": "wg1"}, processes=2)
+        scan.split(collection, partitions=4)
+        # the collection is sampled before being filtered
+        self.assertEqual(
+            [list(stage) for stage in collection.pipelines[0]],
+            [["$sample"], ["$match"], ["$project"]],
+        )
+        self.assertEqual(collection.pipelines[0][1], {"$match": {"groupId": "wg1"}})
+
+    def test_opener(self):
+        """A worker process keeps a single client."""
+        uri = "mongodb://localhost:1/test"
+        opener = MongoOpener(uri, "datasets")
+        try:
+            self.assertIs(opener().database.client, opener().database.client)
+        finally:
+            partition._CLIENTS.pop(uri).close()
+
+    def test_count(self):
+        """Partial counts are combined."""
+        scan = PartitionedScan(opener, processes=2)
+        scan.split(FakeCollection(), partitions=4)
+        counts = scan.run(CountBy("groupId"))
+        self.assertEqual(sum(counts.values()), 100)
+        self.assertEqual(counts.get("wg0"), 34)
+
+    def test_export(self):
+        """Parts are concatenated in _id order."""
+        with tempfile.TemporaryDirectory() as folder:
+            csv_out = path.join(folder, "export.csv")
+            scan = PartitionedScan(opener, processes=2)
+            scan.split(FakeCollection(), partitions=3)
+            self.assertEqual(scan.run(CsvExport(csv_out, ("_id", "name"))), 100)
+            register_dialects()
+            with open(csv_out, newline="") as csvfile:
+                rows = list(csv.DictReader(csvfile, dialect="pipe"))
+        self.assertEqual([int(row.get("_id")) for row in rows], list(range(100)))
+
+    def test_export_resume(self):
+        """An interrupted export resumes from its checkpoints in a new scan."""
+        with tempfile.TemporaryDirectory() as folder:
+            csv_out = path.join(folder, "export.csv")
+            scan = PartitionedScan(broken_opener, processes=2, retries=0)
+            scan.bounds = id_ranges([25, 50, 75])
+            with self.assertRaises(Exception):
+                scan.run(CsvExport(csv_out, ("_id", "name"), every=5))
+            self.assertFalse(path.exists(csv_out))
+            self.assertEqual(list(scan.failed), [1])
+
+            scan = PartitionedScan(opener, processes=2)
+            scan.bounds = id_ranges([25, 50, 75])
+            self.assertEqual(
+                scan.run(CsvExport(csv_out, ("_id", "name"), every=5)), 100
+            )
+            register_dialects()
+            with open(csv_out, newline="") as csvfile:
+                rows = list(csv.DictReader(csvfile, dialect="pipe"))
+            self.assertEqual(listdir(folder), ["export.csv"])
+        self.assertEqual([int(row.get("_id")) for row in rows], list(range(100)))
+
+    def test_retry(self):
+        """Failed partitions are reported, then retried alone."""
+        scan = PartitionedScan(failing_opener, processes=2, retries=0)
+        scan.bounds = id_ranges([25, 50, 75])
+        with self.assertRaises(Exception):
+            scan.run(CountBy("groupId"))
+        self.assertEqual(list(scan.failed), [2])
+        self.assertEqual(sorted(scan.partials), [0, 1, 3])
+        scan.opener = opener
+        self.assertEqual(sum(scan.run(CountBy("groupId")).values()), 100)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
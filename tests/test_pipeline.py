@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from time import sleep
+import unittest
+
+# package
+from reporting.pipeline import Pipeline
+
+
+# #############################################################################
+# ######## Functions ###############
+# ##################################
+
+
+def flaky(count: int, fail_at: int):
+    """Items lost after some of them, like a dropped cursor."""
+    for i in range(count):
+        if i == fail_at:
+            raise ConnectionError("connection lost")
+        else:
+            yield i
+
+
+def slow(count: int, delay: float):
+    """Items coming slowly, like a distant cursor."""
+    for i in range(count):
+        sleep(delay)
+        yield i
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Pipelining(unittest.TestCase):
+    """Test fetch and write stages."""
+
+    def test_order(self):
+        """Every item is written once, in order, by batches."""
+        written = []
+        pipeline = Pipeline(batch_size=7, depth=2)
+        self.assertEqual(pipeline.run(range(100), written.extend), 100)
+        self.assertEqual(written, list(range(100)))
+        self.assertEqual(pipeline.write.batches, 15)
+        self.assertEqual(pipeline.fetch.items, 100)
+
+    def test_fetch_error(self):
+        """Items fetched before an error are written, then it is raised."""
+        written = []
+        with self.assertRaises(ConnectionError):
+            Pipeline(batch_size=10).run(flaky(100, 25), written.extend)
+        self.assertEqual(written, list(range(25)))
+
+    def test_write_error(self):
+        """An error of the write stage stops the fetch stage."""
+
+        def fail(batch):
+            raise IOError("disk full")
+
+        pipeline = Pipeline(batch_size=1, depth=1)
+        with self.assertRaises(IOError):
+            pipeline.run(range(10 ** 6), fail)
+        self.assertLess(pipeline.fetch.items, 10)
+
+    def test_bottleneck(self):
+        """Counters tell which stage is waited for."""
+        pipeline = Pipeline(batch_size=1)
+        pipeline.run(slow(5, 0.01), lambda batch: None)
+        self.assertEqual(pipeline.bottleneck, "fetch")
+
+        pipeline = Pipeline(batch_size=1, depth=1)
+        pipeline.run(range(5), lambda batch: sleep(0.01))
+        self.assertEqual(pipeline.bottleneck, "write")
+        self.assertGreater(pipeline.write.throughput, 0)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from datetime import datetime, timedelta
+import unittest
+
+# package
+from reporting.planner import ReportPlan
+from tests.fixtures import memory_utils
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class FakeUtils(object):
+    """Count diagnosis calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def colls_stats(self, wg):
+        self.calls.append(("colls_stats", wg))
+        return {"datasets": 1}
+
+    def wk_diagnosis(self, wg):
+        self.calls.append(("wk_diagnosis", wg))
+        return {"srvs_uptodate": iter([{"_id": 1}]), "srvs_outdated": None}
+
+
+class Planning(unittest.TestCase):
+    """Test reports planning."""
+
+    def test_unknown(self):
+        """Unknown reports are rejected."""
+        with self.assertRaises(ValueError):
+            ReportPlan(["colls", "nope"])
+
+    def test_union(self):
+        """Shared diagnosis are planned once."""
+        plan = ReportPlan(["colls", "csv", "wk", "workers"])
+        self.assertEqual(
+            plan.queries, [("colls_stats", 1), ("wk_diagnosis", 1), ("wk_diagnosis", 0)]
+        )
+        # whole DB: workers report shares the workers diagnosis
+        plan = ReportPlan(["wk", "workers"], wg=0)
+        self.assertEqual(plan.queries, [("wk_diagnosis", 0)])
+        self.assertEqual(plan.queries_count(memory_utils()), 4)
+        # workgroup scope: no uninstalled services query
+        plan = ReportPlan(["colls", "wk"])
+        self.assertEqual(plan.queries_count(memory_utils()), 7 + 3)
+
+    def test_execute(self):
+        """Each diagnosis runs once and cursors are materialized."""
+        app = FakeUtils()
+        plan = ReportPlan(["colls", "wk", "workers"], wg=0)
+        results = plan.execute(app, concurrency=2)
+        self.assertEqual(sorted(app.calls), [("colls_stats", 0), ("wk_diagnosis", 0)])
+        self.assertEqual(
+            results.get(("wk_diagnosis", 0)),
+            {"srvs_uptodate": [{"_id": 1}], "srvs_outdated": []},
+        )
+
+    def test_window(self):
+        """A duration is fixed once for every diagnosis of the plan."""
+        plan = ReportPlan(["colls"], since=timedelta(hours=24))
+        self.assertIsInstance(plan.since, datetime)
+        self.assertIsNone(plan.until)
+        app = memory_utils()
+        results = plan.execute(app)
+        self.assertEqual(results.get(("colls_stats", 1)).get("datasets"), 2)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
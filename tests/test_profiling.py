@@ -0,0 +1,110 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import json
+from os import path
+import tempfile
+import tracemalloc
+import unittest
+
+# package
+from reporting.planner import ReportPlan
+from reporting.profiling import MemoryProfiler, regressions
+from tests.fixtures import memory_utils
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Profiling(unittest.TestCase):
+    """Test memory profiling of stages."""
+
+    def test_stages(self):
+        """Nested stages get their own peak, outer ones include inner ones."""
+        with MemoryProfiler(interval=0.01) as profiler:
+            with profiler.stage("outer"):
+                kept = [bytes(1000) for i in range(100)]
+                with profiler.stage("inner"):
+                    freed = [bytes(1000) for i in range(1000)]
+                    del freed
+                profiler.documents(100)
+        profile = profiler.profile()
+        outer, inner = profile["stages"]["outer"], profile["stages"]["inner"]
+        self.assertGreater(inner.get("peak_increase"), 1000 * 1000)
+        self.assertGreaterEqual(outer.get("peak_increase"), inner.get("peak_increase"))
+        self.assertGreater(outer.get("allocated"), 100 * 1000)
+        self.assertLess(inner.get("allocated"), 100 * 1000)
+        self.assertEqual(outer.get("documents"), 100)
+        self.assertGreater(outer.get("per_document"), 1000)
+        # the list kept is the main hot spot of the outer stage
+        self.assertIn("test_profiling.py", outer.get("hotspots")[0].get("line"))
+        self.assertEqual(inner.get("hotspots"), [])
+        self.assertEqual(len(kept), 100)
+
+    def test_no_reset(self):
+        """Without resettable peak, stages aren't charged earlier peaks."""
+        reset_peak = getattr(tracemalloc, "reset_peak", None)
+        if reset_peak is not None:
+            del tracemalloc.reset_peak
+        else:
+            pass
+        try:
+            with MemoryProfiler(interval=0.01) as profiler:
+                with profiler.stage("big"):
+                    freed = bytes(4 * 1000 * 1000)
+                    del freed
+                with profiler.stage("small"):
+                    kept = [bytes(1000) for i in range(10)]
+        finally:
+            if reset_peak is not None:
+                tracemalloc.reset_peak = reset_peak
+            else:
+                pass
+        profile = profiler.profile()
+        self.assertGreater(profile.get("peak"), 4 * 1000 * 1000)
+        self.assertLess(profile["stages"]["small"].get("peak_increase"), 1000 * 1000)
+        self.assertEqual(len(kept), 10)
+        # stacks of finished tasks are dropped
+        self.assertEqual(profiler._stacks, {})
+
+    def test_report(self):
+        """Methods and export stages of a report run are profiled."""
+        app = memory_utils()
+        app.profiler = MemoryProfiler()
+        plan = ReportPlan(["csv", "workers"])
+        with tempfile.TemporaryDirectory() as folder:
+            with app.profiler:
+                plan.write(app, plan.execute(app), "latest", folder)
+                app.workers_report("checkpoint.csv", folder, checkpoint=2)
+            profile_out = path.join(folder, "profile.json")
+            app.profiler.write(profile_out)
+            with open(profile_out) as json_file:
+                profile = json.load(json_file)
+        stages = profile.get("stages")
+        for name in ("colls_stats", "csv_report", "write_csv", "_workers_export"):
+            self.assertEqual(stages.get(name).get("calls"), 1, name)
+        self.assertEqual(stages.get("wk_diagnosis").get("calls"), 1)
+        self.assertEqual(stages.get("_workers_export").get("documents"), 4)
+        self.assertGreater(profile.get("peak"), 0)
+
+        baseline = json.loads(json.dumps(profile))
+        self.assertEqual(regressions(baseline, profile), [])
+        stages["write_csv"]["peak_increase"] = (
+            baseline["stages"]["write_csv"]["peak_increase"] * 2 + 1
+        )
+        self.assertEqual(len(regressions(baseline, profile)), 1)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+from copy import deepcopy
+import json
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.reconcile import AMBIGUOUS, MATCHED, UNMATCHED, RecordIndex, reconcile
+from reporting.remediation import Remediation
+from tests.fixtures import OTHER, WG, memory_backend
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+IDS = [ObjectId() for i in range(4)]
+
+DOCS = {
+    "datasets": [
+        {"_id": IDS[0], "groupId": WG, "featureType": "Roads "},
+        {"_id": IDS[1], "groupId": WG, "featureType": "rivers"},
+        {"_id": IDS[2], "groupId": OTHER, "featureType": "roads"},
+        {"_id": IDS[3], "groupId": OTHER, "featureType": "lakes", "isogeo_id": "x"},
+    ]
+}
+
+RECORDS = [
+    {"_id": "r1", "_creator": {"_id": WG}, "name": "roads"},
+    {"_id": "r2", "_creator": {"_id": OTHER}, "name": "roads"},
+    {"_id": "r3", "_creator": {"_id": OTHER}, "name": "ROADS"},
+    {"_id": "r4", "_creator": {"_id": WG}, "name": None},
+]
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Reconcile(unittest.TestCase):
+    """Test the reconciliation of datasets with Isogeo records."""
+
+    def setUp(self):
+        self.backend = memory_backend(deepcopy(DOCS))
+        self.tmp = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_formats(self):
+        """JSON lists, JSON lines and CSV exports are indexed alike."""
+        json_in = path.join(self.tmp.name, "records.json")
+        with open(json_in, "w") as json_file:
+            json.dump(RECORDS, json_file)
+        lines_in = path.join(self.tmp.name, "records.jsonl")
+        with open(lines_in, "w") as lines_file:
+            lines_file.writelines(json.dumps(record) + "\n" for record in RECORDS)
+        csv_in = path.join(self.tmp.name, "records.csv")
+        with open(csv_in, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(("_id", "_creator._id", "name"))
+            for record in RECORDS:
+                writer.writerow(
+                    (record["_id"], record["_creator"]["_id"], record["name"])
+                )
+
+        for records in (json_in, lines_in, csv_in):
+            index = RecordIndex.from_file(records)
+            self.assertEqual(index.lookup(WG, "ROADS"), (MATCHED, "r1"))
+            self.assertEqual(index.lookup(OTHER, "roads"), (AMBIGUOUS, None))
+            self.assertEqual(index.lookup(WG, "lakes"), (UNMATCHED, None))
+
+    def test_reconcile(self):
+        """Matches are reported, then applied and undone."""
+        index = RecordIndex()
+        for record in RECORDS:
+            index.add(record["_creator"]["_id"], record["name"], record["_id"])
+        csv_out = path.join(self.tmp.name, "report.csv")
+
+        counts = reconcile(self.backend, index, csv_out)
+        self.assertEqual(counts, {MATCHED: 1, AMBIGUOUS: 1, UNMATCHED: 1})
+        self.assertEqual(self.backend.count("datasets", {"isogeo_id": "r1"}), 0)
+        with open(csv_out, newline="") as csvfile:
+            rows = list(csv.DictReader(csvfile, dialect="pipe"))
+        self.assertEqual(rows[0].get("isogeo_id"), "r1")
+
+        remediation = Remediation(
+            self.backend, path.join(self.tmp.name, "journal.jsonl"), batch_size=1
+        )
+        reconcile(self.backend, index, csv_out, remediation=remediation)
+        self.assertEqual(
+            self.backend.first("datasets", {"isogeo_id": "r1"})["_id"], IDS[0]
+        )
+        # matched datasets are not unmatched anymore
+        self.assertEqual(
+            reconcile(self.backend, index, csv_out, {"groupId": WG}), {UNMATCHED: 1}
+        )
+        remediation.undo()
+        self.assertEqual(self.backend.data.get("datasets"), DOCS.get("datasets"))
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
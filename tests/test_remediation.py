@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from copy import deepcopy
+from datetime import datetime, timedelta
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.remediation import (
+    Remediation,
+    plan_backfill,
+    plan_dedupe,
+    plan_purge,
+    write_plan,
+)
+from tests.fixtures import OTHER, WG, memory_backend
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+OLD = ObjectId.from_datetime(datetime.utcnow() - timedelta(days=400))
+NEW = ObjectId()
+DUPS = [ObjectId() for i in range(4)]
+
+DOCS = {
+    "datasets": [
+        {"_id": DUPS[0], "groupId": WG, "featureType": "roads", "isogeo_id": "x"},
+        {"_id": DUPS[1], "groupId": WG, "featureType": "roads"},
+        {"_id": DUPS[2], "groupId": WG, "featureType": "rivers"},
+        {"_id": DUPS[3], "groupId": OTHER, "featureType": "roads"},
+    ],
+    "procdatasets": [{"_id": OLD, "groupId": WG}, {"_id": NEW, "groupId": WG}],
+}
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Remediate(unittest.TestCase):
+    """Test bulk fixes plans, journal and undo."""
+
+    def setUp(self):
+        self.backend = memory_backend(deepcopy(DOCS))
+        self.tmp = TemporaryDirectory()
+        self.journal = path.join(self.tmp.name, "journal.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_plans(self):
+        """Plans select duplicates, old documents and missing fields."""
+        changes = plan_dedupe(self.backend)
+        # the matched dataset is kept, whatever its age
+        self.assertEqual([c._id for c in changes], [DUPS[1]])
+        # whole documents are kept to be restored
+        self.assertEqual(changes[0].before.get("featureType"), "roads")
+        self.assertEqual(len(plan_dedupe(self.backend, {"groupId": OTHER})), 0)
+
+        before = datetime.utcnow() - timedelta(days=365)
+        changes = plan_purge(self.backend, "procdatasets", before)
+        self.assertEqual([c._id for c in changes], [OLD])
+        with self.assertRaises(ValueError):
+            plan_purge(self.backend, "datasets", before)
+
+        changes = plan_backfill(self.backend, "datasets", "isogeo_id", None, {})
+        self.assertEqual(len(changes), 3)
+        self.assertEqual(changes[0].missing, ["isogeo_id"])
+
+        counts = write_plan(changes, path.join(self.tmp.name, "plan.jsonl"))
+        self.assertEqual(counts.get(("datasets", "set")), 3)
+        # a dry run writes nothing
+        self.assertEqual(self.backend.data, memory_backend(deepcopy(DOCS)).data)
+
+    def test_dedupe_no_workgroup(self):
+        """Datasets without workgroup never make others duplicates."""
+        orphans = [{"_id": ObjectId(), "featureType": "roads"} for i in range(2)]
+        self.backend.insert("datasets", orphans)
+        group = self.backend.aggregate(
+            "datasets",
+            [{"$group": {"_id": {"groupId": "$groupId", "ft": "$featureType"}}}],
+        )
+        # like MongoDB, a missing field is dropped from the group key
+        self.assertIn({"ft": "roads"}, [g.get("_id") for g in group])
+        self.assertEqual([c._id for c in plan_dedupe(self.backend)], [DUPS[1]])
+
+    def test_apply_undo(self):
+        """Applied batches are journaled and reverted."""
+        original = deepcopy(self.backend.data)
+        changes = plan_dedupe(self.backend) + plan_backfill(
+            self.backend, "datasets", "isogeo_id", "none", {"groupId": WG}
+        )
+        remediation = Remediation(self.backend, self.journal, batch_size=1)
+        counts = remediation.apply(changes)
+        self.assertEqual(counts.get("deleted"), 1)
+        # the deleted duplicate is not filled anymore
+        self.assertEqual(counts.get("modified"), 1)
+        self.assertEqual(self.backend.count("datasets", {"isogeo_id": "none"}), 1)
+
+        remediation.undo()
+        for coll, docs in original.items():
+            self.assertCountEqual(self.backend.data.get(coll), docs)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
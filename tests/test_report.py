@@ -0,0 +1,135 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import csv
+from os import path
+import tempfile
+import unittest
+
+# package
+from reporting.formats import register_dialects
+from reporting.report_global import CSV_COUNTS
+from reporting.snapshot import OfflineScanUtils, export_snapshot
+from tests.fixtures import IDS, OTHER, WG, memory_utils
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+
+def record(app) -> list:
+    """Record the queries sent to the backend of an utils instance."""
+    calls = []
+    backend = app.backend
+    for name in ("count", "first", "find"):
+
+        def query(coll, *args, _name=name, _method=getattr(backend, name), **kwargs):
+            calls.append((_name, coll))
+            return _method(coll, *args, **kwargs)
+
+        setattr(backend, name, query)
+    return calls
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class LazyReport(unittest.TestCase):
+    """Test metrics computed on demand."""
+
+    def test_lazy(self):
+        """Only accessed metrics are queried, once, by batch."""
+        app = memory_utils()
+        calls = record(app)
+        report = app.report()
+        self.assertIn("rq_killed_last", report)
+        self.assertEqual(calls, [])
+
+        report.require("datasets", "no_isogeo_id")
+        self.assertEqual(report["datasets"], 2)
+        self.assertEqual(calls, [("count", "datasets"), ("count", "datasets")])
+        self.assertEqual(report.batches, 2)
+        self.assertEqual(report["no_isogeo_id"], 1)
+        self.assertEqual(len(calls), 2)
+
+        # a last request depends on its count, other states are not queried
+        self.assertEqual(report.get("rq_finish_last"), {"rq_finish_last": (IDS[3],)})
+        self.assertEqual(calls[2:], [("count", "requests"), ("first", "requests")])
+        self.assertEqual(report.values.get("rq_finish"), 2)
+        self.assertNotIn("rq_broken", report.values)
+        # not applicable to a workgroup
+        self.assertIsNone(report["srvs_no_install"])
+
+        with self.assertRaises(KeyError):
+            report.get("nope")
+        with self.assertRaises(ValueError):
+            app.report(2)
+
+    def test_offline(self):
+        """Snapshots compute the same metrics."""
+        live = memory_utils(OTHER)
+        with tempfile.TemporaryDirectory() as folder:
+            export_snapshot(live, folder)
+            offline = OfflineScanUtils(folder, def_wg=OTHER)
+            offline.connect()
+            names = ("requests", "rq_broken_last", "srvs_outdated")
+            for app in (live, offline):
+                values = app.report().get(*names)
+                self.assertEqual(values.get("rq_broken_last"), ({"msg": "oops"},))
+                self.assertEqual(
+                    [doc.get("_id") for doc in values.get("srvs_outdated")],
+                    ["s2", "s3"],
+                )
+                self.assertEqual(values.get("requests"), live.colls_stats()["requests"])
+
+    def test_csv(self):
+        """The CSV report only counts its columns."""
+        app = memory_utils()
+        calls = record(app)
+        register_dialects()
+        with tempfile.TemporaryDirectory() as folder:
+            app.csv_report("out.csv", folder=folder)
+            csv_out = path.join(folder, "ScanFME_Report_QA_{}_out.csv".format(WG))
+            with open(csv_out, newline="") as csvfile:
+                rows = list(csv.DictReader(csvfile, dialect="pipe"))
+        self.assertEqual(len(calls), len(CSV_COUNTS))
+        self.assertEqual({kind for kind, coll in calls}, {"count"})
+        self.assertEqual(rows[0].get("wg_ds_count"), "2")
+
+        # colls_stats counts every collection, the report none again
+        del calls[:]
+        with tempfile.TemporaryDirectory() as folder:
+            app.csv_report("out.csv", folder=folder, stats={"colls": app.colls_stats()})
+        self.assertEqual(len(calls), 7)
+
+    def test_csv_db(self):
+        """The whole database CSV report counts every workgroup in one row."""
+        app = memory_utils()
+        register_dialects()
+        with tempfile.TemporaryDirectory() as folder:
+            app.csv_report("out.csv", wg=0, folder=folder)
+            csv_out = path.join(folder, "ScanFME_Report_qa_DB_out.csv")
+            with open(csv_out, newline="") as csvfile:
+                rows = list(csv.DictReader(csvfile, dialect="pipe"))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].get("wg_id"), "DB")
+        self.assertEqual(rows[0].get("wg_ds_count"), "3")
+        self.assertEqual(
+            rows[0].get("wg_rq_count"), str(app.colls_stats(wg=0).get("requests"))
+        )
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
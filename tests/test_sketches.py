@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from datetime import datetime, timedelta
+from os import path
+import tempfile
+import unittest
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.sketches import (
+    HyperLogLog,
+    SketchStore,
+    distinct_report,
+    precision,
+    update_sketches,
+)
+from tests.fixtures import OTHER, WG, memory_backend
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+YESTERDAY = datetime.utcnow() - timedelta(days=1)
+
+DOCS = {
+    "datasets": [
+        {"_id": ObjectId.from_datetime(YESTERDAY), "groupId": WG, "featureType": i}
+        for i in ("roads", "rivers", "roads")
+    ]
+    + [{"_id": ObjectId(), "groupId": OTHER, "featureType": "roads"}],
+    "procdatasets": [],
+    "requests": [
+        {"_id": ObjectId(), "groupId": WG},
+        {"_id": ObjectId(), "groupId": OTHER},
+        {"_id": ObjectId(), "groupId": OTHER},
+    ],
+}
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Sketches(unittest.TestCase):
+    """Test approximate distinct counts."""
+
+    def test_accuracy(self):
+        """Estimates stay close to the exact count."""
+        self.assertEqual(precision(0.01), 14)
+        self.assertEqual(precision(1), 4)
+        for count in (10, 1000, 50000):
+            sketch = HyperLogLog(error=0.02)
+            for i in range(count):
+                sketch.add(i)
+                sketch.add(i)
+            self.assertAlmostEqual(sketch.count(), count, delta=count * 0.06 + 1)
+
+    def test_merge(self):
+        """Merged sketches estimate the union and round trip as bytes."""
+        first, second = HyperLogLog(p=12), HyperLogLog(p=12)
+        for i in range(3000):
+            first.add(i)
+            second.add(i + 2000)
+        saved = HyperLogLog.from_bytes(first.to_bytes())
+        self.assertEqual(saved.registers, first.registers)
+        self.assertAlmostEqual(saved.merge(second).count(), 5000, delta=250)
+
+        # precisions differ: folded to the lowest one
+        direct = HyperLogLog(p=10)
+        for i in range(3000):
+            direct.add(i)
+        self.assertEqual(first.fold(10).registers, direct.registers)
+        merged = HyperLogLog(p=10).merge(second).merge(first)
+        self.assertEqual(merged.p, 10)
+        self.assertAlmostEqual(merged.count(), 5000, delta=500)
+        with self.assertRaises(ValueError):
+            direct.fold(12)
+
+    def test_update(self):
+        """Updates only read new documents, estimates by workgroup and day."""
+        backend = memory_backend(DOCS)
+        with tempfile.TemporaryDirectory() as folder:
+            store = SketchStore(path.join(folder, "sketches"))
+            counts = update_sketches(backend, store)
+            self.assertEqual(
+                counts, {"active_wgs": 3, "featuretypes": 4, "rescanned": 0}
+            )
+            self.assertEqual(store.estimate("featuretypes"), 2)
+            self.assertEqual(store.estimates("featuretypes"), {OTHER: 1, WG: 2})
+            self.assertEqual(
+                store.estimate(
+                    "featuretypes", since=datetime.utcnow().date().isoformat()
+                ),
+                1,
+            )
+
+            backend.insert(
+                "datasets", [{"_id": ObjectId(), "groupId": WG, "featureType": "lakes"}]
+            )
+            counts = update_sketches(backend, store)
+            self.assertEqual(counts.get("featuretypes"), 1)
+            report = distinct_report(store)
+            self.assertEqual(report.get("featuretypes").get("total"), 3)
+            self.assertEqual(report.get("featuretypes").get("by_wg").get(WG), 3)
+            self.assertEqual(list(report.get("active_wgs").get("by_day").values()), [2])
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
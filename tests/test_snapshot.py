@@ -0,0 +1,114 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import tempfile
+import unittest
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.snapshot import OfflineScanUtils, export_snapshot
+from tests.fixtures import DOCS, IDS, WG, memory_utils
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Snapshot(unittest.TestCase):
+    """Test offline diagnosis against a snapshot."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Export snapshot once."""
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.counts = export_snapshot(memory_utils(), cls.folder.name)
+        cls.app = OfflineScanUtils(cls.folder.name, def_wg=WG, wk_v="2.1.0")
+        cls.app.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove snapshot."""
+        cls.folder.cleanup()
+
+    def test_stats(self):
+        """Counts by collection."""
+        self.assertEqual(self.counts.get("datasets"), 3)
+        self.assertEqual(self.app.colls_stats().get("datasets"), 2)
+        self.assertEqual(self.app.colls_stats(0).get("subscriptions"), 4)
+        # null isogeo_id exists
+        self.assertEqual(self.app.ds_diagnosis(), {"no_isogeo_id": 1})
+        self.assertEqual(self.app.ds_diagnosis(0), {"no_isogeo_id": 1})
+
+    def test_requests(self):
+        """Requests diagnosis keeps live shapes."""
+        report = self.app.rq_diagnosis()
+        self.assertEqual(report.get("rq_finish"), 2)
+        self.assertEqual(report.get("rq_finish_last"), (IDS[3],))
+        self.assertIsNone(report.get("rq_broken_last"))
+        report = self.app.rq_diagnosis(0)
+        self.assertEqual(report.get("rq_broken_last"), ({"msg": "oops"},))
+
+    def test_workers(self):
+        """Workers are classified like the live queries."""
+        report = self.app.wk_diagnosis(0)
+        ids = {key: [doc.get("_id") for doc in docs] for key, docs in report.items()}
+        self.assertEqual(ids.get("srvs_uptodate"), ["s1"])
+        self.assertEqual(sorted(ids.get("srvs_outdated")), ["s2", "s3"])
+        self.assertEqual(ids.get("srvs_no_created"), ["s4"])
+        self.assertEqual(ids.get("srvs_no_install"), ["s3"])
+        self.assertNotIn("workers", report.get("srvs_no_created")[0])
+
+    def test_parity(self):
+        """Snapshot and in-memory backend give the same diagnosis."""
+        live = memory_utils()
+        for wg in (1, 0):
+            self.assertEqual(self.app.colls_stats(wg), live.colls_stats(wg))
+            self.assertEqual(self.app.ds_diagnosis(wg), live.ds_diagnosis(wg))
+            self.assertEqual(self.app.rq_diagnosis(wg), live.rq_diagnosis(wg))
+            offline, memory = self.app.wk_diagnosis(wg), live.wk_diagnosis(wg)
+            self.assertEqual(
+                {
+                    key: [doc.get("_id") for doc in docs]
+                    for key, docs in offline.items()
+                },
+                {key: [doc.get("_id") for doc in docs] for key, docs in memory.items()},
+            )
+
+    def test_identifiers(self):
+        """Identifiers are restored, whatever their type or trailing bytes."""
+        self.assertEqual(self.app.columns["requests"]["_id"].value(0), IDS[3])
+        self.assertEqual(self.app.columns["subscriptions"]["_id"].value(3), "s4")
+        oid = ObjectId(IDS[0].binary[:10] + bytes(2))
+        docs = dict(DOCS, requests=[{"_id": oid, "groupId": WG, "state": "finished"}])
+        with tempfile.TemporaryDirectory() as folder:
+            export_snapshot(memory_utils(docs=docs), folder)
+            app = OfflineScanUtils(folder, def_wg=WG)
+            app.connect()
+            self.assertEqual(app.rq_diagnosis().get("rq_finish_last"), (oid,))
+
+    def test_partial_fields(self):
+        """Collections left to default fields can be read back."""
+        fields = {"datasets": ("_id", "groupId", "isogeo_id")}
+        with tempfile.TemporaryDirectory() as folder:
+            export_snapshot(memory_utils(), folder, fields=fields)
+            app = OfflineScanUtils(folder, def_wg=WG)
+            manifest = app.connect()
+            self.assertEqual(manifest["fields"]["requests"], ["_id", "groupId"])
+            self.assertEqual(app.colls_stats(), memory_utils().colls_stats())
+            self.assertEqual(app.ds_diagnosis(), {"no_isogeo_id": 1})
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import json
+from os import environ, listdir, path
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# seconds allowed to import the library (about 0.2s on a laptop, pymongo
+# being most of it)
+IMPORT_BUDGET = 1.0
+
+PROBE = """
+import csv, json, logging, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "modules": sorted(m for m in ("click", "gevent", "numpy", "pymongo") if m in sys.modules),
+    "handlers": len(logging.getLogger("isogeo_scanfme_utils").handlers),
+    "dialects": csv.list_dialects(),
+}}))
+"""
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Startup(unittest.TestCase):
+    """Test imports are cheap and free of side effects."""
+
+    def probe(self, module: str) -> dict:
+        """Import a module in a fresh interpreter, from an empty folder."""
+        with tempfile.TemporaryDirectory() as folder:
+            output = subprocess.check_output(
+                [sys.executable, "-c", PROBE.format(module=module)],
+                cwd=folder,
+                env=dict(environ, PYTHONPATH=ROOT),
+            )
+            self.assertEqual(listdir(folder), [])
+        return json.loads(output.decode())
+
+    def test_library(self):
+        """Importing the library neither patches, logs, nor loads NumPy."""
+        probe = self.probe("reporting.report_global")
+        self.assertEqual(probe.get("modules"), ["pymongo"])
+        self.assertEqual(probe.get("handlers"), 0)
+        self.assertNotIn("pipe", probe.get("dialects"))
+        self.assertLess(probe.get("elapsed"), IMPORT_BUDGET)
+
+    def test_light_modules(self):
+        """Offline tools don't load the database driver."""
+        self.assertEqual(self.probe("reporting.diff").get("modules"), [])
+
+    def test_cli(self):
+        """Command-lines load gevent and the driver only to run queries."""
+        for cli in ("cli_report_global", "cli_report_daemon", "cli_report_jobs"):
+            self.assertEqual(self.probe(cli).get("modules"), ["click"], cli)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
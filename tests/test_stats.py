@@ -6,46 +6,25 @@
 # ##################################
 
 # Standard library
-from os import environ
+from time import sleep
 import unittest
 
 # package
-from scanfme_db_utils import IsogeoScanUtils
+from tests.fixtures import IDS, OTHER, WG, memory_utils
 
 
-# #############################################################################
-# ######## Globals #################
-# ##################################
-
-access = {
-    "username": environ.get("username"),
-    "password": environ.get("password"),
-    "server": environ.get("server"),
-    "port": environ.get("port"),
-    "db_name": environ.get("db_name"),
-    "replicaSet": environ.get("replicaSet"),
-}
-
 # #############################################################################
 # ######## Classes #################
 # ##################################
 
 
 class DbStats(unittest.TestCase):
-    """Test authentication process."""
-
-    app = IsogeoScanUtils(
-        access=access,
-        def_wg=environ.get("wg_test"),
-        platform="qa",
-        wk_v=environ.get("srv_version_ref"),
-    )
-    cli = app.connect()
+    """Test diagnosis methods against the in-memory backend."""
 
     # standard methods
     def setUp(self):
         """Executed before each test."""
-        pass
+        self.app = memory_utils()
 
     def tearDown(self):
         """Executed after each test."""
@@ -59,6 +38,44 @@ class DbStats(unittest.TestCase):
         self.assertIsInstance(self.app.rq_diagnosis(), dict)
         self.assertIsInstance(self.app.wk_diagnosis(), dict)
 
+    def test_colls_stats(self):
+        """Counts by collection, by workgroup or whole DB."""
+        self.assertEqual(self.app.colls_stats().get("datasets"), 2)
+        self.assertEqual(self.app.colls_stats(0).get("datasets"), 3)
+        self.assertEqual(self.app.colls_stats(0).get("subscriptions"), 4)
+        with self.assertRaises(ValueError):
+            self.app.colls_stats(2)
+
+    def test_diagnosis(self):
+        """Datasets and requests diagnosis."""
+        # a null isogeo_id exists
+        self.assertEqual(self.app.ds_diagnosis(), {"no_isogeo_id": 1})
+        self.assertEqual(self.app.ds_diagnosis(0), {"no_isogeo_id": 1})
+        report = self.app.rq_diagnosis()
+        self.assertEqual(report.get("rq_finish"), 2)
+        self.assertEqual(report.get("rq_finish_last"), (IDS[3],))
+        self.assertEqual(report.get("rq_broken"), 0)
+        self.assertIsNone(report.get("rq_broken_last"))
+        report = self.app.workgroup(OTHER).rq_diagnosis()
+        self.assertEqual(report.get("rq_broken_last"), ({"msg": "oops"},))
+
+    def test_workers(self):
+        """Services are classified by version."""
+        report = self.app.wk_diagnosis(0)
+        ids = {key: [doc.get("_id") for doc in docs] for key, docs in report.items()}
+        self.assertEqual(ids.get("srvs_uptodate"), ["s1"])
+        self.assertEqual(ids.get("srvs_outdated"), ["s2", "s3"])
+        self.assertEqual(ids.get("srvs_no_created"), ["s4"])
+        self.assertEqual(ids.get("srvs_no_install"), ["s3"])
+        self.assertEqual(self.app.workgroups(), [WG, OTHER])
+
+    def test_budget(self):
+        """Time budget applies to the in-memory backend too."""
+        with self.app.time_budget(0.001) as budget:
+            sleep(0.01)
+            self.assertIsNone(self.app.colls_stats().get("datasets"))
+        self.assertIn("datasets", budget.timed_out)
+
 
 # #############################################################################
 # ######## Standalone ##############
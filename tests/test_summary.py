@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import unittest
+
+# package
+from reporting.summary import SUMMARY, totals
+from tests.fixtures import OTHER, WG, memory_utils
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Summary(unittest.TestCase):
+    """Test the materialized summary."""
+
+    def setUp(self):
+        """Live and summary instances sharing the same documents."""
+        self.live = memory_utils()
+        self.app = memory_utils(summary=True)
+        self.app.backend = self.live.backend
+
+    def test_documents(self):
+        """One document per workgroup."""
+        self.assertEqual(self.app.refresh_summary(), 2)
+        doc = self.app.backend.first(SUMMARY, {"_id": WG})
+        self.assertEqual(doc.get("datasets"), 2)
+        self.assertEqual(doc.get("no_isogeo_id"), 1)
+        self.assertEqual(doc.get("rq_finish"), 2)
+        self.assertEqual(doc.get("wk_versions"), ["2.1.0"])
+        self.assertEqual(doc.get("srvs_uptodate"), 1)
+        self.assertEqual(doc.get("srvs_no_created"), 1)
+        self.assertNotIn("rq_broken", doc)
+
+    def test_parity(self):
+        """Diagnosis read from the summary match counted ones."""
+        self.app.refresh_summary()
+        for wg in (1, 0):
+            for method in ("colls_stats", "ds_diagnosis", "rq_diagnosis"):
+                self.assertEqual(
+                    getattr(self.app, method)(wg), getattr(self.live, method)(wg)
+                )
+        other = self.app.workgroup(OTHER)
+        self.assertEqual(other.rq_diagnosis().get("rq_broken_last"), ({"msg": "oops"},))
+
+    def test_refresh(self):
+        """Workgroups without documents anymore are dropped."""
+        self.app.refresh_summary()
+        for coll, docs in self.app.backend.data.items():
+            self.app.backend.data[coll] = [d for d in docs if d.get("groupId") != OTHER]
+        self.assertEqual(self.app.refresh_summary(), 1)
+        self.assertEqual(self.app.workgroup(OTHER).colls_stats().get("datasets"), 0)
+        # no documents at all: the summary is emptied
+        for coll in list(self.app.backend.data):
+            self.app.backend.data[coll] = []
+        self.assertEqual(self.app.refresh_summary(), 0)
+
+    def test_not_built(self):
+        """Documents are counted until the summary is built."""
+        self.assertEqual(self.app.colls_stats(0), self.live.colls_stats(0))
+
+    def test_totals(self):
+        """Counts added, lists merged."""
+        self.assertEqual(
+            totals(
+                [
+                    {"_id": 1, "n": 1, "v": ["a"], "last": None},
+                    {"_id": 2, "n": 2, "v": ["a", "b"], "last": "x"},
+                ]
+            ),
+            {"n": 3, "v": ["a", "b"], "last": "x"},
+        )
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+import threading
+import time
+import unittest
+
+# package
+from reporting.throttle import AdaptiveThrottle, server_pressure
+from tests.fixtures import memory_utils
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+BUSY = {"globalLock": {"currentQueue": {"total": 25}}}
+CALM = {
+    "globalLock": {"currentQueue": {"total": 0}},
+    "wiredTiger": {
+        "concurrentTransactions": {"read": {"available": 120, "totalTickets": 128}}
+    },
+}
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class FakeClock(object):
+    """Clock moved by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Adaptation(unittest.TestCase):
+    """Test additive increase, multiplicative decrease."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.throttle = AdaptiveThrottle(
+            target_latency=0.1, max_limit=8, clock=self.clock, sleep=lambda s: None
+        )
+
+    def test_latency(self):
+        """Slow queries reduce concurrency and pace batches, fast ones restore."""
+        self.assertEqual(self.throttle.limit, 4)
+        for i in range(10):
+            self.clock.now += 1
+            self.throttle.observe(1.0)
+        self.assertEqual(self.throttle.limit, 1)
+        self.assertGreater(self.throttle.delay, 0.1)
+        for i in range(100):
+            self.clock.now += 1
+            self.throttle.observe(0.01)
+        self.assertEqual(self.throttle.limit, 8)
+        self.assertEqual(self.throttle.delay, 0)
+
+    def test_decrease_once_by_latency(self):
+        """Slow queries completing together count as one signal."""
+        for i in range(4):
+            self.throttle.observe(1.0)
+        self.assertEqual(self.throttle.decreases, 1)
+        self.assertEqual(self.throttle.limit, 2)
+
+    def test_server(self):
+        """Server status is sampled at most once by interval."""
+        calls = []
+
+        def status():
+            calls.append(self.clock.now)
+            return BUSY
+
+        self.throttle.status = status
+        self.throttle.pace()
+        self.throttle.pace()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.throttle.limit, 2)
+        self.assertTrue(server_pressure(BUSY))
+        self.assertFalse(server_pressure(CALM))
+
+    def test_status_unavailable(self):
+        """Without monitoring rights, only latency is watched."""
+
+        def status():
+            raise PermissionError("not authorized")
+
+        self.throttle.status = status
+        self.throttle.check_server()
+        self.assertIsNone(self.throttle.status)
+
+
+class Slots(unittest.TestCase):
+    """Test concurrency limit."""
+
+    def test_limit(self):
+        """No more queries than the limit run at once."""
+        throttle = AdaptiveThrottle(target_latency=10, min_limit=2, max_limit=2)
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def query():
+            with throttle.slot():
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                time.sleep(0.01)
+                with lock:
+                    running[0] -= 1
+
+        threads = [threading.Thread(target=query) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(throttle.in_flight, 0)
+
+    def test_utils(self):
+        """Counts run in throttle slots."""
+        throttle = AdaptiveThrottle()
+        app = memory_utils(throttle=throttle)
+        app.colls_stats()
+        self.assertGreaterEqual(throttle.increases, 1)
+        self.assertIsNotNone(throttle.latency)
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,28 +6,13 @@
 # ##################################
 
 # Standard library
-from os import environ
 import unittest
 
-# 3rd party
-import pymongo
-
 # package
-from scanfme_db_utils import IsogeoScanUtils
-
-
-# #############################################################################
-# ######## Globals #################
-# ##################################
+from reporting.backends import MemoryBackend
+from reporting.report_global import IsogeoScanUtils
+from tests.fixtures import ACCESS, WG, memory_utils
 
-access = {
-    "username": environ.get("username"),
-    "password": environ.get("password"),
-    "server": environ.get("server"),
-    "port": environ.get("port"),
-    "db_name": environ.get("db_name"),
-    "replicaSet": environ.get("replicaSet"),
-}
 
 # #############################################################################
 # ######## Classes #################
@@ -35,15 +20,9 @@ access = {
 
 
 class DbStats(unittest.TestCase):
-    """Test authentication process."""
+    """Test attributes and parameters checks."""
 
-    app = IsogeoScanUtils(
-        access=access,
-        def_wg=environ.get("wg_test"),
-        platform="qa",
-        wk_v=environ.get("srv_version_ref"),
-    )
-    cli = app.connect()
+    app = memory_utils()
 
     # standard methods
     def setUp(self):
@@ -66,11 +45,24 @@ class DbStats(unittest.TestCase):
         self.assertTrue(hasattr(self.app, "db_name"))
         self.assertTrue(hasattr(self.app, "rep_set"))
         self.assertTrue(hasattr(self.app, "wk_vers"))
-        self.assertTrue(hasattr(self.app, "colls"))
-        self.assertIsInstance(self.app.db, pymongo.database.Database)
-        self.assertIsInstance(
-            self.app.colls.get("datasets"), pymongo.collection.Collection
-        )
+        self.assertIsInstance(self.app.backend, MemoryBackend)
+        self.assertEqual(self.app.conn_state, 1)
+
+    def test_parameters(self):
+        """Bad parameters are rejected."""
+        with self.assertRaises(ValueError):
+            IsogeoScanUtils(ACCESS, platform="dev")
+        with self.assertRaises(TypeError):
+            IsogeoScanUtils(ACCESS, def_wg="too_short")
+        with self.assertRaises(KeyError):
+            IsogeoScanUtils({"username": "me"})
+
+    def test_search(self):
+        """Datasets search on the default workgroup."""
+        self.assertEqual(self.app.ds_is_duplicated("roads"), 1)
+        self.assertEqual(self.app.ds_is_duplicated("lakes"), 0)
+        scanned = self.app.get_ds_workgroup(WG)
+        self.assertEqual(len(list(scanned.get("datasets"))), 2)
 
 
 # #############################################################################
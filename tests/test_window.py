@@ -0,0 +1,158 @@
+# -*- coding: UTF-8 -*-
+#! python3
+
+# #############################################################################
+# ########## Libraries #############
+# ##################################
+
+# Standard library
+from datetime import datetime, timedelta, timezone
+from os import path
+import tempfile
+import unittest
+from unittest import mock
+
+# 3rd party
+from bson import ObjectId
+
+# package
+from reporting.snapshot import OfflineScanUtils, export_snapshot
+from reporting.window import id_window, parse_bound, to_datetime
+from tests.fixtures import OTHER, WG, memory_utils
+
+
+# #############################################################################
+# ######## Globals #################
+# ##################################
+
+OLD = [ObjectId.from_datetime(datetime.utcnow() - timedelta(days=40)) for i in range(3)]
+NEW = [ObjectId() for i in range(3)]
+
+
+class Later(datetime):
+    """Clock a few minutes ahead."""
+
+    @classmethod
+    def utcnow(cls):
+        return datetime.utcnow() + timedelta(minutes=5)
+
+
+DOCS = {
+    "datasets": [
+        {"_id": OLD[0], "groupId": WG, "featureType": "roads"},
+        {"_id": NEW[0], "groupId": WG, "featureType": "rivers"},
+    ],
+    "requests": [
+        {"_id": OLD[1], "groupId": WG, "state": "broken", "err": "old"},
+        {"_id": NEW[1], "groupId": WG, "state": "broken", "err": "new"},
+    ],
+    "subscriptions": [
+        {"_id": OLD[2], "groupId": WG, "workers": [{"version": "2.1.0"}]},
+        {"_id": NEW[2], "groupId": OTHER, "workers": [{"version": "1"}]},
+        {"_id": "s1", "groupId": OTHER},
+    ],
+}
+
+
+# #############################################################################
+# ######## Classes #################
+# ##################################
+
+
+class Window(unittest.TestCase):
+    """Test time windows pushed down as _id ranges."""
+
+    def test_bounds(self):
+        """Dates and durations become _id bounds."""
+        self.assertEqual(parse_bound("24h"), timedelta(hours=24))
+        self.assertEqual(parse_bound("2w"), timedelta(weeks=2))
+        self.assertEqual(parse_bound("2019-06-01"), datetime(2019, 6, 1))
+        self.assertEqual(
+            parse_bound("2019-06-01T12:30:00"), datetime(2019, 6, 1, 12, 30)
+        )
+        self.assertIsNone(parse_bound(""))
+        self.assertEqual(id_window(), {})
+
+        paris = timezone(timedelta(hours=2))
+        self.assertEqual(
+            to_datetime(datetime(2019, 6, 1, 2, tzinfo=paris)), datetime(2019, 6, 1)
+        )
+        window = id_window(datetime(2019, 6, 1), datetime(2019, 7, 1))
+        self.assertEqual(window.get("_id").get("$gte").generation_time.month, 6)
+        with self.assertRaises(TypeError):
+            id_window(since="2019-06-01")
+
+    def test_diagnosis(self):
+        """Live and offline diagnosis only count the window."""
+        live = memory_utils(docs=DOCS)
+        with tempfile.TemporaryDirectory() as folder:
+            export_snapshot(live, folder)
+            offline = OfflineScanUtils(folder, def_wg=WG, wk_v="2.1.0")
+            offline.connect()
+            for app in (live, offline):
+                self.assertEqual(
+                    app.colls_stats(since=timedelta(days=1))["datasets"], 1
+                )
+                self.assertEqual(
+                    app.colls_stats(until=timedelta(days=1))["requests"], 1
+                )
+                self.assertEqual(
+                    app.ds_diagnosis(0, since=timedelta(days=1)), {"no_isogeo_id": 1}
+                )
+                report = app.rq_diagnosis(since=timedelta(days=1))
+                self.assertEqual(report.get("rq_broken"), 1)
+                self.assertEqual(report.get("rq_broken_last"), ("new",))
+                report = app.wk_diagnosis(0, since=timedelta(days=1))
+                ids = {
+                    key: [doc["_id"] for doc in docs] for key, docs in report.items()
+                }
+                self.assertEqual(ids.get("srvs_outdated"), [NEW[2]])
+                self.assertEqual(ids.get("srvs_uptodate"), [])
+                self.assertEqual(ids.get("srvs_no_created"), [])
+
+    def test_workers_export(self):
+        """Checkpointed workers report keeps the window."""
+        app = memory_utils(docs=DOCS)
+        with tempfile.TemporaryDirectory() as folder:
+            rows = app.workers_report(
+                "workers.csv", folder, checkpoint=1, until=timedelta(days=1)
+            )
+            self.assertEqual(rows, 1)
+            self.assertTrue(
+                path.exists(path.join(folder, "ScanFME_Report_Workers_qa_workers.csv"))
+            )
+
+    def test_workers_resume(self):
+        """Checkpointed workers report over a duration resumes its window."""
+        app = memory_utils(docs=DOCS)
+        find = app.backend.find
+
+        def lost(*args, **kwargs):
+            for doc in find(*args, **kwargs):
+                if doc.get("_id") == NEW[2]:
+                    raise ConnectionError("connection lost")
+                else:
+                    yield doc
+
+        with tempfile.TemporaryDirectory() as folder:
+            app.backend.find = lost
+            with self.assertRaises(ConnectionError):
+                app.workers_report("w.csv", folder, checkpoint=1, since=timedelta(60))
+            app.backend.find = find
+            # resumed later: durations are not resolved again
+            with mock.patch("reporting.window.datetime", Later), self.assertLogs(
+                "isogeo_scanfme_utils.checkpoint", "INFO"
+            ) as logs:
+                rows = app.workers_report(
+                    "w.csv", folder, checkpoint=1, since=timedelta(60)
+                )
+        self.assertEqual(rows, 2)
+        self.assertIn("resumed after 1 rows", logs.output[0])
+
+
+# #############################################################################
+# ######## Standalone ##############
+# ##################################
+
+if __name__ == "__main__":
+    unittest.main()